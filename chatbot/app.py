@@ -1,36 +1,20 @@
 import streamlit as st
 import requests
-import os
-import tempfile
-import mimetypes
 import uuid
-import random
-from PyPDF2 import PdfReader
-from docx import Document
-import pandas as pd
-import openai
-import json
-
-# Placeholder for the actual RAG functionality
-# The 'rag' module is assumed to have 'build_index_from_texts' and 'retrieve' functions.
-# Since you did not provide the 'rag' module, I will mock it for the code to run,
-# but you MUST replace this with your actual RAG library/implementation.
-class MockRAG:
-    """Mock RAG functionality for demonstration purposes."""
-    def build_index_from_texts(self, texts):
-        st.session_state._rag_index = True # Mocking index creation
-
-    def retrieve(self, query, top_k=3):
-        # Mocking retrieval by returning random snippets from the loaded content
-        if st.session_state.file_content:
-            chunks = st.session_state.file_content.split('\n')
-            # Filter non-empty chunks and select the top_k
-            non_empty_chunks = [c.strip() for c in chunks if c.strip()]
-            random_chunks = random.sample(non_empty_chunks, min(top_k, len(non_empty_chunks)))
-            return [{'chunk': c} for c in random_chunks]
-        return []
-
-rag = MockRAG()
+import time
+import extract_cache
+import ingest
+import pipeline
+import snapshot
+import telemetry
+from gemini_client import GeminiClient, GeminiError
+from scheduler import Scheduler
+from multilingual import detect_language
+from response_cache import ResponseCache
+from index_cache import IndexCache
+from html import escape
+from pipeline import Document, build_prompt, creator_reply
+from rag import estimate_tokens
 
 # --- 1. Page Configuration ---
 st.set_page_config(
@@ -43,10 +27,21 @@ st.set_page_config(
 # --- 2. Initialize Session State ---
 if 'uploaded_files' not in st.session_state:
     st.session_state.uploaded_files = []
-if 'file_content' not in st.session_state:
-    st.session_state.file_content = ""
+if 'doc_index' not in st.session_state:
+    # The uploaded documents: a RAGIndex holding each file's text once, with
+    # chunks as spans over it (shared through the index cache)
+    st.session_state.doc_index = None
+if 'file_tokens' not in st.session_state:
+    # Estimated model tokens of the whole uploaded document
+    st.session_state.file_tokens = 0
+if 'file_digest' not in st.session_state:
+    # SHA-256 over the extracted text, standing in for the whole document in cache keys
+    st.session_state.file_digest = ""
 if 'messages' not in st.session_state:
     st.session_state.messages = []
+if 'pending_input' not in st.session_state:
+    # Message queued by process_input; its reply is streamed by the main script
+    st.session_state.pending_input = None
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
 if 'user_input_key' not in st.session_state:
@@ -124,6 +119,17 @@ st.markdown('''
     .bot-message:hover {
         box-shadow: 0 0 25px rgba(0, 255, 0, 0.5);
     }
+
+    /* Cited passage in the Sources expander */
+    .source-passage {
+        white-space: pre-wrap;
+        font-size: 0.9em;
+        margin: 5px 0 15px;
+    }
+    .source-passage mark {
+        background: rgba(0, 255, 157, 0.3);
+        color: inherit;
+    }
     
     .chat-message div:first-child {
         font-weight: 700;
@@ -234,148 +240,180 @@ try:
 except KeyError:
     st.error("Configuration Error: GEMINI_API_KEY not found in environment secrets.")
 
-# --- File Processing Functions ---
-def process_pdf(file):
-    """Extracts text from a PDF file."""
-    pdf_reader = PdfReader(file)
-    text = ""
-    for page in pdf_reader.pages:
-        text += page.extract_text()
-    return text
-
-def process_docx(file):
-    """Extracts text from a DOCX file."""
-    doc = Document(file)
-    text = ""
-    for paragraph in doc.paragraphs:
-        text += paragraph.text + "\n"
-    return text
-
-def process_text(file):
-    """Reads content from a text or CSV file."""
-    return file.read().decode('utf-8')
-
-def process_file(file):
-    """Determines file type and calls the appropriate processing function."""
-    # Reset file pointer to the start
-    file.seek(0)
-    
-    # Get mime type from file extension
-    file_type = mimetypes.guess_type(file.name)[0]
-    
-    # Simple fallback check for common file types if mimetypes fails
-    if not file_type:
-        content_peek = file.read(1024)
-        file.seek(0)
-        if content_peek.startswith(b'%PDF-'):
-            file_type = 'application/pdf'
-        elif content_peek.startswith(b'PK\x03\x04'):
-            file_type = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-        else:
-            try:
-                content_peek.decode('utf-8')
-                file_type = 'text/plain'
-            except UnicodeDecodeError:
-                file_type = 'application/octet-stream'
-    
-    if file_type == 'application/pdf':
-        return process_pdf(file)
-    elif file_type == 'application/vnd.openxmlformats-officedocument.wordprocessingml.document':
-        return process_docx(file)
-    elif file_type in ['text/plain', 'text/csv']:
-        return process_text(file)
-    else:
-        raise ValueError(f"Unsupported file type: {file_type}")
+@st.cache_resource
+def get_gemini_client(api_key):
+    """One pooled client per process, shared by every session, behind the call scheduler
+    (rate and concurrency limits, retries, identical calls coalesced)."""
+    client = Scheduler(GeminiClient(api_key))
+    client.register_metrics()
+    return client
+
+@st.cache_resource
+def get_response_cache():
+    """Process-wide response cache (memory LRU over SQLite) shared by every session."""
+    return ResponseCache()
+
+@st.cache_resource
+def get_index_cache():
+    """Process-wide RAG indexes by document hash, shared by every session."""
+    return IndexCache()
+
+@st.cache_resource
+def get_extract_cache():
+    """Process-wide extracted-text cache by file hash (on disk, so shared with other workers); None if
+    disabled."""
+    return extract_cache.shared()
+
+@st.cache_resource
+def get_snapshot():
+    """The index baked into the image (see snapshot.py), loaded once per process; None if there is none."""
+    return snapshot.load()
+
+# Sessions without uploads of their own answer from the built-in snapshot
+if st.session_state.doc_index is None and not st.session_state.uploaded_files:
+    built_in = get_snapshot()
+    if built_in is not None:
+        st.session_state.doc_index = built_in.index
+        st.session_state.file_digest = built_in.digest
+        st.session_state.file_tokens = built_in.tokens
+
+
+@st.cache_resource
+def start_metrics_server():
+    """Prometheus /metrics endpoint on NEXUS_METRICS_PORT, started once per process."""
+    return telemetry.start_metrics_server()
+
+start_metrics_server()
 
 # --- Sidebar for File Uploads and RAG Controls ---
 with st.sidebar:
     st.header("File Upload")
     
-    # RAG controls
-    rag_enabled = st.checkbox('Enable RAG (Use uploaded files to augment answers)', value=False, key="rag_toggle")
-    rag_top_k = st.number_input('RAG: top K passages', min_value=1, max_value=10, value=3, key="rag_k_value")
+    # RAG controls, read back through st.session_state by their keys
+    st.checkbox('Enable RAG (Use uploaded files to augment answers)', value=False, key="rag_toggle")
+    st.number_input('RAG: top K passages', min_value=1, max_value=10, value=3, key="rag_k_value")
+    # Passages are packed into this many (estimated) tokens; a document
+    # larger than the budget is answered from retrieved passages even with
+    # RAG off
+    st.number_input('Context budget (tokens)', min_value=256, max_value=1_000_000,
+                    value=pipeline.CONTEXT_TOKENS, step=256, key="context_budget")
+    st.checkbox('Diversify passages (MMR)', value=False, key="use_mmr")
     
     st.markdown("---")
     
-    uploaded_file = st.file_uploader(
-        "Upload a file for RAG", 
+    extract_workers = st.number_input('Extraction workers', min_value=1, max_value=64, value=ingest.EXTRACT_WORKERS, key="extract_workers")
+    
+    uploaded = st.file_uploader(
+        "Upload files for RAG", 
         type=['pdf', 'docx', 'txt', 'csv'], 
+        accept_multiple_files=True,
         key="file_uploader_widget",
-        help="Upload a document (PDF, DOCX, TXT, or CSV) to provide context for the AI's answers."
+        help="Upload documents (PDF, DOCX, TXT, or CSV) to provide context for the AI's answers."
     )
     
-    # Process the file if a new one is uploaded
-    if uploaded_file and uploaded_file.name not in st.session_state.uploaded_files:
+    # Process the batch if the set of uploaded files changed
+    uploaded_names = [f.name for f in uploaded or []]
+    if uploaded and uploaded_names != st.session_state.uploaded_files:
         try:
-            with st.spinner(f"Processing {uploaded_file.name}..."):
+            with st.spinner(f"Processing {len(uploaded)} file(s)..."):
                 # Clear existing content before processing new file(s)
-                st.session_state.file_content = ""
-                st.session_state.uploaded_files = [uploaded_file.name] # Only allow one file for simplicity
+                st.session_state.doc_index = None
+                st.session_state.uploaded_files = uploaded_names
                 
-                content = process_file(uploaded_file)
-                st.session_state.file_content += content
+                progress = st.progress(0.0, text="Extracting...")
+                def report_progress(done, total):
+                    progress.progress(done / total if total else 1.0, text=f"Extracted {done:,} of {total:,} parts")
                 
-                # Build RAG index only once a file is processed
-                if rag_enabled and st.session_state.file_content:
-                    rag.build_index_from_texts([st.session_state.file_content])
+                files = [(f.name, f.getvalue()) for f in uploaded]
+                # Files uploaded before, by any session, are not parsed again,
+                # and sessions uploading the same text share one index
+                document = pipeline.build_document(files, max_workers=extract_workers, on_progress=report_progress,
+                                                   cache=get_extract_cache(), indexes=get_index_cache())
+                st.session_state.file_digest = document.digest
+                index = document.index
+                st.session_state.doc_index = index
+                characters = sum(len(text) for text in index.texts.values())
+                st.session_state.file_tokens = document.tokens
+                progress.empty()
                 
-                st.success(f"Successfully processed **{uploaded_file.name}**")
-                st.info(f"Loaded content size: {len(st.session_state.file_content):,} characters.")
+                st.success(f"Successfully processed **{', '.join(uploaded_names)}**")
+                st.info(f"Loaded content size: {characters:,} characters.")
         except Exception as e:
-            st.error(f"Error processing file: {str(e)}")
-            st.session_state.uploaded_files = [] # Clear the file from the list if processing failed
+            st.error(f"Error processing files: {str(e)}")
+            st.session_state.uploaded_files = [] # Clear the files from the list if processing failed
 
-    # Display list of uploaded files (currently only one supported)
+    # Display list of uploaded files
     if st.session_state.uploaded_files:
         st.markdown(f"**Files Loaded:** {', '.join(st.session_state.uploaded_files)}")
+    elif st.session_state.doc_index is not None:
+        st.markdown(f"**Built-in documents:** {len(st.session_state.doc_index.texts):,}")
+    
+    cache_stats = get_response_cache().stats()
+    cache_hits = cache_stats['memory_hits'] + cache_stats['disk_hits']
+    st.caption(f"Response cache: {cache_stats['hit_rate']:.0%} hit rate "
+               f"({cache_hits:,} of {cache_hits + cache_stats['misses']:,}), "
+               f"{cache_stats['saved_seconds']:.1f}s of model time saved")
+    index_stats = get_index_cache().stats()
+    st.caption(f"Index cache: {index_stats['entries']} upload(s), ~{index_stats['bytes'] / 2**20:.1f} MB, "
+               f"{index_stats['hits']:,} reuses, {index_stats['builds']:,} builds")
+    if get_extract_cache() is not None:
+        extract_stats = get_extract_cache().stats()
+        st.caption(f"Extraction cache: {extract_stats['hit_rate']:.0%} hit rate "
+                   f"({extract_stats['hits']:,} of {extract_stats['hits'] + extract_stats['misses']:,}), "
+                   f"~{extract_stats['bytes'] / 2**20:.1f} MB, {extract_stats['saved_seconds']:.1f}s of parsing saved")
+    if st.session_state.doc_index is not None:
+        # Repeated questions (reruns, or the same words reordered) skip scoring
+        query_stats = st.session_state.doc_index.cache_stats()
+        st.caption(f"Retrieval cache: {query_stats['hit_rate']:.0%} hit rate "
+                   f"({query_stats['hits']:,} of {query_stats['hits'] + query_stats['misses']:,})")
     
 # --- Multilingual Helper Functions ---
-def detect_language(text):
-    """Detect the language of the input text (simplified for Hindi/English)."""
-    # Simple check for Devanagari script (used in Hindi)
-    if any('\u0900' <= char <= '\u097F' for char in text):
-        return 'hindi'
-    return 'english'
-
 def translate_to_english(text, source_lang):
-    """Translate text to English if it's not already in English."""
-    if source_lang == 'hindi' and GEMINI_API_KEY:
+    """Translate text to English if it's not already in English (memoized in the response cache)."""
+    if source_lang != 'english' and GEMINI_API_KEY:
         try:
-            prompt = f"Translate the following Hindi text to English. Respond with ONLY the English translation and no other text: {text}"
-            response = requests.post(
-                f'https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={GEMINI_API_KEY}',
-                headers={'Content-Type': 'application/json'},
-                json={'contents': [{'parts': [{'text': prompt}]}]},
-                timeout=30
-            )
-            if response.status_code == 200:
-                # Assuming the model returns the text correctly
-                return response.json()['candidates'][0]['content']['parts'][0]['text'].strip()
+            return pipeline.translate_to_english(get_gemini_client(GEMINI_API_KEY), get_response_cache(), text, source_lang)
         except Exception as e:
             st.warning(f"Translation (to English) failed: {e}. Using original text.")
     return text
 
-def translate_response(text, target_lang):
-    """Translate English text to the target language if not English."""
-    if target_lang != 'english' and GEMINI_API_KEY:
-        try:
-            prompt = f"Translate the following English response to {target_lang} (keep it natural and conversational). Respond with ONLY the translated text and no other text: {text}"
-            response = requests.post(
-                f'https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={GEMINI_API_KEY}',
-                headers={'Content-Type': 'application/json'},
-                json={'contents': [{'parts': [{'text': prompt}]}]},
-                timeout=30
-            )
-            if response.status_code == 200:
-                # Assuming the model returns the text correctly
-                return response.json()['candidates'][0]['content']['parts'][0]['text'].strip()
-        except Exception as e:
-            st.warning(f"Translation (to {target_lang}) failed: {e}. Using English response.")
-    return text
-
 # --- Core Logic for Processing Input and Generating Response ---
+def render_message(role, content):
+    """HTML for one chat bubble."""
+    role_class = 'user-message' if role == 'user' else 'bot-message'
+    return f"""
+    <div style="display: flex; {'justify-content: flex-end;' if role == 'user' else 'justify-content: flex-start;'}">
+        <div class="chat-message {role_class}">
+            <div><strong>{'You' if role == 'user' else 'TheScytheNexus AI'}:</strong></div>
+            <div>{content}</div>
+        </div>
+    </div>
+    """
+
+# Characters of surrounding document text shown around a cited passage
+SOURCE_CONTEXT = 300
+
+def render_sources(message):
+    """Expander citing the passages an answer used, each highlighted in its document."""
+    index = st.session_state.doc_index
+    current = index is not None and message.get('digest') == st.session_state.file_digest
+    with st.expander(f"Sources ({len(message['sources'])})"):
+        for n, (doc, start, end) in enumerate(message['sources'], 1):
+            label = f"**[{n}] {escape(str(doc))}**, characters {start:,}–{end:,}"
+            text = index.texts.get(doc) if current else None
+            if text is None:
+                # the document has since been replaced by another upload
+                st.markdown(label)
+                continue
+            lead = "…" if start > SOURCE_CONTEXT else ""
+            tail = "…" if end + SOURCE_CONTEXT < len(text) else ""
+            st.markdown(
+                f"{label}<div class='source-passage'>{lead}{escape(text[max(0, start - SOURCE_CONTEXT):start])}"
+                f"<mark>{escape(text[start:end])}</mark>{escape(text[end:end + SOURCE_CONTEXT])}{tail}</div>",
+                unsafe_allow_html=True)
+
 def process_input():
-    """Handles user input, calls the Gemini API (with RAG and translation), and updates chat."""
+    """Handles user input: adds it to the chat and queues it for a reply."""
     global GEMINI_API_KEY # Use the global variable
     
     if not GEMINI_API_KEY:
@@ -390,75 +428,71 @@ def process_input():
     # Clear the input field immediately after processing
     st.session_state[st.session_state.user_input_key] = ""
     
-    # Detect input language
-    input_lang = detect_language(user_input)
-    
     # Add user message to display list
     st.session_state.messages.append({"role": "user", "content": user_input})
+    st.session_state.pending_input = user_input
+
+def generate_response(user_input, placeholder):
+    """Calls the Gemini API (with RAG and translation), streaming the reply into placeholder."""
+    # Detect input language
+    input_lang = detect_language(user_input)
     
     try:
         # 1. Handle special creator query
-        if any(phrase in user_input.lower() for phrase in ["who made you", "who created you", "your creator", "who is thescythenexus"]):
-            ai_response = "TheScytheNexus made me!"
-            if input_lang == 'hindi':
-                ai_response = "मुझे TheScytheNexus ने बनाया है! (Mujhe TheScytheNexus ne banaya hai!)"
+        ai_response = creator_reply(user_input, input_lang)
+        if ai_response is not None:
+            placeholder.markdown(render_message("assistant", ai_response), unsafe_allow_html=True)
             st.session_state.messages.append({"role": "assistant", "content": ai_response})
         else:
-            # 2. General AI Response Logic (with RAG/Translation)
+            # 2. General AI Response Logic (with RAG, answered in the user's language)
             with st.spinner("TheScytheNexus AI IS THINKING..."):
-                final_prompt = user_input
+                document = None
+                if st.session_state.doc_index is not None:
+                    document = Document(st.session_state.doc_index, st.session_state.file_digest, st.session_state.file_tokens)
+                prompt = build_prompt(user_input, document, rag=st.session_state.rag_toggle,
+                                      top_k=st.session_state.rag_k_value, budget=st.session_state.context_budget,
+                                      mmr=st.session_state.use_mmr, translate=translate_to_english, lang=input_lang)
+                for level, notice in prompt.notices:
+                    getattr(st, level)(notice)
+                final_prompt, sources = prompt.text, prompt.sources
                 
-                # --- RAG Integration ---
-                if st.session_state.file_content and st.session_state.rag_toggle:
-                    try:
-                        # RAG is enabled and content is loaded
-                        retrieved = rag.retrieve(user_input, top_k=st.session_state.rag_k_value)
-                        
-                        if retrieved:
-                            # Prepend retrieved passages to the prompt for grounding
-                            ctx = 'You are an expert AI. Use the following context to answer the user\'s question. If the question cannot be answered from the context, state that explicitly.\n'
-                            ctx += '\n--- Retrieved passages (RAG) ---\n'
-                            for r in retrieved:
-                                ctx += r['chunk'] + '\n\n'
-                            
-                            final_prompt = f"{ctx}\n\nUser Question: {user_input}"
-                        else:
-                            st.info("RAG enabled, but no relevant passages were retrieved. Using general knowledge/full document content.")
-                    except Exception:
-                        st.warning("RAG retrieval failed. Proceeding with general model call.")
-                
-                # If RAG is disabled but a file is uploaded, include ALL content (simple context)
-                elif st.session_state.file_content:
-                    final_prompt = f"The following is a document:\n{st.session_state.file_content}\n\nYour task is to answer the user's question based on this document. User Question: {user_input}"
-
-                # --- Translation (Input) ---
-                prompt_for_model = translate_to_english(final_prompt, input_lang)
+                # --- Response cache: same question, context and language ---
+                cache = get_response_cache()
+                cache_key = prompt.cache_key()
+                ai_response = cache.get(cache_key)
                 
-                # --- API Call ---
-                response = requests.post(
-                    f'https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={GEMINI_API_KEY}',
-                    headers={'Content-Type': 'application/json'},
-                    json={'contents': [{'parts': [{'text': prompt_for_model}]}]},
-                    timeout=30
-                )
-                
-                if response.status_code == 200:
-                    ai_response_english = response.json()['candidates'][0]['content']['parts'][0]['text']
-                    
-                    # --- Translation (Output) ---
-                    ai_response = translate_response(ai_response_english, input_lang)
+            # --- API Call (streamed) ---
+            try:
+                if ai_response is None:
+                    start = time.perf_counter()
+                    st.sidebar.caption(f"Last prompt: {len(final_prompt.encode('utf-8')):,} bytes (~{estimate_tokens(final_prompt):,} tokens)")
+                    pieces = get_gemini_client(GEMINI_API_KEY).stream_generate(final_prompt)
                     
-                    st.session_state.messages.append({"role": "assistant", "content": ai_response})
-                else:
-                    st.error(f"Failed to get response from Gemini: {response.status_code}. Response: {response.text}")
+                    # Rendering is interleaved with the stream; time spent
+                    # waiting for pieces is the model's
+                    ai_response = ""
+                    for piece in telemetry.timed("model", pieces):
+                        ai_response += piece
+                        with telemetry.span("render"):
+                            placeholder.markdown(render_message("assistant", ai_response + "▌"), unsafe_allow_html=True)
+                    ai_response = ai_response.strip()
+                    cache.put(cache_key, ai_response, time.perf_counter() - start)
+                with telemetry.span("render"):
+                    placeholder.markdown(render_message("assistant", ai_response), unsafe_allow_html=True)
+                
+                message = {"role": "assistant", "content": ai_response}
+                if sources:
+                    message.update(sources=sources, digest=st.session_state.file_digest)
+                    render_sources(message)
+                st.session_state.messages.append(message)
+            except GeminiError as e:
+                placeholder.empty()
+                st.error(f"Failed to get response from Gemini: {e.status_code}. Response: {e.text}")
 
     except requests.exceptions.ConnectionError:
         st.error("Cannot connect to Gemini API. Please check your internet connection.")
     except Exception as e:
         st.error(f"An unexpected error occurred: {str(e)}")
-        
-    # Re-run the script to update the chat display after appending new messages
-    st.rerun()
 
 # --- 4. Main Chat Interface Display ---
 # Use a custom container for the chat area to control height and scrolling
@@ -466,18 +500,19 @@ st.markdown('<div class="chat-container">', unsafe_allow_html=True)
 
 # Display messages
 for message in st.session_state.messages:
-    # Use st.columns to simulate the alignment or rely on CSS classes
-    role_class = 'user-message' if message['role'] == 'user' else 'bot-message'
-    
     # Use HTML/CSS to render the message with custom styling
-    st.markdown(f"""
-    <div style="display: flex; {'justify-content: flex-end;' if message['role'] == 'user' else 'justify-content: flex-start;'}">
-        <div class="chat-message {role_class}">
-            <div><strong>{'You' if message['role'] == 'user' else 'TheScytheNexus AI'}:</strong></div>
-            <div>{message['content']}</div>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(render_message(message['role'], message['content']), unsafe_allow_html=True)
+    if message.get('sources'):
+        render_sources(message)
+
+# Stream the reply to a queued message into a bubble below the history
+if st.session_state.pending_input:
+    pending_input = st.session_state.pending_input
+    st.session_state.pending_input = None
+    with telemetry.turn() as turn:
+        generate_response(pending_input, st.empty())
+    stages = " · ".join(f"{stage} {1000 * seconds:,.0f} ms" for stage, seconds in turn.totals().items())
+    st.sidebar.caption(f"Last turn: {1000 * turn.seconds:,.0f} ms ({stages})" if stages else f"Last turn: {1000 * turn.seconds:,.0f} ms")
 
 st.markdown('</div>', unsafe_allow_html=True) # Close chat-container
 
@@ -507,6 +542,8 @@ with input_cols[1]:
         # Explicitly check and run process_input if the button is pressed
         # This handles the case where the user uses the mouse to click Send
         process_input()
+        if st.session_state.pending_input:
+            st.rerun()
 
 st.markdown('</div>', unsafe_allow_html=True) # Close input-area
 
@@ -515,6 +552,6 @@ st.markdown('</div>', unsafe_allow_html=True) # Close input-area
 st.markdown('<div class="clear-button">', unsafe_allow_html=True)
 if st.button("Clear Chat", key="clear"):
     st.session_state.messages = []
-    # Preserve RAG content and file content on clear
+    # Preserve RAG content and file chunks on clear
     st.rerun()
 st.markdown('</div>', unsafe_allow_html=True)
\ No newline at end of file
@@ -0,0 +1,152 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pipeline
+import telemetry
+from gemini_client import GeminiClient, GeminiError
+from response_cache import ResponseCache
+from scheduler import Scheduler
+
+# Headless batch question answering for nightly evaluation and throughput
+# tests: questions are read from JSONL, answered concurrently against one
+# shared document index by a bounded pool of workers, and each answer is
+# written to the output JSONL (with its timings) as soon as it is done.
+#
+#   GEMINI_API_KEY=... python -m batch questions.jsonl --docs manual.pdf faq.txt \
+#       --out answers.jsonl --workers 16
+#
+# Each input line is an object with the question under "question" ("prompt"
+# and "body" are read too) and an optional "id" (or "request_id"; the line
+# number otherwise). Output lines carry the id, the answer, the sources
+# cited as (doc, start, end), per-stage milliseconds and any error, in
+# completion order. Model calls go through the same Scheduler as the app,
+# so --workers above NEXUS_GEMINI_CONCURRENCY just queue.
+
+DEFAULT_WORKERS = int(os.environ.get("NEXUS_BATCH_WORKERS", 8))
+
+def read_questions(lines):
+    """(id, question) for each non-blank JSONL line."""
+    for n, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        question = record.get("question") or record.get("prompt") or record.get("body")
+        if not question:
+            raise ValueError(f"line {n}: no question")
+        yield record.get("id", record.get("request_id", n)), question
+
+def answer_one(qid, question, client, cache, document, options):
+    """Output record for one question; errors are recorded, not raised."""
+    record = {"id": qid, "question": question}
+    with telemetry.turn() as turn:
+        try:
+            result = pipeline.answer(question, client, cache, document, **options)
+        except GeminiError as e:
+            record["error"] = f"{e.status_code}: {e.text[:200]}"
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+        else:
+            record.update(result)
+            record["sources"] = [list(source) for source in result["sources"]]
+            record["notices"] = [message for _, message in result["notices"]]
+    record["total_ms"] = 1000 * turn.seconds
+    record["stages_ms"] = {stage: 1000 * seconds for stage, seconds in turn.totals().items()}
+    return record
+
+def run(questions, out, client, cache=None, document=None, workers=DEFAULT_WORKERS, **options):
+    """Answers (id, question) pairs with up to workers in flight, writing each record to out as it
+    completes; returns a summary dict."""
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as pool:
+        pending = set()
+        def drain(return_when):
+            nonlocal pending, errors
+            done, pending = wait(pending, return_when=return_when)
+            for future in done:
+                record = future.result()
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                if "error" in record:
+                    errors += 1
+                else:
+                    latencies.append(record["total_ms"])
+        # only a couple of questions per worker are read ahead, so huge
+        # input files stream through
+        for qid, question in questions:
+            if len(pending) >= 2 * workers:
+                drain(FIRST_COMPLETED)
+            pending.add(pool.submit(answer_one, qid, question, client, cache, document, options))
+        while pending:
+            drain(FIRST_COMPLETED)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    answered = len(latencies)
+    return {
+        "answered": answered,
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "questions_per_s": (answered + errors) / elapsed if elapsed else 0.0,
+        "p50_ms": latencies[answered // 2] if latencies else 0.0,
+        "p99_ms": latencies[min(answered - 1, int(answered * 0.99))] if latencies else 0.0,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m batch", description="Answer a JSONL file of questions headlessly.")
+    parser.add_argument("questions", help="input JSONL, or - for stdin")
+    parser.add_argument("--out", default="-", help="output JSONL (default stdout)")
+    docs = parser.add_mutually_exclusive_group()
+    docs.add_argument("--docs", nargs="+", default=[], help="files to index (PDF, DOCX, TXT, CSV)")
+    docs.add_argument("--index", help="a saved RAG index file to answer from")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="questions answered at once")
+    parser.add_argument("--rag", action="store_true", help="always answer from retrieved passages")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--budget", type=int, default=pipeline.CONTEXT_TOKENS, help="context budget, tokens")
+    parser.add_argument("--mmr", action="store_true", help="diversify passages")
+    parser.add_argument("--retrieval", default=pipeline.RETRIEVAL, choices=["lexical", "dense", "hybrid"])
+    parser.add_argument("--no-cache", action="store_true", help="skip the response cache, so every question calls the model")
+    args = parser.parse_args(argv)
+
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if not api_key:
+        parser.error("set GEMINI_API_KEY")
+
+    document = None
+    if args.docs:
+        files = []
+        for path in args.docs:
+            with open(path, "rb") as f:
+                files.append((os.path.basename(path), f.read()))
+        document = pipeline.build_document(files, retrieval=args.retrieval)
+    elif args.index:
+        document = pipeline.load_document(args.index, retrieval=args.retrieval)
+    if document is not None:
+        # build the lazy parts of the index (e.g. the dense vectors) before
+        # the workers start
+        document.index.query("warm up", top_k=1)
+
+    client = Scheduler(GeminiClient(api_key, pool_size=max(16, args.workers)))
+    cache = None if args.no_cache else ResponseCache()
+    options = {"rag": args.rag, "top_k": args.top_k, "budget": args.budget, "mmr": args.mmr}
+    source = sys.stdin if args.questions == "-" else open(args.questions, encoding="utf-8")
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+    try:
+        summary = run(read_questions(source), out, client, cache, document, args.workers, **options)
+        summary.update(client.stats())
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+        client.close()
+    print(json.dumps(summary), file=sys.stderr)
+    return 1 if summary["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,316 @@
+import argparse
+import importlib.util
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Reproducible benchmark for rag.py: chunking, index build, query latency,
+# save/load and recall against the brute-force scorer, on synthetic corpora
+# of 1k to 1M chunks.
+#
+#   python bench_rag.py run --sizes 1000,10000,100000
+#   python bench_rag.py compare HEAD~3 HEAD --sizes 10000
+#
+# Each size runs in its own interpreter so peak RSS belongs to that size
+# alone. compare runs the same corpora against rag.py as of two git
+# revisions ("." is the working tree) and exits 1 if any metric regressed
+# by more than --threshold. Ground truth for recall always comes from the
+# working tree's RAGIndex._query_exhaustive, so revisions are measured
+# against the same reference; with --retrieval dense or hybrid that scans
+# every vector instead of probing the IVF lists, and fuses at the same
+# depth as the query being measured.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REFERENCE = os.path.join(HERE, "rag.py")
+
+# metric -> True if a larger value is better
+METRICS = {
+    "chunk_mb_per_s": True,
+    "build_s": False,
+    "query_p50_ms": False,
+    "query_p99_ms": False,
+    "qps": True,
+    "save_s": False,
+    "load_s": False,
+    "index_bytes": False,
+    "peak_rss_mb": False,
+    "recall_at_k": True,
+}
+
+# --- synthetic corpus ---
+_SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "te", "vo", "zi", "pa",
+              "do", "fe", "gu", "hi", "ja", "be", "co", "da", "wu", "yo"]
+
+def make_vocab(size, seed=0):
+    # distinct pronounceable words of 2-4 syllables
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+def make_corpus(n_chunks, seed=0, vocab_size=50000, min_words=40, max_words=100, topics=0):
+    # Zipf-distributed words so postings lengths look like natural text;
+    # each text is short enough to be exactly one chunk. With topics, half
+    # of each chunk's words come from one of that many topics, each with
+    # its own word frequencies, so chunks cluster the way real ones do.
+    rng = random.Random(seed)
+    vocab = make_vocab(vocab_size, seed)
+    rng.shuffle(vocab)
+    cum, total = [], 0.0
+    for rank in range(1, vocab_size + 1):
+        total += 1.0 / rank
+        cum.append(total)
+    topic_vocabs = [rng.sample(vocab, 2000) for _ in range(topics)]
+    topic_cum = cum[:2000]
+    texts = []
+    for _ in range(n_chunks):
+        k = rng.randint(min_words, max_words)
+        if topics:
+            words = rng.choices(vocab, cum_weights=cum, k=k - k // 2)
+            words += rng.choices(rng.choice(topic_vocabs), cum_weights=topic_cum, k=k // 2)
+            rng.shuffle(words)
+        else:
+            words = rng.choices(vocab, cum_weights=cum, k=k)
+        text = " ".join(words)
+        texts.append(text[:text.rfind(" ", 0, 780)] if len(text) > 780 else text)
+    return texts, vocab
+
+def make_queries(vocab, n, seed=1):
+    # 1-4 words from the middle of the frequency range: common enough to
+    # match, rare enough to discriminate
+    rng = random.Random(seed)
+    pool = vocab[50:5000]
+    return [" ".join(rng.sample(pool, rng.randint(1, 4))) for _ in range(n)]
+
+# --- measurement ---
+def _load_module(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def _peak_rss_mb():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(p / 100 * len(sorted_values)))]
+
+def _new_index(module, ranking, retrieval="lexical"):
+    # only pass options the revision under test may not know when set
+    kwargs = {}
+    if ranking != "tfidf":
+        kwargs["ranking"] = ranking
+    if retrieval != "lexical":
+        kwargs["retrieval"] = retrieval
+    index = module.RAGIndex(**kwargs)
+    # measure scoring, not the query-result cache
+    index.cache_size = 0
+    return index
+
+def _recall(index, reference, queries, top_k):
+    # a hit is any returned chunk scoring at least the reference's k-th best,
+    # so ties at the cut-off do not count as misses. Dense and hybrid truth
+    # is asked for top_k like the query, since fused scores depend on how
+    # deep each side is fused (max(top_k, FUSE_DEPTH))
+    hits = total = 0
+    depth = len(reference.chunks) if reference.retrieval == "lexical" else top_k
+    for q in queries:
+        truth = reference._query_exhaustive(q, top_k=depth)
+        if not truth:
+            continue
+        k = min(top_k, len(truth))
+        cutoff = truth[k - 1]["score"] - 1e-12
+        relevant = set(r["chunk"] for r in truth if r["score"] >= cutoff)
+        got = index.query(q, top_k=k)
+        hits += min(k, sum(1 for r in got if r["chunk"] in relevant))
+        total += k
+    return hits / total if total else 1.0
+
+def bench_one(rag_path, size, queries=200, recall_queries=20, top_k=5, ranking="tfidf", seed=0,
+              retrieval="lexical", topics=0):
+    """Runs every measurement for one corpus size in this process."""
+    module = _load_module(rag_path, "rag_under_test")
+    texts, vocab = make_corpus(size, seed, topics=topics)
+    qs = make_queries(vocab, queries, seed + 1)
+    result = {"size": size, "ranking": ranking, "retrieval": retrieval, "topics": topics, "top_k": top_k}
+
+    sample = "\n\n".join(texts[:20000])
+    start = time.perf_counter()
+    module.chunk_text(sample)
+    result["chunk_mb_per_s"] = len(sample) / 2**20 / (time.perf_counter() - start)
+    del sample
+
+    index = _new_index(module, ranking, retrieval)
+    start = time.perf_counter()
+    index.build_from_texts(texts)
+    if retrieval != "lexical":
+        index._dense_index()
+    result["build_s"] = time.perf_counter() - start
+    del texts
+
+    index.query(qs[0], top_k=top_k)  # warm-up
+    latencies = []
+    start = time.perf_counter()
+    for q in qs:
+        t = time.perf_counter()
+        index.query(q, top_k=top_k)
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    result["query_p50_ms"] = 1000 * _percentile(latencies, 50)
+    result["query_p99_ms"] = 1000 * _percentile(latencies, 99)
+    result["qps"] = len(qs) / elapsed
+
+    tmp = tempfile.mkdtemp(prefix="bench_rag_")
+    try:
+        path = os.path.join(tmp, "index")
+        start = time.perf_counter()
+        index.save(path)
+        result["save_s"] = time.perf_counter() - start
+        result["index_bytes"] = os.path.getsize(path)
+        loaded = _new_index(module, ranking, retrieval)
+        start = time.perf_counter()
+        loaded.load(path)
+        loaded.query(qs[0], top_k=top_k)
+        result["load_s"] = time.perf_counter() - start
+        del loaded
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    # taken before a reference index is built for recall
+    result["peak_rss_mb"] = _peak_rss_mb()
+
+    if os.path.abspath(rag_path) == REFERENCE and hasattr(index, "_query_exhaustive"):
+        reference = index
+    else:
+        reference = _new_index(_load_module(REFERENCE, "rag_reference"), ranking, retrieval)
+        reference.add_chunks(list(index.chunks))
+    result["recall_at_k"] = _recall(index, reference, qs[:recall_queries], top_k)
+    return result
+
+def run_sizes(rag_path, sizes, args):
+    """Benchmarks each size in a fresh interpreter and returns the results."""
+    results = []
+    for size in sizes:
+        cmd = [sys.executable, os.path.abspath(__file__), "_one", "--rag", rag_path, "--size", str(size),
+               "--queries", str(args.queries), "--recall-queries", str(args.recall_queries),
+               "--top-k", str(args.top_k), "--ranking", args.ranking, "--retrieval", args.retrieval,
+               "--topics", str(args.topics), "--seed", str(args.seed)]
+        out = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, text=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+        print(format_row(results[-1]), file=sys.stderr)
+    return results
+
+def format_row(r):
+    return (f"{r['size']:>9,} chunks  build {r['build_s']:8.2f}s  p50 {r['query_p50_ms']:8.2f}ms  "
+            f"p99 {r['query_p99_ms']:8.2f}ms  {r['qps']:9.1f} qps  chunk {r['chunk_mb_per_s']:6.1f}MB/s  "
+            f"save {r['save_s']:6.2f}s  load {r['load_s']:6.2f}s  {r['index_bytes'] / 2**20:8.1f}MB on disk  "
+            f"rss {r['peak_rss_mb']:8.1f}MB  recall@{r['top_k']} {r['recall_at_k']:.3f}")
+
+def regressions(base, head, threshold):
+    """(size, metric, base, head) for every metric that got worse by more than threshold."""
+    found = []
+    by_size = {r["size"]: r for r in base}
+    for r in head:
+        b = by_size.get(r["size"])
+        if b is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = b[metric], r[metric]
+            if metric == "recall_at_k":
+                # recall is deterministic; any drop is a regression
+                worse = new < old - 1e-9
+            elif higher_is_better:
+                worse = new < old * (1 - threshold)
+            else:
+                worse = new > old * (1 + threshold)
+            if worse:
+                found.append((r["size"], metric, old, new))
+    return found
+
+def _export_rag(rev, dest):
+    # rag.py as of rev, written to dest; "." is the working tree
+    if rev == ".":
+        return REFERENCE
+    prefix = subprocess.run(["git", "rev-parse", "--show-prefix"], cwd=HERE, check=True,
+                            stdout=subprocess.PIPE, text=True).stdout.strip()
+    source = subprocess.run(["git", "show", f"{rev}:{prefix}rag.py"], cwd=HERE, check=True,
+                            stdout=subprocess.PIPE).stdout
+    path = os.path.join(dest, "rag.py")
+    with open(path, "wb") as f:
+        f.write(source)
+    return path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark rag.py on synthetic corpora.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--sizes", default="1000,10000,100000",
+                        help="comma-separated corpus sizes in chunks (up to 1000000)")
+    common.add_argument("--queries", type=int, default=200)
+    common.add_argument("--recall-queries", type=int, default=20,
+                        help="queries checked against the brute-force scorer")
+    common.add_argument("--top-k", type=int, default=5)
+    common.add_argument("--ranking", default="tfidf", choices=["tfidf", "bm25"])
+    common.add_argument("--retrieval", default="lexical", choices=["lexical", "dense", "hybrid"],
+                        help="dense and hybrid recall is measured against an exact vector scan")
+    common.add_argument("--topics", type=int, default=0,
+                        help="give the corpus this many topics to cluster around (0: none)")
+    common.add_argument("--seed", type=int, default=0)
+    run = sub.add_parser("run", parents=[common], help="benchmark the working tree")
+    run.add_argument("--rag", default=REFERENCE, help="path of the rag.py to benchmark")
+    run.add_argument("--out", help="write results as JSON here")
+    compare = sub.add_parser("compare", parents=[common], help="benchmark two git revisions")
+    compare.add_argument("base")
+    compare.add_argument("head", nargs="?", default=".")
+    compare.add_argument("--threshold", type=float, default=0.10,
+                         help="relative change treated as a regression")
+    compare.add_argument("--out", help="write both result sets as JSON here")
+    one = sub.add_parser("_one", parents=[common])
+    one.add_argument("--rag", required=True)
+    one.add_argument("--size", type=int, required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == "_one":
+        print(json.dumps(bench_one(args.rag, args.size, args.queries, args.recall_queries,
+                                   args.top_k, args.ranking, args.seed, args.retrieval, args.topics)))
+        return 0
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    if args.command == "run":
+        results = run_sizes(os.path.abspath(args.rag), sizes, args)
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(results, f, indent=2)
+        return 0
+
+    tmp = tempfile.mkdtemp(prefix="bench_rag_")
+    try:
+        report = {}
+        for name, rev in (("base", args.base), ("head", args.head)):
+            print(f"== {name}: {rev}", file=sys.stderr)
+            dest = os.path.join(tmp, name)
+            os.makedirs(dest)
+            report[name] = run_sizes(_export_rag(rev, dest), sizes, args)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    found = regressions(report["base"], report["head"], args.threshold)
+    for size, metric, old, new in found:
+        print(f"REGRESSION {size:,} chunks {metric}: {old:.4g} -> {new:.4g}")
+    if not found:
+        print(f"no regressions beyond {args.threshold:.0%}")
+    return 1 if found else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
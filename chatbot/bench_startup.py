@@ -0,0 +1,178 @@
+import argparse
+import ast
+import io
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+# Startup benchmark for the app: how long its imports take (python -X
+# importtime, in a fresh interpreter per repeat), and how long Streamlit's
+# first script run and a rerun take (streamlit.testing's AppTest, also in a
+# fresh interpreter, so the first run pays every import).
+#
+#   python bench_startup.py run --repeat 5
+#   python bench_startup.py compare HEAD~1 HEAD
+#
+# compare measures the app as of two git revisions ("." is the working
+# tree) and exits 1 if a metric got worse by more than --threshold.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# metric -> True if a larger value is better
+METRICS = {
+    "import_ms": False,
+    "first_run_ms": False,
+    "rerun_ms": False,
+}
+
+_APP_RUN = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=120)
+at.secrets["GEMINI_API_KEY"] = "benchmark"
+start = time.perf_counter()
+at.run()
+first = time.perf_counter() - start
+start = time.perf_counter()
+at.run()
+rerun = time.perf_counter() - start
+print(json.dumps({"first_run_ms": 1000 * first, "rerun_ms": 1000 * rerun, "exceptions": len(at.exception)}))
+"""
+
+def app_imports(app_dir):
+    """The top-level import statements of app_dir/app.py, as source lines."""
+    with open(os.path.join(app_dir, "app.py"), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return [ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+def parse_importtime(stderr):
+    """module->cumulative microseconds for the top-level imports in -X importtime output."""
+    out = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # nested imports are indented under the module that pulled them in
+        if not name.startswith("  "):
+            out[name.strip()] = int(cumulative)
+    return out
+
+def measure_imports(app_dir):
+    """(milliseconds, module->ms) the app's imports take beyond a bare interpreter's."""
+    bare = parse_importtime(subprocess.run([sys.executable, "-X", "importtime", "-c", "pass"],
+                                           stderr=subprocess.PIPE, text=True, check=True).stderr)
+    code = "\n".join(app_imports(app_dir))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=app_dir,
+                          stderr=subprocess.PIPE, text=True, check=True)
+    modules = {name: us / 1000 for name, us in parse_importtime(proc.stderr).items() if name not in bare}
+    return sum(modules.values()), modules
+
+def measure_app(app_dir):
+    """First run and rerun of app.py under AppTest, in a fresh interpreter."""
+    # memory-only response cache, so runs neither share entries nor leave a file behind
+    env = dict(os.environ, NEXUS_RESPONSE_CACHE="")
+    proc = subprocess.run([sys.executable, "-c", _APP_RUN], cwd=app_dir, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, text=True, env=env)
+    if proc.returncode:
+        raise RuntimeError(f"AppTest run failed in {app_dir}:\n{proc.stderr}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def bench(app_dir, repeat=5, top=10):
+    """Median of each metric over repeat fresh interpreters, plus the slowest top-level imports."""
+    runs = {metric: [] for metric in METRICS}
+    slowest = {}
+    for _ in range(repeat):
+        total, modules = measure_imports(app_dir)
+        runs["import_ms"].append(total)
+        for name, ms in modules.items():
+            slowest.setdefault(name, []).append(ms)
+        app = measure_app(app_dir)
+        if app["exceptions"]:
+            raise RuntimeError(f"app.py raised during the run in {app_dir}")
+        runs["first_run_ms"].append(app["first_run_ms"])
+        runs["rerun_ms"].append(app["rerun_ms"])
+    result = {metric: statistics.median(values) for metric, values in runs.items()}
+    medians = sorted(((statistics.median(v), name) for name, v in slowest.items()), reverse=True)
+    result["slowest_imports_ms"] = {name: ms for ms, name in medians[:top]}
+    return result
+
+def format_result(r):
+    lines = [f"imports {r['import_ms']:8.1f}ms  first run {r['first_run_ms']:8.1f}ms  rerun {r['rerun_ms']:8.1f}ms"]
+    for name, ms in r["slowest_imports_ms"].items():
+        lines.append(f"  {ms:8.1f}ms  {name}")
+    return "\n".join(lines)
+
+def regressions(base, head, threshold):
+    """(metric, base, head) for every metric that got worse by more than threshold."""
+    found = []
+    for metric, higher_is_better in METRICS.items():
+        old, new = base[metric], head[metric]
+        worse = new < old * (1 - threshold) if higher_is_better else new > old * (1 + threshold)
+        if worse:
+            found.append((metric, old, new))
+    return found
+
+def _export_app(rev, dest):
+    # this directory as of rev, extracted into dest; "." is the working tree
+    if rev == ".":
+        return HERE
+    prefix, top = subprocess.run(["git", "rev-parse", "--show-prefix", "--show-toplevel"], cwd=HERE, check=True,
+                                 stdout=subprocess.PIPE, text=True).stdout.splitlines()
+    # run from the top level: in a subdirectory git archive only takes paths under it
+    archive = subprocess.run(["git", "archive", "--format=tar", f"{rev}:{prefix}"], cwd=top, check=True,
+                             stdout=subprocess.PIPE).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(dest)
+    return dest
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the app's import time and first script run.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--repeat", type=int, default=5, help="fresh interpreters per measurement")
+    common.add_argument("--top", type=int, default=10, help="slowest imports listed")
+    run = sub.add_parser("run", parents=[common], help="benchmark the working tree")
+    run.add_argument("--out", help="write the result as JSON here")
+    compare = sub.add_parser("compare", parents=[common], help="benchmark two git revisions")
+    compare.add_argument("base")
+    compare.add_argument("head", nargs="?", default=".")
+    compare.add_argument("--threshold", type=float, default=0.10,
+                         help="relative change treated as a regression")
+    compare.add_argument("--out", help="write both results as JSON here")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        result = bench(HERE, args.repeat, args.top)
+        print(format_result(result))
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(result, f, indent=2)
+        return 0
+
+    tmp = tempfile.mkdtemp(prefix="bench_startup_")
+    try:
+        report = {}
+        for name, rev in (("base", args.base), ("head", args.head)):
+            dest = os.path.join(tmp, name)
+            os.makedirs(dest)
+            report[name] = bench(_export_app(rev, dest), args.repeat, args.top)
+            print(f"== {name}: {rev}\n{format_result(report[name])}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    found = regressions(report["base"], report["head"], args.threshold)
+    for metric, old, new in found:
+        print(f"REGRESSION {metric}: {old:.4g} -> {new:.4g}")
+    if not found:
+        print(f"no regressions beyond {args.threshold:.0%}")
+    return 1 if found else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
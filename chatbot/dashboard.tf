@@ -56,6 +56,28 @@ resource "aws_cloudwatch_dashboard" "nexusai_dashboard" {
           region = "ap-south-1", # Change to your AWS region
           title  = "Disk Utilization (%)"
         }
+      },
+      {
+        type   = "metric",
+        x      = 12,
+        y      = 7,
+        width  = 12,
+        height = 6,
+        properties = {
+          # Chat-turn stage latency, from the app's EMF log records (NEXUS_METRICS_SINK=emf)
+          metrics = [
+            ["NexusAI", "Duration", "Stage", "turn", { "label" = "Whole turn" }],
+            ["...", "model", { "label" = "Gemini call" }],
+            ["...", "retrieve", { "label" = "Retrieval" }],
+            ["...", "translate", { "label" = "Translation" }],
+            ["...", "render", { "label" = "Rendering" }]
+          ],
+          period = 300,
+          stat   = "p99",
+          region = "ap-south-1", # Change to your AWS region
+          title  = "Chat Turn Latency p99 (ms)"
+          view   = "timeSeries"
+        }
       }
     ]
   })
@@ -0,0 +1,224 @@
+import math
+import os
+import zlib
+
+import numpy as np
+import scipy.sparse as sp
+
+from rag import _tokenize
+
+# Dense retrieval for RAGIndex(retrieval="dense" or "hybrid"), CPU only and
+# offline. By default a chunk's vector is the tf-idf weighted sum of its
+# tokens' vectors, and a token's vector is the word and its character
+# trigrams feature-hashed, with random signs, into DIM dimensions (a sparse
+# random projection). "configure" and "configuration" land close together,
+# and query words the corpus never uses still match through their trigrams.
+# NEXUS_EMBED_MODEL names a local sentence-transformers model to embed with
+# instead.
+#
+# Large indexes are searched through an IVF: vectors are clustered with
+# spherical k-means and a query only scans the NPROBE lists whose centroids
+# are closest to it. Hybrid mode fuses the lexical and dense rankings with
+# reciprocal rank fusion.
+
+DIM = int(os.environ.get("NEXUS_DENSE_DIM", 256))
+NPROBE = int(os.environ.get("NEXUS_DENSE_NPROBE", 64))
+EMBED_MODEL = os.environ.get("NEXUS_EMBED_MODEL", "")
+
+# below this many live chunks a query scans every vector
+IVF_MIN_CHUNKS = 20000
+# k-means training points per list, and iterations
+_TRAIN_PER_LIST = 64
+_KMEANS_ITERS = 10
+# rows per block when embedding chunks or assigning them to lists
+_BLOCK = 16384
+
+# RRF constant, and how deep each ranking is taken in hybrid mode
+RRF_K = 60
+FUSE_DEPTH = 50
+
+def _idf(df, n):
+    # smoothed idf; tokens the index has never seen count as the rarest
+    return np.log((n + 1) / (np.asarray(df, dtype=np.float64) + 1)) + 1
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    vectors /= norms
+    return vectors
+
+class HashingEmbedder:
+    """Word and character-trigram feature hashing into dim dimensions."""
+
+    def __init__(self, dim=DIM, seed=0):
+        self.dim = dim
+        self._prefix = b"%d:" % seed
+
+    def _features(self, tok):
+        # (bucket, signed weight): the word itself, then its trigrams with
+        # the same weight between them
+        h = zlib.crc32(self._prefix + tok.encode("utf-8"))
+        yield h % self.dim, (1.0 if h & 0x10000 else -1.0)
+        padded = "<" + tok + ">"
+        w = 1.0 / math.sqrt(len(padded) - 2)
+        for i in range(len(padded) - 2):
+            h = zlib.crc32(self._prefix + b"#" + padded[i:i+3].encode("utf-8"))
+            yield h % self.dim, (w if h & 0x10000 else -w)
+
+    def token_matrix(self, tokens):
+        """CSR (tokens x dim) of unit-length token vectors."""
+        indptr, cols, vals = [0], [], []
+        for tok in tokens:
+            row = {}
+            for j, w in self._features(tok):
+                row[j] = row.get(j, 0.0) + w
+            norm = math.sqrt(sum(v*v for v in row.values())) or 1.0
+            for j, v in row.items():
+                cols.append(j)
+                vals.append(v / norm)
+            indptr.append(len(cols))
+        return sp.csr_matrix((np.array(vals, dtype=np.float32), np.array(cols, dtype=np.int32), np.array(indptr)),
+                             shape=(len(indptr) - 1, self.dim))
+
+    def embed_index(self, index):
+        """Unit vectors (chunk slots x dim) for index, tombstoned slots included."""
+        n_terms, n_chunks = len(index.terms), len(index.chunk_docs)
+        tokens = self.token_matrix(index.terms[tid] for tid in range(n_terms))
+        # the postings are the columns of the (chunks x terms) tf-idf matrix
+        lens = np.fromiter((len(index.post_ids[tid]) for tid in range(n_terms)), dtype=np.int64, count=n_terms)
+        indptr = np.concatenate([[0], np.cumsum(lens)])
+        if n_terms:
+            ids = np.concatenate([np.asarray(index.post_ids[tid]) for tid in range(n_terms)]).astype(np.int32)
+            counts = np.concatenate([np.asarray(index.post_counts[tid]) for tid in range(n_terms)]).astype(np.float32)
+        else:
+            ids, counts = np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        maxf = np.asarray(index.doc_maxf, dtype=np.float32)
+        counts /= maxf[ids]
+        counts *= np.repeat(_idf(index.df, index.n_live).astype(np.float32), lens)
+        weights = sp.csc_matrix((counts, ids, indptr), shape=(n_chunks, n_terms)).tocsr()
+        del ids, counts
+        out = np.empty((n_chunks, self.dim), dtype=np.float32)
+        for start in range(0, n_chunks, _BLOCK):
+            out[start:start + _BLOCK] = (weights[start:start + _BLOCK] @ tokens).toarray()
+        return _normalize(out)
+
+    def embed_query(self, index, q):
+        """Unit vector of q, weighted with index's idf like its chunks."""
+        counts = {}
+        for tok in _tokenize(q):
+            counts[tok] = counts.get(tok, 0) + 1
+        if not counts:
+            return np.zeros(self.dim, dtype=np.float32)
+        toks = list(counts)
+        maxf = max(counts.values())
+        weights = np.array([counts[tok] / maxf for tok in toks]) * _idf([index._term_df(tok) for tok in toks], index.n_live)
+        return _normalize(np.asarray(self.token_matrix(toks).T @ weights, dtype=np.float32))
+
+class ModelEmbedder:
+    """A local sentence-transformers model (optional dependency)."""
+
+    reads_text = True  # word order matters, so results are cached by text
+
+    def __init__(self, name=EMBED_MODEL, batch_size=64):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError("NEXUS_EMBED_MODEL needs the sentence-transformers package")
+        self.model = SentenceTransformer(name, device="cpu")
+        self.batch_size = batch_size
+
+    def embed_index(self, index):
+        """Unit vectors (chunk slots x dim) of the chunk texts."""
+        return self.model.encode(list(index.chunks), batch_size=self.batch_size,
+                                 normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+
+    def embed_query(self, index, q):
+        """Unit vector of q."""
+        return self.model.encode([q], normalize_embeddings=True, convert_to_numpy=True)[0].astype(np.float32)
+
+def default_embedder():
+    """ModelEmbedder if NEXUS_EMBED_MODEL is set, else HashingEmbedder."""
+    if EMBED_MODEL:
+        return ModelEmbedder(EMBED_MODEL)
+    return HashingEmbedder()
+
+def _top(ids, scores, top_k):
+    # (id, score) of the top_k scores, ties broken by id
+    if len(scores) > top_k:
+        part = np.argpartition(-scores, top_k - 1)[:top_k]
+        ids, scores = ids[part], scores[part]
+    order = np.lexsort((ids, -scores))
+    return [(int(ids[i]), float(scores[i])) for i in order]
+
+def _nearest(vectors, centroids):
+    # index of the closest centroid (highest dot product) for each row
+    out = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), _BLOCK):
+        out[start:start + _BLOCK] = np.argmax(vectors[start:start + _BLOCK] @ centroids.T, axis=1)
+    return out
+
+def _kmeans(vectors, k, iters, rng):
+    # spherical k-means; empty lists are reseeded from random points
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iters):
+        assign = _nearest(vectors, centroids)
+        members = sp.csr_matrix((np.ones(len(vectors), dtype=np.float32), (assign, np.arange(len(vectors)))),
+                                shape=(k, len(vectors)))
+        sums = np.asarray(members @ vectors)
+        empty = np.flatnonzero(np.bincount(assign, minlength=k) == 0)
+        sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+        centroids = _normalize(sums.astype(np.float32))
+    return centroids
+
+class DenseIndex:
+    """Live chunk vectors, grouped into IVF lists once there are IVF_MIN_CHUNKS of them."""
+
+    def __init__(self, vectors, live, nlist=None, nprobe=NPROBE, seed=0):
+        ids = np.flatnonzero(live)
+        self.nprobe = nprobe
+        self.centroids = None
+        if len(ids) >= IVF_MIN_CHUNKS:
+            rng = np.random.default_rng(seed)
+            nlist = nlist or int(math.sqrt(len(ids)))
+            sample = ids[rng.choice(len(ids), min(len(ids), nlist * _TRAIN_PER_LIST), replace=False)]
+            self.centroids = _kmeans(vectors[sample], nlist, _KMEANS_ITERS, rng)
+            assign = _nearest(vectors[ids], self.centroids)
+            order = np.argsort(assign, kind="stable")
+            ids = ids[order]
+            # list l holds ids/vectors[offsets[l]:offsets[l+1]]
+            self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))])
+        self.ids = ids
+        self.vectors = vectors[ids]
+
+    def nbytes(self):
+        return self.vectors.nbytes + self.ids.nbytes
+
+    def search(self, qvec, top_k):
+        """Approximate top_k (chunk idx, cosine) for a unit query vector."""
+        if self.centroids is None:
+            return self.search_exact(qvec, top_k)
+        nprobe = min(self.nprobe, len(self.centroids))
+        probe = np.argpartition(-(self.centroids @ qvec), nprobe - 1)[:nprobe]
+        ids, scores = [], []
+        for l in probe:
+            lo, hi = self.offsets[l], self.offsets[l+1]
+            if lo < hi:
+                ids.append(self.ids[lo:hi])
+                scores.append(self.vectors[lo:hi] @ qvec)
+        if not ids:
+            return []
+        return _top(np.concatenate(ids), np.concatenate(scores), top_k)
+
+    def search_exact(self, qvec, top_k):
+        """Exact top_k (chunk idx, cosine), scanning every vector."""
+        if not len(self.ids):
+            return []
+        return _top(self.ids, self.vectors @ qvec, top_k)
+
+def rrf(rankings, top_k, k=RRF_K):
+    """Reciprocal rank fusion of (idx, score) rankings into the top_k (idx, fused score)."""
+    fused = {}
+    for ranking in rankings:
+        for rank, (idx, _) in enumerate(ranking):
+            fused[idx] = fused.get(idx, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda x: (-x[1], x[0]))[:top_k]
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+
+# Content-addressed cache of extracted document text. An entry is keyed by
+# the SHA-256 of the uploaded bytes, the detected MIME type and the version
+# of the extractor that handled it, and holds the extracted pieces (one per
+# PDF page, DOCX paragraph, ...) so page boundaries survive. Re-uploads, and
+# the same file uploaded by other sessions or workers on the host, skip
+# PyPDF2/python-docx parsing entirely.
+#
+# Entries are zlib-compressed JSON files in one directory, written to a
+# temp file and renamed into place so readers never see a partial entry.
+# A file's mtime is its last use; once the directory passes the size cap
+# the least recently used entries are deleted.
+
+DEFAULT_DIR = os.environ.get(
+    "NEXUS_EXTRACT_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "extract_cache"))
+DEFAULT_MAX_BYTES = int(os.environ.get("NEXUS_EXTRACT_CACHE_MB", 1024)) * 1024 * 1024
+
+_SUFFIX = ".json.z"
+
+def make_key(data, file_type, version):
+    """Cache key for bytes data extracted as file_type by an extractor at version."""
+    h = hashlib.sha256(data)
+    h.update(b"\0" + file_type.encode("utf-8") + b"\0" + str(version).encode("utf-8"))
+    return h.hexdigest()
+
+class ExtractCache:
+    """Extracted text pieces on disk by content hash, LRU-evicted past max_bytes."""
+
+    def __init__(self, path=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self.bytes = sum(size for _, _, size in self._scan())
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saved_seconds = 0.0
+
+    def _file(self, key):
+        return os.path.join(self.path, key + _SUFFIX)
+
+    def _scan(self):
+        # (mtime, path, size) of every entry, including other processes'
+        out = []
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if entry.name.endswith(_SUFFIX):
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue  # evicted by another process meanwhile
+                    out.append((st.st_mtime, entry.path, st.st_size))
+        return out
+
+    def get(self, key):
+        """The cached pieces for key, or None."""
+        path = self._file(key)
+        try:
+            with open(path, "rb") as f:
+                entry = json.loads(zlib.decompress(f.read()))
+            os.utime(path)  # mark as recently used
+        except (FileNotFoundError, zlib.error, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            self.saved_seconds += entry["seconds"]
+        return entry["pieces"]
+
+    def put(self, key, pieces, seconds=0.0):
+        """Stores pieces for key; seconds is the extraction time a later hit saves."""
+        blob = zlib.compress(json.dumps({"seconds": seconds, "pieces": pieces}).encode("utf-8"), 1)
+        if len(blob) > self.max_bytes:
+            return
+        path = self._file(key)
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(blob)
+            # a rewritten entry only adds the difference in size
+            try:
+                replaced = os.stat(path).st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+        with self._lock:
+            self.bytes += len(blob) - replaced
+            if self.bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # rescan, since other processes add and evict entries too, then drop
+        # the least recently used until under the cap
+        entries = sorted(self._scan())
+        self.bytes = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if self.bytes <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            self.bytes -= size
+            self.evictions += 1
+
+    def get_or_extract(self, key, extract):
+        """Cached pieces for key, else list(extract()), which is then cached."""
+        pieces = self.get(key)
+        if pieces is None:
+            start = time.perf_counter()
+            pieces = list(extract())
+            self.put(key, pieces, time.perf_counter() - start)
+        return pieces
+
+    def stats(self):
+        """Hit/miss counters, hit rate, bytes on disk, evictions and extraction time saved by hits."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "bytes": self.bytes,
+                "evictions": self.evictions,
+                "saved_seconds": self.saved_seconds,
+            }
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def shared():
+    """The process-wide cache in DEFAULT_DIR, or None if NEXUS_EXTRACT_CACHE_MB is 0."""
+    global _shared
+    if not DEFAULT_MAX_BYTES:
+        return None
+    with _shared_lock:
+        if _shared is None:
+            _shared = ExtractCache()
+        return _shared
@@ -0,0 +1,225 @@
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+# Local stand-in for the Gemini API, for load-testing scheduler.py without
+# a key or a quota. It answers generateContent and streamGenerateContent
+# (SSE) after a configurable latency, enforces its own requests-per-second
+# limit with 429 + Retry-After like the real quota, and can fail a fraction
+# of requests with 429 or 503 at random.
+#
+#   python fake_gemini.py serve --port 8900 --rps 5 --latency 0.3
+#   GEMINI_BASE_URL=http://localhost:8900/v1beta streamlit run app.py
+#
+#   python fake_gemini.py load --requests 200 --users 32 --duplicates 0.3
+#
+# load starts a fake server in-process (or uses --url), drives a Scheduler
+# with concurrent users, a share of them repeating a popular prompt, and
+# prints the scheduler's stats next to what the server saw.
+
+class FakeGemini:
+    """Request counters and fault settings shared by the handler threads."""
+
+    def __init__(self, latency=0.2, rps=0.0, error_rate=0.0, retry_after=1, pieces=5):
+        self.latency = latency
+        self.rps = rps  # 0: no limit
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.pieces = pieces
+        self._lock = threading.Lock()
+        self._window = []  # start times of the requests admitted in the last second
+        self.requests = 0
+        self.throttled = 0
+        self.failed = 0
+        self.concurrent = 0
+        self.max_concurrent = 0
+
+    def admit(self):
+        """None to answer, else the (status, Retry-After) to fail with."""
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            self._window = [t for t in self._window if now - t < 1.0]
+            if self.rps and len(self._window) >= self.rps:
+                self.throttled += 1
+                return 429, self.retry_after
+            if random.random() < self.error_rate:
+                self.failed += 1
+                return random.choice([(429, self.retry_after), (503, None)])
+            self._window.append(now)
+            self.concurrent += 1
+            self.max_concurrent = max(self.max_concurrent, self.concurrent)
+        return None
+
+    def done(self):
+        with self._lock:
+            self.concurrent -= 1
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "throttled": self.throttled, "failed": self.failed,
+                    "max_concurrent": self.max_concurrent}
+
+def _reply(prompt):
+    return f"Echo: {prompt[-80:]}"
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    fake = None  # set on the subclass serve() makes
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionError:
+            pass  # the client hung up, e.g. on a stream it closed early
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        prompt = body.get("contents", [{}])[0].get("parts", [{}])[0].get("text", "")
+        fault = self.fake.admit()
+        if fault is not None:
+            status, retry_after = fault
+            payload = json.dumps({"error": {"code": status, "status": "RESOURCE_EXHAUSTED"}}).encode("utf-8")
+            self.send_response(status)
+            if retry_after is not None:
+                self.send_header("Retry-After", str(retry_after))
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        try:
+            text = _reply(prompt)
+            if ":streamGenerateContent" in urlparse(self.path).path:
+                self._stream(text)
+            else:
+                time.sleep(self.fake.latency)
+                payload = json.dumps({"candidates": [{"content": {"parts": [{"text": text}]}}]}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+        finally:
+            self.fake.done()
+
+    def _stream(self, text):
+        # the latency is spread over the pieces, the first arriving after
+        # one share of it
+        n = max(1, self.fake.pieces)
+        step = -(-len(text) // n)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i in range(0, len(text), step):
+            time.sleep(self.fake.latency / n)
+            event = {"candidates": [{"content": {"parts": [{"text": text[i:i + step]}]}}]}
+            data = f"data: {json.dumps(event)}\r\n\r\n".encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, *args):
+        pass
+
+def serve(fake, port=0):
+    """Serves fake on localhost:port from a daemon thread; returns (server, base URL)."""
+    handler = type("Handler", (_Handler,), {"fake": fake})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1beta"
+
+def run_load(base_url, requests=200, users=32, duplicates=0.3, stream=False, seed=0, **scheduler_args):
+    """Sends requests prompts from users threads through a Scheduler; returns its stats and latency percentiles."""
+    from gemini_client import GeminiClient, GeminiError
+    from scheduler import Scheduler
+
+    rng = random.Random(seed)
+    # a duplicates share of the prompts are one of a few popular questions
+    prompts = [f"popular question {rng.randrange(3)}" if rng.random() < duplicates else f"question {i}"
+               for i in range(requests)]
+    client = Scheduler(GeminiClient("fake", base_url=base_url, pool_size=users), **scheduler_args)
+    latencies, errors = [], []
+
+    def one(prompt):
+        start = time.perf_counter()
+        try:
+            if stream:
+                "".join(client.stream_generate(prompt))
+            else:
+                client.generate(prompt)
+        except GeminiError as e:
+            errors.append(e.status_code)
+            return
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(one, prompts))
+    elapsed = time.perf_counter() - start
+    stats = client.stats()
+    client.close()
+    latencies.sort()
+    stats.update({
+        "elapsed_s": elapsed,
+        "errors": len(errors),
+        "p50_ms": 1000 * latencies[len(latencies) // 2] if latencies else 0.0,
+        "p99_ms": 1000 * latencies[int(len(latencies) * 0.99)] if latencies else 0.0,
+    })
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake Gemini API for load-testing the model-call scheduler.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    faults = argparse.ArgumentParser(add_help=False)
+    faults.add_argument("--latency", type=float, default=0.2, help="seconds per call")
+    faults.add_argument("--rps", type=float, default=5, help="server-side limit; past it requests get 429 (0: none)")
+    faults.add_argument("--error-rate", type=float, default=0.0, help="share of requests failed with 429 or 503")
+    faults.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s")
+    srv = sub.add_parser("serve", parents=[faults], help="run the fake server")
+    srv.add_argument("--port", type=int, default=8900)
+    load = sub.add_parser("load", parents=[faults], help="drive a Scheduler against the fake server")
+    load.add_argument("--url", help="base URL of a running fake server; default starts one here")
+    load.add_argument("--requests", type=int, default=200)
+    load.add_argument("--users", type=int, default=32)
+    load.add_argument("--duplicates", type=float, default=0.3, help="share of requests repeating a popular prompt")
+    load.add_argument("--stream", action="store_true", help="use stream_generate instead of generate")
+    load.add_argument("--client-rps", type=float, help="Scheduler rate (default NEXUS_GEMINI_RPS)")
+    load.add_argument("--concurrency", type=int, help="Scheduler slots (default NEXUS_GEMINI_CONCURRENCY)")
+    args = parser.parse_args(argv)
+
+    fake = FakeGemini(args.latency, args.rps, args.error_rate, args.retry_after)
+    if args.command == "serve":
+        server, url = serve(fake, args.port)
+        print(f"fake Gemini API at {url}", file=sys.stderr)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+        return 0
+
+    url = args.url
+    if not url:
+        _, url = serve(fake)
+    scheduler_args = {}
+    if args.client_rps is not None:
+        scheduler_args["rate"] = args.client_rps
+    if args.concurrency is not None:
+        scheduler_args["concurrency"] = args.concurrency
+    stats = run_load(url, args.requests, args.users, args.duplicates, args.stream, **scheduler_args)
+    if not args.url:
+        stats["server"] = fake.stats()
+    print(json.dumps(stats, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+import asyncio
+import email.utils
+import json
+import os
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Every model call goes through one GeminiClient per process. Its
+# requests.Session keeps HTTP/1.1 connections alive in a pool, so after
+# the first call a turn pays no TCP/TLS handshake.
+
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+DEFAULT_MODEL = "gemini-2.0-flash"
+
+class GeminiError(Exception):
+    """Raised when the API answers with a non-200 status."""
+    def __init__(self, status_code, text, retry_after=None):
+        super().__init__(f"{status_code}: {text}")
+        self.status_code = status_code
+        self.text = text
+        self.retry_after = retry_after  # seconds the server asked us to wait, if it said
+
+_RETRY_DELAY = re.compile(r'"retryDelay":\s*"([\d.]+)s"')
+
+def _retry_after(response):
+    # Retry-After as seconds or an HTTP date, else the RetryInfo delay
+    # Google APIs put in the error body
+    value = response.headers.get("Retry-After")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+    match = _RETRY_DELAY.search(response.text)
+    return float(match.group(1)) if match else None
+
+class GeminiClient:
+    """Pooled, keep-alive client for the generateContent endpoint."""
+
+    def __init__(self, api_key, base_url=None, model=DEFAULT_MODEL, timeout=30, pool_size=16):
+        self.api_key = api_key
+        # GEMINI_BASE_URL lets tests and proxies point the app elsewhere
+        self.base_url = (base_url or os.environ.get("GEMINI_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
+        self.model = model
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({'Content-Type': 'application/json'})
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._adapter = adapter
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._call_seconds = 0.0
+        self._streams = 0
+        self._first_token_seconds = 0.0
+
+    def _url(self, method):
+        return f"{self.base_url}/models/{self.model}:{method}?key={self.api_key}"
+
+    def generate(self, prompt):
+        """Sends one prompt and returns the model's text."""
+        start = time.perf_counter()
+        response = self.session.post(
+            self._url("generateContent"),
+            json={'contents': [{'parts': [{'text': prompt}]}]},
+            timeout=self.timeout
+        )
+        with self._lock:
+            self._calls += 1
+            self._call_seconds += time.perf_counter() - start
+        if response.status_code != 200:
+            raise GeminiError(response.status_code, response.text, _retry_after(response))
+        return response.json()['candidates'][0]['content']['parts'][0]['text']
+
+    def stream_generate(self, prompt):
+        """Yields the model's text as it arrives from streamGenerateContent (SSE)."""
+        start = time.perf_counter()
+        first = True
+        with self.session.post(
+            self._url("streamGenerateContent") + "&alt=sse",
+            json={'contents': [{'parts': [{'text': prompt}]}]},
+            timeout=self.timeout,
+            stream=True
+        ) as response:
+            if response.status_code != 200:
+                raise GeminiError(response.status_code, response.text, _retry_after(response))
+            # text/event-stream carries no charset; requests would assume latin-1
+            response.encoding = 'utf-8'
+            for line in response.iter_lines(decode_unicode=True):
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line[5:])
+                for candidate in event.get('candidates', [])[:1]:
+                    for part in candidate.get('content', {}).get('parts', []):
+                        text = part.get('text')
+                        if not text:
+                            continue
+                        if first:
+                            first = False
+                            with self._lock:
+                                self._streams += 1
+                                self._first_token_seconds += time.perf_counter() - start
+                        yield text
+        with self._lock:
+            self._calls += 1
+            self._call_seconds += time.perf_counter() - start
+
+    async def agenerate(self, prompt):
+        """Async generate(); independent calls awaited together overlap on the pool."""
+        return await asyncio.to_thread(self.generate, prompt)
+
+    async def agenerate_many(self, prompts):
+        """Runs several prompts concurrently, returning texts in order."""
+        return await asyncio.gather(*(self.agenerate(p) for p in prompts))
+
+    def stats(self):
+        """Calls made, connections opened, mean call latency and time to first token."""
+        pools = self._adapter.poolmanager.pools
+        connections = sum(pools[key].num_connections for key in pools.keys())
+        with self._lock:
+            calls, seconds = self._calls, self._call_seconds
+            streams, first_token = self._streams, self._first_token_seconds
+        return {
+            "calls": calls,
+            "connections": connections,
+            "reused": max(0, calls - connections),
+            "mean_latency_ms": 1000 * seconds / calls if calls else 0.0,
+            "mean_first_token_ms": 1000 * first_token / streams if streams else 0.0,
+        }
+
+    def close(self):
+        self.session.close()
+
+_SENTENCE_END = re.compile(r'(?<=[.!?\u0964])\s+')
+
+def iter_sentences(pieces):
+    """Regroups streamed text pieces into whole sentences; joined, they give back the text."""
+    buf = ""
+    for piece in pieces:
+        buf += piece
+        start = 0
+        for match in _SENTENCE_END.finditer(buf):
+            yield buf[start:match.end()]
+            start = match.end()
+        buf = buf[start:]
+    if buf:
+        yield buf
+
+def measure_reuse(api_key, prompt="ping", n=10, base_url=None):
+    """Times n calls on fresh connections against n calls on one pooled client.
+
+    The per-call difference is the handshake cost a turn saves by reusing
+    a connection.
+    """
+    client = GeminiClient(api_key, base_url=base_url)
+    start = time.perf_counter()
+    for _ in range(n):
+        fresh = GeminiClient(api_key, base_url=base_url)
+        fresh.generate(prompt)
+        fresh.close()
+    fresh_ms = 1000 * (time.perf_counter() - start) / n
+    client.generate(prompt)  # open the pooled connection
+    start = time.perf_counter()
+    for _ in range(n):
+        client.generate(prompt)
+    pooled_ms = 1000 * (time.perf_counter() - start) / n
+    client.close()
+    return {"fresh_ms": fresh_ms, "pooled_ms": pooled_ms, "saved_ms": fresh_ms - pooled_ms}
+
+if __name__ == "__main__":
+    import sys
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    print(json.dumps(measure_reuse(os.environ["GEMINI_API_KEY"], n=n)))
@@ -0,0 +1,99 @@
+import os
+import threading
+from collections import OrderedDict
+
+# Process-wide cache of built RAG indexes, keyed by the SHA-256 of the
+# extracted text. The index holds the document text itself, so reruns,
+# sessions that turn RAG on after uploading and other sessions uploading
+# the same document all share one copy of both: build_document hashes the
+# text first and only indexes it on a miss, and sessions uploading the same
+# text at once wait for one build. Entries are evicted least recently used
+# first once their estimated size passes the memory cap; a session keeps
+# its own reference, so eviction only stops the sharing.
+
+DEFAULT_MAX_BYTES = int(os.environ.get("NEXUS_INDEX_CACHE_MB", 512)) * 1024 * 1024
+
+# Rough sizes: postings and the forward index are 4-byte array entries
+# (id + count each), a term is a str in the vocab dict plus two arrays, and
+# a chunk is its span, norm, length and offset array slots
+_POSTING_BYTES = 16
+_TERM_BYTES = 200
+_CHUNK_BYTES = 64
+# a dense or hybrid index adds a float32 vector of dense.DIM per chunk
+_VECTOR_BYTES = 4 * 256
+
+def estimate_bytes(index):
+    """Approximate resident size of a built in-memory index, text included."""
+    postings = sum(len(ids) for ids in index.post_ids)
+    chunk_bytes = _CHUNK_BYTES + (_VECTOR_BYTES if index.retrieval != "lexical" else 0)
+    return (index.texts.nbytes() + chunk_bytes * len(index.chunk_docs) + _POSTING_BYTES * postings
+            + _TERM_BYTES * len(index.terms))
+
+class IndexCache:
+    """LRU of RAGIndex objects by content hash, capped by estimated memory."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # digest->(index, nbytes)
+        self._building = {}  # digest->lock held while that index is built
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.builds = 0
+        self.evictions = 0
+
+    def get(self, digest):
+        """Cached index for digest, or None."""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return entry[0]
+
+    def get_or_build(self, digest, build):
+        """Index for digest, calling build() for it on a miss.
+
+        Concurrent callers with the same digest wait for one build instead
+        of each building their own.
+        """
+        index = self.get(digest)
+        if index is not None:
+            return index
+        with self._lock:
+            build_lock = self._building.setdefault(digest, threading.Lock())
+        try:
+            with build_lock:
+                index = self.get(digest)
+                if index is not None:
+                    return index
+                index = build()
+                self._store(digest, index)
+                return index
+        finally:
+            with self._lock:
+                self._building.pop(digest, None)
+
+    def _store(self, digest, index):
+        nbytes = estimate_bytes(index)
+        with self._lock:
+            self.builds += 1
+            self._entries[digest] = (index, nbytes)
+            self.bytes += nbytes
+            # always keep the newest entry, even if it alone exceeds the cap
+            while self.bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, dropped) = self._entries.popitem(last=False)
+                self.bytes -= dropped
+                self.evictions += 1
+
+    def stats(self):
+        """Entries, estimated bytes held, hits, builds and evictions."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "builds": self.builds,
+                "evictions": self.evictions,
+            }
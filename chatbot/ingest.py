@@ -0,0 +1,333 @@
+import codecs
+import importlib
+import io
+import mimetypes
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import extract_cache
+import telemetry
+
+# Extractors are generators: they yield the document a page (PDF), a
+# paragraph (DOCX), a block (text) or a row group (CSV, see tables.py) at a
+# time so callers can chunk and index as they go instead of holding the
+# whole text. Concatenating the pieces gives the document's text.
+#
+# They are looked up by MIME type in a registry, and the parsers behind
+# them (PyPDF2, python-docx, pandas) are only imported when the first such
+# file arrives, so importing this module costs the app's cold start nothing.
+#
+# Extracted pieces are cached by content hash (see extract_cache.py), so a
+# file seen before, by any session, is not parsed again. Bump an
+# extractor's version when its output changes to retire its old entries.
+
+PDF = 'application/pdf'
+DOCX = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+TEXT_TYPES = ('text/plain', 'text/csv')
+
+TEXT_BLOCK_SIZE = 1 << 20
+
+# Parallel extraction: worker count (NEXUS_EXTRACT_WORKERS, default one per
+# core) and how many PDF pages one task extracts
+EXTRACT_WORKERS = int(os.environ.get("NEXUS_EXTRACT_WORKERS", 0)) or os.cpu_count() or 1
+PDF_PAGES_PER_TASK = int(os.environ.get("NEXUS_PDF_PAGES_PER_TASK", 25))
+
+# seconds between progress reports while waiting on the pool
+_PROGRESS_INTERVAL = 0.1
+
+def _report(on_progress, done, total):
+    if on_progress is not None:
+        on_progress(done, total)
+
+def iter_pdf(file, on_progress=None):
+    """Yields the text of each page of a PDF file."""
+    from PyPDF2 import PdfReader
+    pdf_reader = PdfReader(file)
+    total = len(pdf_reader.pages)
+    for i, page in enumerate(pdf_reader.pages):
+        yield page.extract_text() or ""
+        _report(on_progress, i + 1, total)
+
+def iter_docx(file, on_progress=None):
+    """Yields each paragraph of a DOCX file, newline terminated."""
+    from docx import Document
+    doc = Document(file)
+    paragraphs = doc.paragraphs
+    total = len(paragraphs)
+    for i, paragraph in enumerate(paragraphs):
+        yield paragraph.text + "\n"
+        _report(on_progress, i + 1, total)
+
+def iter_text(file, on_progress=None):
+    """Yields a UTF-8 text file in decoded blocks."""
+    file.seek(0, 2)
+    total = file.tell()
+    file.seek(0)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    while True:
+        block = file.read(TEXT_BLOCK_SIZE)
+        if not block:
+            break
+        yield decoder.decode(block)
+        _report(on_progress, file.tell(), total)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+# MIME type->[extractor(file, on_progress) or the "module:function" name of
+# one, imported on first lookup; its version; whether its output is cached;
+# whether extract_many sends it to the process pool]. Plain text decodes
+# faster than a cache entry loads or a result pickles back from a worker,
+# so it is neither cached nor pooled but streamed in the calling process.
+# CSV is streamed the same way: a table can be far larger than a PDF's
+# text, and a cache entry or a worker's result holds all of it at once.
+# extract_many's worker processes start from this table as written here,
+# not from later register_extractor() calls.
+_EXTRACTORS = {
+    PDF: [iter_pdf, 1, True, True],
+    DOCX: [iter_docx, 1, True, True],
+    'text/plain': [iter_text, 1, False, False],
+    'text/csv': ["tables:iter_csv", 1, False, False],
+}
+_registry_lock = threading.Lock()
+
+def register_extractor(file_type, extractor, version=1, cache=True, pool=True):
+    """Routes file_type to extractor, a function or a "module:function" name to import when first needed."""
+    with _registry_lock:
+        _EXTRACTORS[file_type] = [extractor, version, cache, pool]
+
+def get_extractor(file_type):
+    """The extractor for file_type, importing it if registered by name; ValueError if there is none."""
+    with _registry_lock:
+        entry = _EXTRACTORS.get(file_type)
+        if entry is None:
+            raise ValueError(f"Unsupported file type: {file_type}")
+        if isinstance(entry[0], str):
+            module, _, name = entry[0].partition(":")
+            entry[0] = getattr(importlib.import_module(module), name)
+        return entry[0]
+
+def cache_version(file_type):
+    """The version file_type's extractor output is cached under, or None if it isn't cached."""
+    entry = _EXTRACTORS.get(file_type)
+    return entry[1] if entry is not None and entry[2] else None
+
+def supported(file_type):
+    """Whether an extractor is registered for file_type."""
+    return file_type in _EXTRACTORS
+
+def detect_file_type(file):
+    """Guesses the MIME type from the file name, falling back to its first bytes."""
+    file_type = mimetypes.guess_type(file.name)[0]
+    if not file_type:
+        content_peek = file.read(1024)
+        file.seek(0)
+        if content_peek.startswith(b'%PDF-'):
+            file_type = PDF
+        elif content_peek.startswith(b'PK\x03\x04'):
+            file_type = DOCX
+        else:
+            try:
+                content_peek.decode('utf-8')
+                file_type = 'text/plain'
+            except UnicodeDecodeError:
+                file_type = 'application/octet-stream'
+    return file_type
+
+def iter_file(file, on_progress=None):
+    """Determines file type and streams it through the matching extractor."""
+    # Reset file pointer to the start
+    file.seek(0)
+    return get_extractor(detect_file_type(file))(file, on_progress)
+
+def process_file(file, cache=None):
+    """Extracts the full text of a file as one string, through cache (default extract_cache.shared())."""
+    with telemetry.span("extract"):
+        file.seek(0)
+        file_type = detect_file_type(file)
+        version = cache_version(file_type)
+        cache = cache or extract_cache.shared()
+        if cache is None or version is None:
+            return "".join(get_extractor(file_type)(file))
+        key = extract_cache.make_key(file.read(), file_type, version)
+        file.seek(0)
+        return "".join(cache.get_or_extract(key, lambda: get_extractor(file_type)(file)))
+
+# --- Parallel extraction ---
+_pages_done = None  # in a pool worker: queue taking an item per PDF page extracted
+
+def _init_worker(pages_done):
+    global _pages_done
+    _pages_done = pages_done
+
+def _extract_task(data, file_type, start=None, end=None):
+    # runs in a worker process: extract one file, or pages [start, end) of
+    # a PDF, reporting each page done; returns (seconds taken, pieces)
+    begin = time.perf_counter()
+    file = io.BytesIO(data)
+    if file_type == PDF and start is not None:
+        from PyPDF2 import PdfReader
+        pieces = []
+        for page in PdfReader(file).pages[start:end]:
+            pieces.append(page.extract_text() or "")
+            if _pages_done is not None:
+                _pages_done.put(1)
+    else:
+        pieces = list(get_extractor(file_type)(file))
+    return time.perf_counter() - begin, pieces
+
+def _file_type(name, data):
+    file = io.BytesIO(data)
+    file.name = name
+    return detect_file_type(file)
+
+def _count_pages(data):
+    from PyPDF2 import PdfReader
+    return len(PdfReader(io.BytesIO(data)).pages)
+
+def _plan_tasks(files, types, skip=()):
+    # (file index->parts it reports progress in, [(file index, args)] pool
+    # tasks) for the files not in skip. A part is a PDF page or a whole
+    # other file; large PDFs are split into page ranges, and files of types
+    # not sent to the pool get no task.
+    parts, tasks = {}, []
+    for i, (name, data) in enumerate(files):
+        if i in skip:
+            continue
+        file_type = types[i]
+        if not supported(file_type):
+            raise ValueError(f"Unsupported file type for {name}: {file_type}")
+        parts[i] = _count_pages(data) if file_type == PDF else 1
+        if not _EXTRACTORS[file_type][3]:
+            continue
+        if file_type == PDF:
+            for start in range(0, parts[i], PDF_PAGES_PER_TASK):
+                tasks.append((i, (data, file_type, start, start + PDF_PAGES_PER_TASK)))
+        else:
+            tasks.append((i, (data, file_type)))
+    return parts, tasks
+
+def _cached_pieces(files, types, cache):
+    # (file index->pieces found in cache, file index->key to store the rest under)
+    found, keys = {}, {}
+    if cache is None:
+        return found, keys
+    for i, (_, data) in enumerate(files):
+        version = cache_version(types[i])
+        if version is None:
+            continue
+        key = extract_cache.make_key(data, types[i], version)
+        pieces = cache.get(key)
+        if pieces is None:
+            keys[i] = key
+        else:
+            found[i] = pieces
+    return found, keys
+
+def extract_many(files, max_workers=None, on_progress=None, cache=None):
+    """Extracts (name, bytes) files, yielding (name, pieces) in input order.
+
+    pieces is an iterator to read before asking for the next file (whatever
+    is left unread is then extracted and dropped). With max_workers > 1, PDF page ranges and DOCX
+    files are extracted ahead in a process pool; every other file, and all
+    of them with one worker, stream straight from their extractor as the
+    pieces are read. on_progress(done, total) counts parts: a PDF page or a
+    whole other file. Files already in cache (default
+    extract_cache.shared()) are not extracted again, and the others are
+    added to it once read. Closing the generator early, or an error in any
+    task, cancels the tasks that have not started yet.
+    """
+    files = list(files)
+    types = [_file_type(name, data) for name, data in files]
+    cache = cache or extract_cache.shared()
+    cached, keys = _cached_pieces(files, types, cache)
+    parts, tasks = _plan_tasks(files, types, cached)
+    total = sum(parts.values())
+    done = 0
+    workers = min(max_workers or EXTRACT_WORKERS, len(tasks))
+    if workers <= 1:
+        tasks = []
+    by_file = {}  # file index->its task positions, in page order
+    for t, (i, _) in enumerate(tasks):
+        by_file.setdefault(i, []).append(t)
+
+    def advance():
+        nonlocal done
+        done += 1
+        _report(on_progress, done, total)
+
+    def drain_pages():
+        while True:
+            try:
+                pages_done.get_nowait()
+            except queue.Empty:
+                return
+            advance()
+
+    def inline(i, clock):
+        # extracts file i here, a piece per read
+        on_page = (lambda *_: advance()) if types[i] == PDF else None
+        pieces = get_extractor(types[i])(io.BytesIO(files[i][1]), on_page)
+        while True:
+            start = time.perf_counter()
+            piece = next(pieces, None)
+            clock[0] += time.perf_counter() - start
+            if piece is None:
+                break
+            yield piece
+        if types[i] != PDF:
+            advance()
+
+    def pooled(i, clock):
+        # file i's pieces from its tasks, reporting pages while waiting
+        for t in by_file[i]:
+            future = futures[t]
+            while not future.done():
+                wait([future], timeout=_PROGRESS_INTERVAL)
+                drain_pages()
+            took, pieces = future.result()
+            clock[0] += took
+            yield from pieces
+        drain_pages()
+        if types[i] != PDF:
+            advance()
+
+    def stream(i):
+        # file i's pieces, stored in cache once all are read
+        clock = [0.0]  # seconds spent extracting
+        pieces = pooled(i, clock) if i in by_file else inline(i, clock)
+        if i not in keys:
+            yield from pieces
+            return
+        kept = []
+        for piece in pieces:
+            kept.append(piece)
+            yield piece
+        cache.put(keys[i], kept, clock[0])
+
+    executor = pages_done = None
+    if tasks:
+        # spawn rather than fork: the Streamlit server process is multi-threaded
+        context = multiprocessing.get_context("spawn")
+        pages_done = context.Queue()
+        executor = ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                       initargs=(pages_done,))
+    try:
+        futures = [executor.submit(_extract_task, *args) for _, args in tasks]
+        for i, (name, _) in enumerate(files):
+            if i in cached:
+                yield name, iter(cached[i])
+                continue
+            pieces = stream(i)
+            yield name, pieces
+            for _ in pieces:
+                pass
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+            pages_done.close()
+            pages_done.cancel_join_thread()
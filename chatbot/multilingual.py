@@ -0,0 +1,58 @@
+import bisect
+
+# Script-based language detection and the instruction that makes the model
+# answer in the user's language directly, so a non-English turn is one
+# model call instead of translate -> answer -> translate.
+
+# (first code point, last code point, language), sorted by first code point
+_SCRIPTS = [
+    (0x0370, 0x03FF, 'greek'),
+    (0x0400, 0x04FF, 'russian'),
+    (0x0590, 0x05FF, 'hebrew'),
+    (0x0600, 0x06FF, 'arabic'),
+    (0x0900, 0x097F, 'hindi'),
+    (0x0980, 0x09FF, 'bengali'),
+    (0x0A00, 0x0A7F, 'punjabi'),
+    (0x0A80, 0x0AFF, 'gujarati'),
+    (0x0B00, 0x0B7F, 'odia'),
+    (0x0B80, 0x0BFF, 'tamil'),
+    (0x0C00, 0x0C7F, 'telugu'),
+    (0x0C80, 0x0CFF, 'kannada'),
+    (0x0D00, 0x0D7F, 'malayalam'),
+    (0x0E00, 0x0E7F, 'thai'),
+    (0x1100, 0x11FF, 'korean'),
+    (0x3040, 0x30FF, 'japanese'),
+    (0x4E00, 0x9FFF, 'chinese'),
+    (0xAC00, 0xD7AF, 'korean'),
+]
+_STARTS = [start for start, _, _ in _SCRIPTS]
+
+# Letters looked at before settling on English
+SCAN_LETTERS = 24
+
+def detect_language(text, scan_letters=SCAN_LETTERS):
+    """Detect the language of text from its script, looking only at the first few letters."""
+    seen = 0
+    candidate = 'english'
+    for char in text:
+        cp = ord(char)
+        if cp >= 0x0370:
+            i = bisect.bisect_right(_STARTS, cp) - 1
+            if i >= 0 and cp <= _SCRIPTS[i][1]:
+                lang = _SCRIPTS[i][2]
+                # Han characters are shared with Japanese; keep looking for kana
+                if lang != 'chinese':
+                    return lang
+                candidate = lang
+        if char.isalpha():
+            seen += 1
+            if seen >= scan_letters:
+                break
+    return candidate
+
+def answer_instruction(lang):
+    """Prompt suffix asking for the answer in lang; empty for English."""
+    if lang == 'english':
+        return ''
+    return (f"\n\nThe user wrote in {lang.title()}. Answer in {lang.title()}, in its native script, "
+            "even if the context above is in another language.")
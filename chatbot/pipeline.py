@@ -0,0 +1,266 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+from contextlib import closing
+
+import ingest
+import tables
+import telemetry
+from gemini_client import GeminiError
+from multilingual import answer_instruction, detect_language
+from rag import RAGIndex, estimate_tokens, pack_context
+from response_cache import make_key
+
+# The chat pipeline without Streamlit: ingest uploaded files into a RAGIndex,
+# retrieve and pack passages into a prompt, and call the model through the
+# response cache. app.py renders it for a browser session; batch.py runs it
+# headless over a file of questions.
+
+# How uploaded documents are searched: "lexical" (tf-idf), "dense" (hashed
+# embeddings through an ANN index) or "hybrid" (both, fused by rank), which
+# also finds passages that paraphrase the question
+RETRIEVAL = os.environ.get("NEXUS_RETRIEVAL", "hybrid")
+
+# Passages are packed into this many (estimated) tokens; a document larger
+# than the budget is answered from retrieved passages even with RAG off
+CONTEXT_TOKENS = int(os.environ.get("NEXUS_CONTEXT_TOKENS", 8000))
+
+# "direct": non-English questions go to the model as-is with an instruction
+# to answer in the same language (one round trip). "translate-question":
+# additionally translate just the question to English for retrieval, which
+# helps when the uploaded documents are in English.
+MULTILINGUAL_MODE = os.environ.get("NEXUS_MULTILINGUAL_MODE", "direct")
+
+CREATOR_PHRASES = ["who made you", "who created you", "your creator", "who is thescythenexus"]
+
+class Document:
+    """Indexed uploads: the RAGIndex, a digest of their text and its estimated tokens."""
+
+    def __init__(self, index, digest, tokens):
+        self.index = index
+        self.digest = digest
+        self.tokens = tokens
+
+def _hashed(digest, pieces, sep=b''):
+    # pieces, fed to digest on their way through with sep between them
+    for n, piece in enumerate(pieces):
+        if n and sep:
+            digest.update(sep)
+        digest.update(piece.encode('utf-8'))
+        yield piece
+
+def _digested(results, digest, clock):
+    # extract_many's (name, pieces) hashed into digest as they stream by; CSV
+    # row groups are the table's chunks, its text them joined by newlines
+    for name, pieces in results:
+        digest.update(name.encode('utf-8') + b'\0')
+        pieces = clock.timed("extract", pieces)
+        if tables.is_table(name):
+            yield name, _hashed(digest, (piece.rstrip("\n") for piece in pieces), b'\n')
+        else:
+            yield name, _hashed(digest, pieces)
+
+def _spool(spool, files):
+    # each file's name, its pieces and a None end marker, pickled one by one
+    for name, pieces in files:
+        pickle.dump(name, spool)
+        for piece in pieces:
+            pickle.dump(piece, spool)
+        pickle.dump(None, spool)
+
+def _unspool(spool):
+    # _spool's files again, as (name, pieces) read back lazily
+    spool.seek(0)
+    def pieces():
+        while True:
+            piece = pickle.load(spool)
+            if piece is None:
+                return
+            yield piece
+    while True:
+        try:
+            name = pickle.load(spool)
+        except EOFError:
+            return
+        yield name, pieces()
+
+def _build_index(files, retrieval, clock):
+    index = RAGIndex(retrieval=retrieval)
+    for name, pieces in files:
+        with clock.span("index_build"):
+            if tables.is_table(name):
+                index.add_chunks(pieces, doc_id=name)
+            else:
+                index.add_text(pieces, doc_id=name, clock=clock)
+        clock.record()
+    with telemetry.span("index_build"):
+        # each add changed the idf earlier files' chunk norms were computed
+        # with; reweight them all once
+        index.compact()
+        tables.column_index(index)
+    return index
+
+def build_document(files, retrieval=RETRIEVAL, max_workers=None, on_progress=None, cache=None, indexes=None):
+    """Extracts (name, bytes) files, through the extraction cache, and indexes them, each file's text stored
+    once under its name. With an IndexCache as indexes, text it already holds an index of isn't indexed again."""
+    # Each file's pieces stream from extraction (or from the process pool,
+    # which works ahead) into the index, so only the index holds the text.
+    # With indexes, the text is hashed first and spooled to a temporary
+    # file, then indexed from there only on a miss. closing() cancels the
+    # pool's queued work if the caller is interrupted.
+    digest = hashlib.sha256()
+    clock = telemetry.StageTimer()
+    with closing(ingest.extract_many(files, max_workers=max_workers, on_progress=on_progress,
+                                     cache=cache)) as results:
+        if indexes is None:
+            index = _build_index(_digested(results, digest, clock), retrieval, clock)
+        else:
+            with tempfile.TemporaryFile() as spool:
+                _spool(spool, _digested(results, digest, clock))
+                clock.record()
+                index = indexes.get_or_build(digest.hexdigest(),
+                                             lambda: _build_index(_unspool(spool), retrieval, clock))
+    tokens = sum(estimate_tokens(text) for text in index.texts.values())
+    return Document(index, digest.hexdigest(), tokens)
+
+def load_document(path, retrieval=RETRIEVAL):
+    """Document over a RAGIndex saved at path (see RAGIndex.save)."""
+    index = RAGIndex(retrieval=retrieval)
+    index.load(path)
+    # same digest build_document gives the same files
+    digest = hashlib.sha256()
+    for name, text in index.texts.items():
+        digest.update(str(name).encode('utf-8') + b'\0')
+        digest.update(text.encode('utf-8'))
+    tokens = sum(estimate_tokens(text) for text in index.texts.values())
+    return Document(index, digest.hexdigest(), tokens)
+
+def creator_reply(question, lang):
+    """The canned answer to "who made you", or None for any other question."""
+    if not any(phrase in question.lower() for phrase in CREATOR_PHRASES):
+        return None
+    if lang == 'hindi':
+        return "मुझे TheScytheNexus ने बनाया है! (Mujhe TheScytheNexus ne banaya hai!)"
+    return "TheScytheNexus made me!"
+
+def translate_to_english(client, cache, text, source_lang):
+    """text in English if it's not already (memoized in the response cache); text itself if the call fails."""
+    if source_lang == 'english':
+        return text
+    prompt = f"Translate the following {source_lang.title()} text to English. Respond with ONLY the English translation and no other text: {text}"
+    def translate():
+        with telemetry.span("translate"):
+            return client.generate(prompt).strip()
+    try:
+        return cache.get_or_call(make_key(text, lang='translate:english'), translate)
+    except GeminiError:
+        return text
+
+class Prompt:
+    """A question's final prompt and what went into it."""
+
+    def __init__(self, question, lang):
+        self.question = question
+        self.lang = lang
+        self.text = question
+        self.context = []  # what the answer depends on besides the question, for the cache key
+        self.sources = []  # (doc, start, end) of the passages placed in the prompt
+        self.notices = []  # (level, message) worth showing the user: "info" or "warning"
+
+    def cache_key(self):
+        return make_key(self.question, self.context, self.lang)
+
+def build_prompt(question, document=None, rag=False, top_k=3, budget=CONTEXT_TOKENS, mmr=False,
+                 translate=None, lang=None):
+    """Prompt for question, grounded in document's passages (rag, or when it exceeds budget) or its full text.
+
+    translate(text, lang) gives the search query in English when
+    MULTILINGUAL_MODE is "translate-question".
+    """
+    prompt = Prompt(question, lang or detect_language(question))
+    use_retrieval = rag
+    if document is not None and not use_retrieval and document.tokens > budget:
+        # The whole document does not fit; fall back to retrieval
+        use_retrieval = True
+        prompt.notices.append(("info", f"Document (~{document.tokens:,} tokens) exceeds the context budget; using the most relevant passages."))
+
+    if document is not None and use_retrieval:
+        try:
+            search_query = question
+            if MULTILINGUAL_MODE == 'translate-question' and translate is not None:
+                search_query = translate(question, prompt.lang)
+            # Over-fetch candidates for MMR, or enough to fill the budget
+            # when standing in for the full document
+            pool = top_k * (4 if mmr else 1)
+            if not rag:
+                pool = max(pool, budget // 200)
+            with telemetry.span("retrieve"):
+                retrieved = document.index.query(search_query, top_k=pool)
+                # Row groups of uploaded tables holding the cell values the
+                # question names are merged in by rank
+                facts, looked_up = tables.lookup(document.index, search_query, limit=pool)
+                if looked_up:
+                    retrieved = tables.merge(looked_up, retrieved)
+                retrieved = pack_context(retrieved, budget, mmr_lambda=0.7 if mmr else None)
+            if rag:
+                retrieved = retrieved[:top_k]
+
+            if retrieved:
+                # Prepend retrieved passages to the prompt for grounding
+                ctx = 'You are an expert AI. Use the following context to answer the user\'s question. If the question cannot be answered from the context, state that explicitly. Cite the passages you use by their [number].\n'
+                if facts:
+                    # Exact counts the passages alone can't give
+                    ctx += '\n--- Table lookup (exact matches in the uploaded tables) ---\n' + '\n'.join(facts) + '\n'
+                    prompt.context.extend(facts)
+                ctx += '\n--- Retrieved passages (RAG) ---\n'
+                for n, r in enumerate(retrieved, 1):
+                    ctx += f"[{n}] {r['chunk']}\n\n"
+                    prompt.context.append(r['chunk'])
+                    prompt.sources.append((r['doc'], r['start'], r['end']))
+                prompt.text = f"{ctx}\n\nUser Question: {question}"
+            else:
+                prompt.notices.append(("info", "RAG enabled, but no relevant passages were retrieved. Using general knowledge/full document content."))
+        except Exception:
+            prompt.notices.append(("warning", "RAG retrieval failed. Proceeding with general model call."))
+
+    # If RAG is disabled but the document fits the budget, include ALL its content
+    elif document is not None:
+        prompt.context = [document.digest]
+        full_text = "\n".join(document.index.texts.values())
+        prompt.text = f"The following is a document:\n{full_text}\n\nYour task is to answer the user's question based on this document. User Question: {question}"
+
+    # The model answers in the user's language directly
+    prompt.text += answer_instruction(prompt.lang)
+    return prompt
+
+def answer(question, client, cache=None, document=None, **options):
+    """Answers question end to end, streaming from the model; returns a dict with the answer,
+    sources, notices, whether it came from the cache and the time to first token."""
+    lang = detect_language(question)
+    result = {"answer": creator_reply(question, lang), "sources": [], "notices": [], "cached": False,
+              "first_token_ms": None}
+    if result["answer"] is not None:
+        return result
+    translate = None
+    if cache is not None:
+        translate = lambda text, source_lang: translate_to_english(client, cache, text, source_lang)
+    prompt = build_prompt(question, document, translate=translate, lang=lang, **options)
+    result.update(sources=prompt.sources, notices=prompt.notices, prompt_tokens=estimate_tokens(prompt.text))
+    key = prompt.cache_key()
+    text = cache.get(key) if cache is not None else None
+    if text is not None:
+        result.update(answer=text, cached=True)
+        return result
+    start = time.perf_counter()
+    pieces = []
+    for piece in telemetry.timed("model", client.stream_generate(prompt.text)):
+        if not pieces:
+            result["first_token_ms"] = 1000 * (time.perf_counter() - start)
+        pieces.append(piece)
+    text = "".join(pieces).strip()
+    if cache is not None:
+        cache.put(key, text, time.perf_counter() - start)
+    result["answer"] = text
+    return result
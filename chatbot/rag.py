@@ -1,9 +1,72 @@
-
 import os
 import json
 import math
+import mmap
 import re
-from collections import Counter, defaultdict
+import heapq
+import itertools
+import bisect
+import struct
+import threading
+import zlib
+from array import array
+from collections import Counter, OrderedDict
+
+# optional vectorized scoring backend, imported by _numeric() on first use:
+# numpy and scipy are most of this module's import time, and lexical
+# single queries never need them
+np = None
+sp = None
+_numeric_checked = False
+
+def _numeric():
+    # True if numpy and scipy are importable, importing them the first time
+    global np, sp, _numeric_checked
+    if not _numeric_checked:
+        try:
+            import numpy
+            import scipy.sparse
+            np, sp = numpy, scipy.sparse
+        except ImportError:
+            pass
+        _numeric_checked = True
+    return sp is not None
+
+# queries scored per sparse mat-mat product in query_many
+_BATCH_SIZE = 256
+
+# results kept per index by the query-result cache (0 turns it off)
+QUERY_CACHE_SIZE = int(os.environ.get("NEXUS_QUERY_CACHE_SIZE", 1024))
+
+# binary index file: header, a table of (offset, nbytes) per section, then
+# 8-byte aligned sections. Native byte order, like the arrays it is read
+# back into. save() writes a crc32 of everything after the header, which
+# load() only checks with verify=True: reading it would touch every page
+# of the mapping. A plain load checks the header and that each section
+# lies inside the file.
+_BIN_MAGIC = b"RAGX"
+_BIN_VERSION = 4
+_BIN_HEADER = struct.Struct("=4sII4x")  # magic, version, crc32 of the rest
+_BIN_SECTIONS = (
+    ("term_offsets", "Q"),   # n_terms + 1 offsets into term_blob
+    ("term_blob", "B"),      # utf-8 tokens, sorted by their bytes
+    ("df", "I"),             # per term
+    ("max_count", "I"),      # per term, bm25 upper bound input
+    ("min_len", "I"),        # per term, bm25 upper bound input
+    ("post_offsets", "Q"),   # n_terms + 1 offsets into post_ids/post_counts
+    ("post_ids", "I"),       # chunk idx, ascending within a term
+    ("post_counts", "I"),    # term count in the chunk
+    ("norms", "d"),          # per chunk
+    ("chunk_maxf", "I"),     # per chunk, highest term count
+    ("chunk_len", "I"),      # per chunk, number of tokens
+    ("chunk_docs", "I"),     # per chunk, index into docs
+    ("chunk_start", "Q"),    # per chunk, byte offset of its span in its document's text
+    ("chunk_end", "Q"),
+    ("doc_offsets", "Q"),    # n_docs + 1 offsets into text_blob
+    ("text_blob", "B"),      # utf-8 document texts, in docs order
+    ("docs", "B"),           # utf-8 json list of doc ids
+)
+_BIN_TABLE = struct.Struct("=%dQ" % (2 * len(_BIN_SECTIONS)))
 
 def _tokenize(text):
     # simple whitespace + punctuation tokenizer, lowercase
@@ -11,77 +74,523 @@ def _tokenize(text):
     tokens = re.findall(r"\w+", text)
     return tokens
 
+_SENTENCE_GAP = re.compile(r'(?<=[.!?]) +')
+_LINE = re.compile(r'[^\n]+')
+
+def _paragraph_spans(text, start, end, max_chars):
+    # spans of the chunks of paragraph text[start:end]: whole if it fits,
+    # else sentences packed greedily up to max_chars
+    if end - start <= max_chars:
+        yield start, end
+        return
+    cur = None
+    sentence_start = start
+    for m in itertools.chain(_SENTENCE_GAP.finditer(text, start, end), [None]):
+        sentence_end = m.start() if m else end
+        if cur is None:
+            cur, cur_end = sentence_start, sentence_end
+        elif sentence_end - cur <= max_chars:
+            cur_end = sentence_end
+        else:
+            yield cur, cur_end
+            cur, cur_end = sentence_start, sentence_end
+        if m:
+            sentence_start = m.end()
+    yield cur, cur_end
+
+def _text_spans(text, max_chars):
+    # paragraphs are lines, stripped of surrounding whitespace
+    for m in _LINE.finditer(text):
+        line = m.group()
+        start = m.start() + len(line) - len(line.lstrip())
+        end = m.start() + len(line.rstrip())
+        if end > start:
+            yield from _paragraph_spans(text, start, end, max_chars)
+
+def iter_chunk_spans(pieces, max_chars=800):
+    # incremental chunker over a stream of text pieces (pages, paragraphs,
+    # blocks): yields (start, end, chunk) with chunk == text[start:end] for
+    # text = "".join(pieces), while only buffering the paragraph that is
+    # still open. Chunks are verbatim slices of the text, so they can be
+    # stored as offsets into it.
+    pending = []
+    base = 0  # offset of pending[0] in the stream
+    for piece in pieces:
+        last = piece.rfind("\n")
+        if last < 0:
+            pending.append(piece)
+            continue
+        pending.append(piece[:last])
+        text = "".join(pending)
+        for start, end in _text_spans(text, max_chars):
+            yield base + start, base + end, text[start:end]
+        base += len(text) + 1
+        pending = [piece[last+1:]]
+    text = "".join(pending)
+    for start, end in _text_spans(text, max_chars):
+        yield base + start, base + end, text[start:end]
+
+def iter_chunks(pieces, max_chars=800):
+    # chunk texts of iter_chunk_spans
+    for _, _, chunk in iter_chunk_spans(pieces, max_chars):
+        yield chunk
+
 def chunk_text(text, max_chars=800):
     # naive chunking by sentences/line breaks preserving words
-    paragraphs = re.split(r'\n+', text)
-    chunks = []
-    for p in paragraphs:
-        p = p.strip()
-        if not p:
-            continue
-        if len(p) <= max_chars:
-            chunks.append(p)
-        else:
-            # split by sentences
-            parts = re.split(r'(?<=[.!?]) +', p)
-            cur = ""
-            for s in parts:
-                if len(cur) + len(s) + 1 <= max_chars:
-                    cur = (cur + " " + s).strip()
-                else:
-                    if cur:
-                        chunks.append(cur)
-                    cur = s
-            if cur:
-                chunks.append(cur)
-    return chunks
+    return list(iter_chunks([text], max_chars))
 
 class RAGIndex:
-    def __init__(self):
-        self.chunks = []  # list of strings
-        self.tfidf = []   # list of dict token->tfidf
-        self.idf = {}     # token->idf
-        self.vocab = set()
+    # engine: "python" scores via postings lists, "sparse" via a CSR matrix
+    # (needs numpy/scipy), "auto" uses postings for single queries and the
+    # matrix for query_many when scipy is installed.
+    #
+    # ranking: "tfidf" is max-tf tfidf cosine, "bm25" is Okapi BM25 scored
+    # with MaxScore pruning (always on the postings engine).
+    #
+    # Postings hold raw term counts, and idf is computed from the live
+    # document frequencies at query time, so adding or removing a document
+    # only touches that document's chunks. Chunk norms depend on the idf of
+    # every term, so an add or remove marks them stale and the next tf-idf
+    # query refreshes them all (compact() refreshes them too, and reclaims
+    # removed (tombstoned) chunks). Shards are queried with global stats
+    # and refresh theirs through compact(stats).
+    #
+    # Tokens are interned to integer term ids; everything per term and per
+    # chunk lives in typed arrays rather than dicts and tuples, which keeps
+    # the index to a few bytes per posting.
+    #
+    # Each document's text is stored once; a chunk is a (doc, start, end)
+    # span over it and its text is only sliced out when it is returned.
+    #
+    # retrieval: "lexical" ranks with the scorer above, "dense" by embedding
+    # similarity through an approximate nearest-neighbour index, "hybrid"
+    # fuses the two rankings (see dense.py; needs numpy and scipy). The
+    # dense index is built on the first such query after a change.
+    #
+    # A shard of a larger index (see shards.py) is queried and compacted
+    # with stats: term_stats() summed over every shard. Scores then match
+    # what one index holding all the chunks would give.
+    #
+    # Results are cached (LRU, cache_size entries) by the query's sorted
+    # token multiset and top_k: all the scorers see of a query. Every change
+    # bumps self.generation, which drops the cached results.
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, engine="auto", ranking="tfidf", retrieval="lexical", embedder=None,
+                 cache_size=QUERY_CACHE_SIZE):
+        if ranking not in ("tfidf", "bm25"):
+            raise ValueError("unknown ranking: %r" % ranking)
+        if retrieval not in ("lexical", "dense", "hybrid"):
+            raise ValueError("unknown retrieval: %r" % retrieval)
+        self.engine = engine
+        self.ranking = ranking
+        self.retrieval = retrieval
+        self.embedder = embedder  # dense.default_embedder() when first needed
+        self.cache_size = cache_size
+        self.generation = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache = OrderedDict()  # (query key, top_k)->results, valid for _cache_generation
+        self._cache_generation = 0
+        self._cache_lock = threading.Lock()
+        self._dense_lock = threading.Lock()  # one build when concurrent queries find no dense index
+        self._reset()
+
+    def _reset(self):
+        self.texts = _TextStore()       # doc id->document text
+        self.chunks = _ChunkView(self)  # chunk texts, sliced from texts on access
+        self.chunk_docs = []   # doc id of each chunk
+        self.span_start = array("Q")  # per chunk: offsets of its span in its document's text
+        self.span_end = array("Q")
+        self.vocab = {}        # token->term id
+        self.terms = []        # term id->token
+        self.df = array("I")         # term id->number of live chunks containing it
+        self.max_count = array("I")  # term id->highest count in its postings (bm25 bound)
+        self.min_len = array("I")    # term id->shortest chunk in its postings (bm25 bound)
+        self.post_ids = []     # term id->array of chunk idx, ascending
+        self.post_counts = []  # term id->array of counts, parallel to post_ids
+        # forward index: chunk idx i owns fwd_terms/fwd_counts[fwd_offsets[i]:fwd_offsets[i+1]],
+        # term ids in first-occurrence order
+        self.fwd_offsets = array("Q", [0])
+        self.fwd_terms = array("I")
+        self.fwd_counts = array("I")
+        self.norms = array("d")      # L2 norm of each chunk's tfidf vector
+        self._stale_norms = False    # norms predate the latest add or remove
+        self.doc_maxf = array("I")   # per chunk: highest term count
+        self.doc_len = array("I")    # per chunk: number of tokens
+        self.deleted = set()   # tombstoned chunk idx, reclaimed by compact()
+        self.n_live = 0
+        self.total_len = 0     # tokens in live chunks, for bm25 avgdl
+        self._docs = {}        # doc id->list of chunk idx
+        self._next_doc_id = 0
+        self._matrix = None    # (vocab x chunks) CSR of L2-normalized tfidf, rows are term ids
+        self._dense = None     # dense.DenseIndex over the live chunks
+        self._changed()
+
+    def _changed(self):
+        self._matrix = None
+        self._dense = None
+        self.generation += 1
+
+    def _idf(self, df, n=None):
+        if not df:
+            return math.log(2)  # fallback idf
+        N = max(1, self.n_live if n is None else n)
+        return math.log((N+1)/(df+1)) + 1
+
+    def _bm25_idf(self, df, n=None):
+        n = self.n_live if n is None else n
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def _term_df(self, tok, stats=None):
+        if stats is not None:
+            return stats["df"].get(tok, 0)
+        tid = self.vocab.get(tok)
+        return self.df[tid] if tid is not None else 0
+
+    def term_stats(self, tokens=None):
+        # live chunk and token counts, and the df of tokens (of every live
+        # term if None): one shard's part of the global stats
+        if tokens is None:
+            df = {self.terms[tid]: df for tid, df in enumerate(self.df) if df}
+        else:
+            df = {tok: self._term_df(tok) for tok in tokens}
+        return {"n": self.n_live, "total_len": self.total_len, "df": df}
+
+    def documents(self):
+        # ids of the live documents
+        return list(self._docs) if self.fwd_offsets is not None else list(self.texts)
+
+    @property
+    def idf(self):
+        return {self.terms[tid]: self._idf(df) for tid, df in enumerate(self.df) if df}
+
+    def _forward(self, idx):
+        lo, hi = self.fwd_offsets[idx], self.fwd_offsets[idx+1]
+        return zip(self.fwd_terms[lo:hi], self.fwd_counts[lo:hi])
+
+    def _norms_for(self, idxs, stats=None):
+        n = stats["n"] if stats else None
+        idf = {}
+        for idx in idxs:
+            maxf = self.doc_maxf[idx]
+            vec = []
+            for tid, c in self._forward(idx):
+                if tid not in idf:
+                    df = self.df[tid] if stats is None else self._term_df(self.terms[tid], stats)
+                    idf[tid] = self._idf(df, n)
+                vec.append((c / maxf) * idf[tid])
+            # same summation order as _cosine_sim so scores match bit for bit
+            yield math.sqrt(sum(v*v for v in vec))
 
     def build_from_texts(self, texts):
         # texts: list of strings (documents)
-        chunks = []
-        for t in texts:
-            chunks.extend(chunk_text(t))
-        self.chunks = chunks
-        # build token counts
-        doc_tokens = []
-        df = defaultdict(int)
-        for ch in chunks:
+        self._reset()
+        self.add_documents(texts)
+
+    def add_documents(self, texts, doc_id=None):
+        # chunk and index texts under doc_id; cost scales with the new text
+        return self.add_text(["\n".join(texts)], doc_id)
+
+    def add_text(self, pieces, doc_id=None, max_chars=800, clock=None):
+        # chunk and index a document streamed as text pieces (e.g. pages);
+        # the text is kept once, as doc_id's entry in self.texts. A
+        # telemetry.StageTimer as clock times chunking as the "chunk" stage.
+        collected = []
+        def tee():
+            for piece in pieces:
+                collected.append(piece)
+                yield piece
+        spans = iter_chunk_spans(tee(), max_chars)
+        if clock is not None:
+            spans = clock.timed("chunk", spans)
+        return self._add_spans(spans, lambda: "".join(collected), doc_id)
+
+    def add_chunks(self, chunks, doc_id=None):
+        # index already-chunked text, e.g. straight from iter_chunks; the
+        # document text is the chunks joined by newlines
+        parts = []
+        def spans():
+            pos = 0
+            for ch in chunks:
+                parts.append(ch)
+                yield pos, pos + len(ch), ch
+                pos += len(ch) + 1
+        return self._add_spans(spans(), lambda: "\n".join(parts), doc_id)
+
+    def _add_spans(self, spans, text, doc_id):
+        # spans: (start, end, chunk text) over the new text; text() gives
+        # that text once the spans are consumed. Adding to an existing
+        # document appends to its text.
+        self._thaw()
+        if doc_id is None:
+            while self._next_doc_id in self._docs:
+                self._next_doc_id += 1
+            doc_id = self._next_doc_id
+            self._next_doc_id += 1
+        if self.n_live:
+            # the new chunks change every term's idf, so the old norms
+            self._stale_norms = True
+        existing = self.texts.get(doc_id) if doc_id in self._docs else None
+        base = len(existing) + 1 if existing is not None else 0
+        vocab = self.vocab
+        df, max_count, min_len = self.df, self.max_count, self.min_len
+        new = []
+        for start, end, ch in spans:
+            idx = len(self.chunk_docs)
             toks = _tokenize(ch)
-            doc_tokens.append(toks)
-            for tok in set(toks):
-                df[tok] += 1
-            self.vocab.update(toks)
-        N = max(1, len(chunks))
-        self.idf = {tok: math.log((N+1)/(df[tok]+1)) + 1 for tok in df}
-        self.tfidf = []
-        for toks in doc_tokens:
             cnt = Counter(toks)
-            maxf = max(cnt.values()) if cnt else 1
-            vec = {}
+            length = len(toks)
             for tok, c in cnt.items():
-                tf = c / maxf
-                vec[tok] = tf * self.idf.get(tok, 0.0)
-            self.tfidf.append(vec)
+                tid = vocab.get(tok)
+                if tid is None:
+                    tid = vocab[tok] = len(self.terms)
+                    self.terms.append(tok)
+                    df.append(0)
+                    max_count.append(0)
+                    min_len.append(length)
+                    self.post_ids.append(array("I"))
+                    self.post_counts.append(array("I"))
+                self.post_ids[tid].append(idx)
+                self.post_counts[tid].append(c)
+                df[tid] += 1
+                if c > max_count[tid]:
+                    max_count[tid] = c
+                if length < min_len[tid]:
+                    min_len[tid] = length
+                self.fwd_terms.append(tid)
+                self.fwd_counts.append(c)
+            self.fwd_offsets.append(len(self.fwd_terms))
+            self.chunk_docs.append(doc_id)
+            self.span_start.append(base + start)
+            self.span_end.append(base + end)
+            self.doc_maxf.append(max(cnt.values()) if cnt else 1)
+            self.doc_len.append(length)
+            self.n_live += 1
+            self.total_len += length
+            new.append(idx)
+        self.texts[doc_id] = text() if existing is None else existing + "\n" + text()
+        self._docs.setdefault(doc_id, []).extend(new)
+        self.norms.extend(self._norms_for(new))
+        self._changed()
+        return doc_id
+
+    def remove_document(self, doc_id):
+        # tombstone the document's chunks; their space is reclaimed by compact()
+        self._thaw()
+        idxs = self._docs.pop(doc_id)
+        for idx in idxs:
+            self.deleted.add(idx)
+            for tid, _ in self._forward(idx):
+                self.df[tid] -= 1
+            self.n_live -= 1
+            self.total_len -= self.doc_len[idx]
+        self._stale_norms = True
+        self._changed()
+        return len(idxs)
+
+    def compact(self, stats=None):
+        # drop tombstoned chunks and unused terms, renumber, and reweight
+        # norms with current idf (global idf from stats, for a shard)
+        self._thaw()
+        live_terms = [tid for tid, df in enumerate(self.df) if df]
+        if self.deleted or len(live_terms) < len(self.terms):
+            keep = [i for i in range(len(self.chunks)) if i not in self.deleted]
+            remap = {old: new for new, old in enumerate(keep)}
+            tid_map = {old: new for new, old in enumerate(live_terms)}
+            post_ids, post_counts = [], []
+            for tid in live_terms:
+                ids, counts = array("I"), array("I")
+                for idx, c in zip(self.post_ids[tid], self.post_counts[tid]):
+                    new = remap.get(idx)
+                    if new is not None:
+                        ids.append(new)
+                        counts.append(c)
+                post_ids.append(ids)
+                post_counts.append(counts)
+            fwd_offsets, fwd_terms, fwd_counts = array("Q", [0]), array("I"), array("I")
+            for idx in keep:
+                for tid, c in self._forward(idx):
+                    fwd_terms.append(tid_map[tid])
+                    fwd_counts.append(c)
+                fwd_offsets.append(len(fwd_terms))
+            self.terms = [self.terms[tid] for tid in live_terms]
+            self.vocab = {tok: tid for tid, tok in enumerate(self.terms)}
+            self.df = array("I", (self.df[tid] for tid in live_terms))
+            self.post_ids, self.post_counts = post_ids, post_counts
+            self.fwd_offsets, self.fwd_terms, self.fwd_counts = fwd_offsets, fwd_terms, fwd_counts
+            self.chunk_docs = [self.chunk_docs[i] for i in keep]
+            self.span_start = array("Q", (self.span_start[i] for i in keep))
+            self.span_end = array("Q", (self.span_end[i] for i in keep))
+            self.doc_maxf = array("I", (self.doc_maxf[i] for i in keep))
+            self.doc_len = array("I", (self.doc_len[i] for i in keep))
+            self._docs = {d: [remap[i] for i in idxs] for d, idxs in self._docs.items()}
+            self._bounds_from_postings()
+        for d in [d for d in self.texts if d not in self._docs]:
+            del self.texts[d]
+        reclaimed = len(self.deleted)
+        self.deleted = set()
+        self.norms = array("d", self._norms_for(range(len(self.chunks)), stats))
+        self._stale_norms = False
+        self._changed()
+        return reclaimed
+
+    def _refresh_norms(self):
+        # recompute chunk norms with the current idf if an add or remove
+        # changed it; results cached before that change are already dropped
+        if self._stale_norms:
+            self.norms = array("d", self._norms_for(range(len(self.chunks))))
+            self._matrix = None
+            self._stale_norms = False
+
+    def _thaw(self):
+        # a mapped index is read-only; copy it into arrays and a vocab dict
+        # on first write
+        if self.fwd_offsets is not None:
+            return
+        n_terms = len(self.terms)
+        self.terms = [self.terms[tid] for tid in range(n_terms)]
+        self.vocab = {tok: tid for tid, tok in enumerate(self.terms)}
+        self.post_ids = [_copy_array("I", self.post_ids[tid]) for tid in range(n_terms)]
+        self.post_counts = [_copy_array("I", self.post_counts[tid]) for tid in range(n_terms)]
+        rows = [[] for _ in range(len(self.chunks))]
+        for tid in range(n_terms):
+            for idx, c in zip(self.post_ids[tid], self.post_counts[tid]):
+                rows[idx].append((tid, c))
+        self.fwd_offsets, self.fwd_terms, self.fwd_counts = array("Q", [0]), array("I"), array("I")
+        for row in rows:
+            for tid, c in row:
+                self.fwd_terms.append(tid)
+                self.fwd_counts.append(c)
+            self.fwd_offsets.append(len(self.fwd_terms))
+        self.df = _copy_array("I", self.df)
+        self.max_count = _copy_array("I", self.max_count)
+        self.min_len = _copy_array("I", self.min_len)
+        # spans in the file are utf-8 byte offsets; in memory they index the str
+        mapped = self.texts
+        self.texts = _TextStore()
+        self.chunk_docs = list(self.chunk_docs)
+        by_doc = {}
+        for idx, d in enumerate(self.chunk_docs):
+            by_doc.setdefault(d, []).append(idx)
+        span_start = array("Q", [0]) * len(self.chunk_docs)
+        span_end = array("Q", [0]) * len(self.chunk_docs)
+        for d in mapped:
+            data = mapped.data(d)
+            self.texts[d] = str(data, "utf-8")
+            idxs = by_doc.get(d, [])
+            starts = _char_offsets(data, [self.span_start[i] for i in idxs])
+            ends = _char_offsets(data, [self.span_end[i] for i in idxs])
+            for i, start, end in zip(idxs, starts, ends):
+                span_start[i] = start
+                span_end[i] = end
+        self.span_start, self.span_end = span_start, span_end
+        self.norms = _copy_array("d", self.norms)
+        self.doc_maxf = _copy_array("I", self.doc_maxf)
+        self.doc_len = _copy_array("I", self.doc_len)
+        self._docs = {}
+        for idx, d in enumerate(self.chunk_docs):
+            self._docs.setdefault(d, []).append(idx)
+
+    def _bounds_from_postings(self):
+        doc_len = self.doc_len
+        self.max_count = array("I", (max(counts) for counts in self.post_counts))
+        self.min_len = array("I", (min(doc_len[idx] for idx in ids) for ids in self.post_ids))
+
+    def save(self, path, stats=None):
+        # binary format (see _BIN_SECTIONS); tombstones are reclaimed first.
+        # Written to a temp file and renamed so processes mapping the old
+        # file keep a consistent view.
+        self.compact(stats)
+        order = sorted(range(len(self.terms)), key=lambda tid: self.terms[tid].encode("utf-8"))
+        sections = {name: array(code) for name, code in _BIN_SECTIONS}
+        term_blob = bytearray()
+        sections["term_offsets"].append(0)
+        sections["post_offsets"].append(0)
+        for tid in order:
+            term_blob += self.terms[tid].encode("utf-8")
+            sections["term_offsets"].append(len(term_blob))
+            sections["df"].append(self.df[tid])
+            sections["max_count"].append(self.max_count[tid])
+            sections["min_len"].append(self.min_len[tid])
+            sections["post_ids"].extend(self.post_ids[tid])
+            sections["post_counts"].extend(self.post_counts[tid])
+            sections["post_offsets"].append(len(sections["post_ids"]))
+        sections["norms"] = self.norms
+        sections["chunk_maxf"] = self.doc_maxf
+        sections["chunk_len"] = self.doc_len
+        docs = list(self._docs)
+        doc_pos = {d: i for i, d in enumerate(docs)}
+        sections["chunk_docs"].extend(doc_pos[d] for d in self.chunk_docs)
+        # document texts, with chunk spans converted to utf-8 byte offsets
+        text_blob = bytearray()
+        chunk_start = array("Q", [0]) * len(self.chunk_docs)
+        chunk_end = array("Q", [0]) * len(self.chunk_docs)
+        sections["doc_offsets"].append(0)
+        for d in docs:
+            text = self.texts[d]
+            idxs = self._docs[d]
+            starts = _utf8_offsets(text, [self.span_start[i] for i in idxs])
+            ends = _utf8_offsets(text, [self.span_end[i] for i in idxs])
+            for i, start, end in zip(idxs, starts, ends):
+                chunk_start[i] = start
+                chunk_end[i] = end
+            text_blob += text.encode("utf-8")
+            sections["doc_offsets"].append(len(text_blob))
+        sections["chunk_start"] = chunk_start
+        sections["chunk_end"] = chunk_end
+        sections["term_blob"] = term_blob
+        sections["text_blob"] = text_blob
+        sections["docs"] = json.dumps(docs, ensure_ascii=False).encode("utf-8")
 
-    def save(self, path):
-        data = {"chunks": self.chunks, "idf": self.idf}
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False)
+        body = bytearray()
+        table = []
+        start = _BIN_HEADER.size + _BIN_TABLE.size
+        for name, _ in _BIN_SECTIONS:
+            body += b"\0" * (-(start + len(body)) % 8)
+            data = bytes(sections[name])
+            table += [start + len(body), len(data)]
+            body += data
+        payload = _BIN_TABLE.pack(*table) + body
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(_BIN_HEADER.pack(_BIN_MAGIC, _BIN_VERSION, zlib.crc32(payload)))
+            f.write(payload)
+        os.replace(tmp, path)
 
-    def load(self, path):
+    def load(self, path, verify=False):
+        # verify: also check the binary file's checksum, reading all of it
+        with open(path, "rb") as f:
+            magic = f.read(len(_BIN_MAGIC))
+        if magic == _BIN_MAGIC:
+            mapped = _MappedIndex(path, verify)
+            self._reset()
+            self.texts = mapped.texts
+            self.chunk_docs = mapped.chunk_docs
+            self.span_start = mapped.chunk_start
+            self.span_end = mapped.chunk_end
+            # term ids are positions in the file's sorted vocabulary
+            self.vocab = mapped.terms
+            self.terms = mapped.terms
+            self.df = mapped.df
+            self.max_count = mapped.max_count
+            self.min_len = mapped.min_len
+            self.post_ids = mapped.post_ids
+            self.post_counts = mapped.post_counts
+            self.norms = mapped.norms
+            self.doc_maxf = mapped.doc_maxf
+            self.doc_len = mapped.doc_len
+            self.n_live = len(mapped.chunk_docs)
+            self.total_len = sum(mapped.doc_len)
+            # no forward index in the file; rebuilt by _thaw() on first write
+            self.fwd_offsets = self.fwd_terms = self.fwd_counts = None
+            return
+        # legacy rag_index.json: chunks + idf only
         with open(path, "r", encoding="utf-8") as f:
             data = json.load(f)
-        self.chunks = data.get("chunks", [])
-        self.idf = data.get("idf", {})
         # rebuild tfidf
-        self.build_from_texts(self.chunks)
+        self.build_from_texts(data.get("chunks", []))
 
     def _cosine_sim(self, vec1, vec2):
         # vecs are token->weight dicts
@@ -94,45 +603,644 @@ class RAGIndex:
             return 0.0
         return num / (norm1 * norm2)
 
-    def query(self, q, top_k=3):
+    def _query_vector(self, q, stats=None):
         qtokens = _tokenize(q)
         cnt = Counter(qtokens)
         maxf = max(cnt.values()) if cnt else 1
+        n = stats["n"] if stats else None
         qvec = {}
         for tok,c in cnt.items():
             tf = c / maxf
-            qvec[tok] = tf * self.idf.get(tok, math.log(2))  # fallback idf
+            qvec[tok] = tf * self._idf(self._term_df(tok, stats), n)
+        return qvec
+
+    def _use_sparse(self, batch):
+        if self.ranking == "bm25" or self.engine == "python":
+            return False
+        if self.engine != "sparse" and not batch:
+            return False
+        if not _numeric():
+            if self.engine == "sparse":
+                raise ImportError("the sparse engine needs numpy and scipy")
+            return False
+        return True
+
+    def _results(self, top, top_k):
+        # live chunks without a shared token score 0.0; pad with them in order
+        if len(top) < top_k:
+            seen = set(idx for idx, _ in top)
+            for idx in range(len(self.chunks)):
+                if len(top) >= top_k:
+                    break
+                if idx not in seen and idx not in self.deleted:
+                    top.append((idx, 0.0))
+        return [self._result(idx, score) for idx, score in top]
+
+    def _result(self, idx, score):
+        doc, start, end = self.passage(idx)
+        return {"chunk": self.chunks[idx], "score": score, "doc": doc, "start": start, "end": end}
+
+    def _chunk_text(self, idx):
+        return self.texts.slice(self.chunk_docs[idx], self.span_start[idx], self.span_end[idx])
+
+    def passage(self, idx):
+        # (doc id, start, end) of chunk idx: character offsets into
+        # self.texts[doc id], for citations and highlighting
+        doc = self.chunk_docs[idx]
+        return (doc, self.texts.char_offset(doc, self.span_start[idx]),
+                self.texts.char_offset(doc, self.span_end[idx]))
+
+    def _cache_key(self, q, top_k):
+        # embedders that read the raw text see more than the tokens
+        if self.retrieval != "lexical" and getattr(self._embedder(), "reads_text", False):
+            return (q, top_k)
+        return (tuple(sorted(_tokenize(q))), top_k)
+
+    def _cache_get(self, key):
+        with self._cache_lock:
+            if self._cache_generation != self.generation:
+                self._cache.clear()
+                self._cache_generation = self.generation
+            results = self._cache.get(key)
+            if results is None:
+                self.cache_misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return [dict(r) for r in results]
+
+    def _cache_put(self, key, generation, results):
+        # generation: self.generation when the results were computed
+        with self._cache_lock:
+            if generation != self.generation or self._cache_generation != generation:
+                return
+            self._cache[key] = [dict(r) for r in results]
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def cache_stats(self):
+        # query-result cache hits, misses, hit rate and entries
+        with self._cache_lock:
+            lookups = self.cache_hits + self.cache_misses
+            return {
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+                "hit_rate": self.cache_hits / lookups if lookups else 0.0,
+                "entries": len(self._cache),
+                "generation": self.generation,
+            }
+
+    def query(self, q, top_k=3, stats=None):
+        # a shard's results depend on the global stats, so are not cached
+        if stats is not None or not self.cache_size:
+            return self._query(q, top_k, stats)
+        generation = self.generation
+        key = self._cache_key(q, top_k)
+        results = self._cache_get(key)
+        if results is None:
+            results = self._query(q, top_k)
+            self._cache_put(key, generation, results)
+        return results
+
+    def _query(self, q, top_k, stats=None):
+        if self.retrieval != "lexical":
+            return self._results(self._dense_top(q, top_k), top_k)
+        if self.ranking == "bm25":
+            return self._results(self._bm25_top(q, top_k, stats), top_k)
+        if stats is None and self._use_sparse(batch=False):
+            return self._query_many([q], top_k)[0]
+        return self._results(self._tfidf_top(q, top_k, stats), top_k)
+
+    def _tfidf_top(self, q, top_k, stats=None):
+        # score only chunks sharing a token with the query, via the postings
+        if stats is None:
+            self._refresh_norms()
+        qvec = self._query_vector(q, stats)
+        n = stats["n"] if stats else None
+        qnorm = math.sqrt(sum(v*v for v in qvec.values()))
+        dead = self.deleted
+        maxf = self.doc_maxf
+        acc = {}
+        for tok, qw in qvec.items():
+            tid = self.vocab.get(tok)
+            if tid is None:
+                continue
+            idf = self._idf(self.df[tid] if stats is None else self._term_df(tok, stats), n)
+            for idx, c in zip(self.post_ids[tid], self.post_counts[tid]):
+                if idx not in dead:
+                    acc[idx] = acc.get(idx, 0.0) + qw * ((c / maxf[idx]) * idf)
         sims = []
-        for i, docvec in enumerate(self.tfidf):
-            sims.append((i, self._cosine_sim(qvec, docvec)))
-        sims.sort(key=lambda x: x[1], reverse=True)
+        if qnorm:
+            for idx in sorted(acc):
+                dnorm = self.norms[idx]
+                sims.append((idx, acc[idx] / (qnorm * dnorm) if dnorm else 0.0))
+        # nlargest is stable, so ties keep chunk order like the full sort did
+        return heapq.nlargest(top_k, sims, key=lambda x: x[1])
+
+    def _sparse_matrix(self):
+        self._refresh_norms()
+        if self._matrix is None:
+            n_terms = len(self.terms)
+            lens = np.fromiter((len(self.post_ids[tid]) for tid in range(n_terms)), dtype=np.int64, count=n_terms)
+            rows = np.repeat(np.arange(n_terms), lens)
+            if n_terms:
+                cols = np.concatenate([np.asarray(self.post_ids[tid], dtype=np.int64) for tid in range(n_terms)])
+                counts = np.concatenate([np.asarray(self.post_counts[tid], dtype=np.float64) for tid in range(n_terms)])
+            else:
+                cols, counts = np.zeros(0, dtype=np.int64), np.zeros(0)
+            idf = np.array([self._idf(df) for df in self.df], dtype=np.float64)
+            maxf = np.asarray(self.doc_maxf, dtype=np.float64)
+            norms = np.asarray(self.norms, dtype=np.float64)
+            # same operation order as the postings engine
+            vals = (counts / maxf[cols]) * idf[rows] / norms[cols]
+            if self.deleted:
+                live = np.ones(len(self.chunks), dtype=bool)
+                live[list(self.deleted)] = False
+                keep = live[cols]
+                rows, cols, vals = rows[keep], cols[keep], vals[keep]
+            self._matrix = sp.csr_matrix((vals, (rows, cols)), shape=(n_terms, len(self.chunks)))
+        return self._matrix
+
+    def query_many(self, queries, top_k=3, stats=None):
+        # score a batch of queries; cached ones are answered from the cache
+        queries = list(queries)
+        if stats is not None or not self.cache_size:
+            return self._query_many(queries, top_k, stats)
+        generation = self.generation
+        keys = [self._cache_key(q, top_k) for q in queries]
+        results = [self._cache_get(key) for key in keys]
+        misses = [i for i, r in enumerate(results) if r is None]
+        if misses:
+            for i, r in zip(misses, self._query_many([queries[i] for i in misses], top_k)):
+                self._cache_put(keys[i], generation, r)
+                results[i] = r
+        return results
+
+    def _query_many(self, queries, top_k, stats=None):
+        # one sparse product per _BATCH_SIZE queries
+        if stats is not None or self.retrieval != "lexical" or not self._use_sparse(batch=True):
+            return [self._query(q, top_k, stats) for q in queries]
+        matrix = self._sparse_matrix()
         results = []
-        for idx, score in sims[:top_k]:
-            results.append({"chunk": self.chunks[idx], "score": score})
+        for start in range(0, len(queries), _BATCH_SIZE):
+            batch = queries[start:start + _BATCH_SIZE]
+            rows, cols, vals = [], [], []
+            for r, q in enumerate(batch):
+                qvec = self._query_vector(q)
+                qnorm = math.sqrt(sum(v*v for v in qvec.values()))
+                if not qnorm:
+                    continue
+                for tok, qw in qvec.items():
+                    j = self.vocab.get(tok)
+                    if j is not None:
+                        rows.append(r)
+                        cols.append(j)
+                        vals.append(qw / qnorm)
+            qmat = sp.csr_matrix((vals, (rows, cols)), shape=(len(batch), matrix.shape[0]))
+            scores = (qmat @ matrix).tocsr()
+            for r in range(len(batch)):
+                lo, hi = scores.indptr[r], scores.indptr[r+1]
+                idxs, sims = scores.indices[lo:hi], scores.data[lo:hi]
+                if len(sims) > top_k:
+                    part = np.argpartition(-sims, top_k - 1)[:top_k]
+                    idxs, sims = idxs[part], sims[part]
+                order = np.lexsort((idxs, -sims))
+                top = [(int(idxs[i]), float(sims[i])) for i in order if sims[i] > 0]
+                results.append(self._results(top, top_k))
         return results
 
+    def _bm25_terms(self, q, stats=None):
+        # (term id, query count, idf, upper bound on its per-chunk score)
+        n = self.n_live if stats is None else stats["n"]
+        total_len = self.total_len if stats is None else stats["total_len"]
+        avgdl = total_len / max(1, n)
+        k1, b = self.k1, self.b
+        terms = []
+        for tok, qc in Counter(_tokenize(q)).items():
+            tid = self.vocab.get(tok)
+            if tid is None or not self.df[tid]:
+                continue
+            idf = self._bm25_idf(self.df[tid] if stats is None else self._term_df(tok, stats), n)
+            maxc, minlen = self.max_count[tid], self.min_len[tid]
+            bound = idf * maxc * (k1 + 1) / (maxc + k1 * (1 - b + b * minlen / avgdl))
+            terms.append((tid, qc, idf, qc * bound))
+        return terms, avgdl
+
+    def _bm25_top(self, q, top_k, stats=None):
+        # MaxScore: terms sorted by upper bound; once the top_k threshold
+        # exceeds the summed bounds of the weakest terms, those terms only
+        # score chunks found through the stronger ("essential") terms and
+        # their postings are skipped into by binary search.
+        if top_k <= 0:
+            return []
+        terms, avgdl = self._bm25_terms(q, stats)
+        terms.sort(key=lambda t: t[3])
+        k1, b = self.k1, self.b
+        doc_len = self.doc_len
+        dead = self.deleted
+        ids = [self.post_ids[t[0]] for t in terms]
+        counts = [self.post_counts[t[0]] for t in terms]
+        pos = [0] * len(terms)
+        prefix = []  # prefix[i]: summed bounds of terms[0..i]
+        total = 0.0
+        for t in terms:
+            total += t[3]
+            prefix.append(total)
+
+        def contrib(i, c, idx):
+            _, qc, idf, _ = terms[i]
+            return qc * idf * c * (k1 + 1) / (c + k1 * (1 - b + b * doc_len[idx] / avgdl))
+
+        heap = []  # (score, -idx), weakest result on top
+        threshold = 0.0
+        first = 0  # terms[first:] are essential
+        while True:
+            while first < len(terms) and prefix[first] <= threshold:
+                first += 1
+            cand = None
+            for i in range(first, len(terms)):
+                if pos[i] < len(ids[i]):
+                    idx = ids[i][pos[i]]
+                    if cand is None or idx < cand:
+                        cand = idx
+            if cand is None:
+                break
+            score = 0.0
+            for i in range(first, len(terms)):
+                if pos[i] < len(ids[i]) and ids[i][pos[i]] == cand:
+                    score += contrib(i, counts[i][pos[i]], cand)
+                    pos[i] += 1
+            if cand in dead:
+                continue
+            for i in range(first - 1, -1, -1):
+                if score + prefix[i] <= threshold:
+                    break
+                pos[i] = bisect.bisect_left(ids[i], cand, lo=pos[i])
+                if pos[i] < len(ids[i]) and ids[i][pos[i]] == cand:
+                    score += contrib(i, counts[i][pos[i]], cand)
+            if score <= threshold:
+                continue
+            if len(heap) < top_k:
+                heapq.heappush(heap, (score, -cand))
+            else:
+                heapq.heapreplace(heap, (score, -cand))
+            if len(heap) == top_k:
+                threshold = heap[0][0]
+        return sorted(((-neg, score) for score, neg in heap), key=lambda x: (-x[1], x[0]))
+
+    def _dense_index(self):
+        if self._dense is None:
+            if not _numeric():
+                raise ImportError("dense retrieval needs numpy and scipy")
+            import dense
+            with self._dense_lock:
+                if self._dense is None:
+                    live = np.ones(len(self.chunk_docs), dtype=bool)
+                    live[list(self.deleted)] = False
+                    self._dense = dense.DenseIndex(self._embedder().embed_index(self), live)
+        return self._dense
+
+    def _embedder(self):
+        if self.embedder is None:
+            import dense
+            self.embedder = dense.default_embedder()
+        return self.embedder
+
+    def _dense_top(self, q, top_k, exact=False):
+        # dense ranking, or in hybrid mode its RRF fusion with the lexical one
+        import dense
+        index = self._dense_index()
+        search = index.search_exact if exact else index.search
+        qvec = self.embedder.embed_query(self, q)
+        if self.retrieval == "dense":
+            return search(qvec, top_k)
+        depth = max(top_k, dense.FUSE_DEPTH)
+        if exact:
+            lexical = [(idx, score) for idx, score in self._exhaustive_top(q, depth) if score > 0]
+        elif self.ranking == "bm25":
+            lexical = self._bm25_top(q, depth)
+        else:
+            lexical = self._tfidf_top(q, depth)
+        return dense.rrf([lexical, search(qvec, depth)], top_k)
+
+    def _query_exhaustive(self, q, top_k=3):
+        # brute-force reference scorer: every live chunk is scored, and the
+        # dense side searches every vector
+        if self.retrieval != "lexical":
+            return self._results(self._dense_top(q, top_k, exact=True), top_k)
+        return [self._result(idx, score) for idx, score in self._exhaustive_top(q, top_k)]
+
+    def _exhaustive_top(self, q, top_k):
+        self._thaw()
+        sims = []
+        if self.ranking == "bm25":
+            terms, avgdl = self._bm25_terms(q)
+            k1, b = self.k1, self.b
+            for i in range(len(self.chunks)):
+                if i in self.deleted:
+                    continue
+                counts = dict(self._forward(i))
+                score = 0.0
+                for tid, qc, idf, _ in terms:
+                    c = counts.get(tid, 0)
+                    if c:
+                        score += qc * idf * c * (k1 + 1) / (c + k1 * (1 - b + b * self.doc_len[i] / avgdl))
+                sims.append((i, score))
+        else:
+            qvec = self._query_vector(q)
+            for i in range(len(self.chunks)):
+                if i in self.deleted:
+                    continue
+                maxf = self.doc_maxf[i]
+                docvec = {self.terms[tid]: (c / maxf) * self._idf(self.df[tid]) for tid, c in self._forward(i)}
+                sims.append((i, self._cosine_sim(qvec, docvec)))
+        sims.sort(key=lambda x: x[1], reverse=True)
+        return sims[:top_k]
+
+def _copy_array(code, values):
+    # typed array copy of an array or memoryview, without per-item boxing
+    out = array(code)
+    out.frombytes(memoryview(values).cast("B"))
+    return out
+
+class _MappedIndex:
+    # read-only views over a binary index file opened with mmap; pages are
+    # shared between every process that maps the same file
+    def __init__(self, path, verify=False):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mm
+        if len(mm) < _BIN_HEADER.size + _BIN_TABLE.size:
+            raise ValueError("truncated index file: %s" % path)
+        magic, version, crc = _BIN_HEADER.unpack_from(mm, 0)
+        if magic != _BIN_MAGIC or version != _BIN_VERSION:
+            raise ValueError("unsupported index file version %r: %s" % (version, path))
+        if verify and zlib.crc32(memoryview(mm)[_BIN_HEADER.size:]) != crc:
+            raise ValueError("index file checksum mismatch: %s" % path)
+        table = _BIN_TABLE.unpack_from(mm, _BIN_HEADER.size)
+        views = {}
+        for i, (name, code) in enumerate(_BIN_SECTIONS):
+            start, nbytes = table[2*i], table[2*i + 1]
+            if (start < _BIN_HEADER.size + _BIN_TABLE.size or start + nbytes > len(mm)
+                    or nbytes % array(code).itemsize):
+                raise ValueError("corrupt index file, bad %s section: %s" % (name, path))
+            views[name] = memoryview(mm)[start:start + nbytes].cast(code)
+        self.terms = _MappedTerms(views["term_offsets"], views["term_blob"])
+        docs = json.loads(str(views["docs"], "utf-8"))
+        self.texts = _MappedTextStore(docs, views["doc_offsets"], views["text_blob"])
+        self.chunk_docs = _MappedDocIds(views["chunk_docs"], docs)
+        self.chunk_start = views["chunk_start"]
+        self.chunk_end = views["chunk_end"]
+        self.df = views["df"]
+        self.max_count = views["max_count"]
+        self.min_len = views["min_len"]
+        self.post_ids = _Slices(views["post_offsets"], views["post_ids"])
+        self.post_counts = _Slices(views["post_offsets"], views["post_counts"])
+        self.norms = views["norms"]
+        self.doc_maxf = views["chunk_maxf"]
+        self.doc_len = views["chunk_len"]
+
+class _Slices:
+    # item i is values[offsets[i]:offsets[i+1]], a zero-copy view
+    __slots__ = ("_offsets", "_values")
+
+    def __init__(self, offsets, values):
+        self._offsets = offsets
+        self._values = values
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        return self._values[self._offsets[i]:self._offsets[i+1]]
+
+class _ChunkView:
+    # the chunk texts of an index as a read-only sequence
+    __slots__ = ("_index",)
+
+    def __init__(self, index):
+        self._index = index
+
+    def __len__(self):
+        return len(self._index.chunk_docs)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._index._chunk_text(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._index._chunk_text(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._index._chunk_text(i)
+
+class _TextStore(dict):
+    # doc id->document text; spans are character offsets
+    def slice(self, doc, start, end):
+        return self[doc][start:end]
+
+    def char_offset(self, doc, offset):
+        return offset
+
+    def nbytes(self):
+        return sum(len(text) for text in self.values())
+
+class _MappedTextStore:
+    # document texts in the mapped file; spans are utf-8 byte offsets, so a
+    # chunk is decoded straight from the mapped pages
+    __slots__ = ("_pos", "_offsets", "_blob")
+
+    def __init__(self, docs, offsets, blob):
+        self._pos = {d: i for i, d in enumerate(docs)}
+        self._offsets = offsets
+        self._blob = blob
+
+    def data(self, doc):
+        i = self._pos[doc]
+        return self._blob[self._offsets[i]:self._offsets[i+1]]
+
+    def slice(self, doc, start, end):
+        base = self._offsets[self._pos[doc]]
+        return str(self._blob[base + start:base + end], "utf-8")
+
+    def char_offset(self, doc, offset):
+        return len(self.slice(doc, 0, offset))
+
+    def nbytes(self):
+        return len(self._blob)
+
+    def __getitem__(self, doc):
+        return str(self.data(doc), "utf-8")
+
+    def get(self, doc, default=None):
+        return self[doc] if doc in self._pos else default
+
+    def __contains__(self, doc):
+        return doc in self._pos
+
+    def __iter__(self):
+        return iter(self._pos)
+
+    def __len__(self):
+        return len(self._pos)
+
+    def values(self):
+        for doc in self._pos:
+            yield self[doc]
+
+    def items(self):
+        for doc in self._pos:
+            yield doc, self[doc]
+
+def _utf8_offsets(text, offsets):
+    # utf-8 byte offset of each character offset into text
+    if text.isascii():
+        return list(offsets)
+    byte = {}
+    pos = n = 0
+    for off in sorted(set(offsets)):
+        n += len(text[pos:off].encode("utf-8"))
+        pos = off
+        byte[off] = n
+    return [byte[off] for off in offsets]
+
+def _char_offsets(data, offsets):
+    # inverse of _utf8_offsets over the encoded text
+    char = {}
+    pos = n = 0
+    for off in sorted(set(offsets)):
+        n += len(str(data[pos:off], "utf-8"))
+        pos = off
+        char[off] = n
+    return [char[off] for off in offsets]
+
+class _MappedDocIds:
+    __slots__ = ("_positions", "_docs")
+
+    def __init__(self, positions, docs):
+        self._positions = positions
+        self._docs = docs
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __getitem__(self, i):
+        return self._docs[self._positions[i]]
+
+    def __iter__(self):
+        for pos in self._positions:
+            yield self._docs[pos]
+
+class _MappedTerms:
+    # sorted vocabulary, looked up by binary search instead of a dict so
+    # opening the file does no per-term work. Serves as both vocab
+    # (token->term id via get) and terms (term id->token via [])
+    __slots__ = ("_offsets", "_blob")
+
+    def __init__(self, offsets, blob):
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self._blob[self._offsets[i]:self._offsets[i+1]], "utf-8")
+
+    def get(self, tok, default=None):
+        key = tok.encode("utf-8")
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._blob[self._offsets[mid]:self._offsets[mid+1]].tobytes() < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self) and self._blob[self._offsets[lo]:self._offsets[lo+1]] == key:
+            return lo
+        return default
+
+# --- context assembly ---
+def estimate_tokens(text):
+    # rough model-token count: ~4 characters per token for English text
+    return max(1, len(text) // 4)
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def pack_context(passages, budget_tokens, mmr_lambda=None, dedup_threshold=0.9):
+    # passages: retrieval results ({"chunk", "score"}), best first. Returns
+    # the passages to place in the prompt: greedily packed into budget_tokens,
+    # skipping near-duplicates (token-set jaccard >= dedup_threshold) of a
+    # passage already packed. With mmr_lambda, candidates are taken in
+    # maximal-marginal-relevance order (lambda * relevance - (1 - lambda) *
+    # similarity to what is already packed) instead of score order.
+    cands = []
+    top = max((p.get("score", 0.0) for p in passages), default=0.0)
+    for i, p in enumerate(passages):
+        # relevance normalized to [0, 1]; rank-based when there are no scores
+        rel = p["score"] / top if top and "score" in p else 1.0 - i / len(passages)
+        cands.append((p, set(_tokenize(p["chunk"])), estimate_tokens(p["chunk"]), rel))
+    packed, packed_toks = [], []
+    used = 0
+    while cands:
+        if mmr_lambda is None:
+            best = 0
+        else:
+            best = max(range(len(cands)), key=lambda i: mmr_lambda * cands[i][3] - (1 - mmr_lambda) *
+                       max((_jaccard(cands[i][1], t) for t in packed_toks), default=0.0))
+        p, toks, cost, _ = cands.pop(best)
+        if used + cost > budget_tokens:
+            continue
+        if any(_jaccard(toks, t) >= dedup_threshold for t in packed_toks):
+            continue
+        packed.append(p)
+        packed_toks.append(toks)
+        used += cost
+    return packed
+
 # convenience single-file index
 _index = None
-_index_path = os.path.join(os.path.dirname(__file__), "rag_index.json")
+_index_path = os.path.join(os.path.dirname(__file__), "rag_index.bin")
+_legacy_index_path = os.path.join(os.path.dirname(__file__), "rag_index.json")
+# comma-separated shard files (each served by a worker process) and shard
+# servers (host:port); when set the index is a shards.ShardedIndex
+_shard_specs = [s.strip() for s in os.environ.get("NEXUS_RAG_SHARDS", "").split(",") if s.strip()]
 
 def get_index():
     global _index
+    if _index is None and _shard_specs:
+        import shards
+        _index = shards.open_shards(_shard_specs)
     if _index is None:
         _index = RAGIndex()
-        if os.path.exists(_index_path):
-            try:
-                _index.load(_index_path)
-            except Exception:
-                pass
+        # stale or corrupt binary files are rejected; fall back to the old json
+        for path in (_index_path, _legacy_index_path):
+            if os.path.exists(path):
+                try:
+                    _index.load(path)
+                    break
+                except Exception:
+                    _index = RAGIndex()
     return _index
 
 def build_index_from_texts(texts, save=True):
     idx = get_index()
     idx.build_from_texts(texts)
     if save:
-        idx.save(_index_path)
+        # shards each save to their own file
+        idx.save() if _shard_specs else idx.save(_index_path)
     return idx
 
 def retrieve(query, top_k=3):
     idx = get_index()
     return idx.query(query, top_k=top_k)
+
+def retrieve_many(queries, top_k=3):
+    idx = get_index()
+    return idx.query_many(queries, top_k=top_k)
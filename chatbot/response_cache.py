@@ -0,0 +1,125 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Two-tier cache for model and translation responses: an in-process LRU in
+# front of a SQLite file shared by every worker on the host. Entries carry
+# the latency of the call that produced them, so hits can report the time
+# they saved.
+
+DEFAULT_PATH = os.environ.get(
+    "NEXUS_RESPONSE_CACHE", os.path.join(os.path.dirname(__file__), "response_cache.sqlite3"))
+
+def normalize_prompt(text):
+    """Case- and whitespace-insensitive form of a prompt."""
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+def make_key(prompt, context=(), lang="english"):
+    """Cache key from the normalized prompt, the hashes of the context passages and the language."""
+    h = hashlib.sha256()
+    h.update(normalize_prompt(prompt).encode("utf-8"))
+    for passage in context:
+        h.update(b"\0")
+        h.update(hashlib.sha256(passage.encode("utf-8")).digest())
+    h.update(b"\0" + lang.encode("utf-8"))
+    return h.hexdigest()
+
+class ResponseCache:
+    """In-process LRU over a SQLite store, with TTL and size-based eviction."""
+
+    def __init__(self, path=DEFAULT_PATH, memory_entries=512, disk_entries=50000, ttl=7 * 24 * 3600):
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.ttl = ttl
+        self._memory = OrderedDict()  # key->(value, created, latency)
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT, created REAL, accessed REAL, latency REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._puts = 0
+
+    def get(self, key):
+        """Cached value for key, or None on a miss or an expired entry."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                self.saved_seconds += entry[2]
+                return entry[0]
+            self._memory.pop(key, None)
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created, latency FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None and now - row[1] < self.ttl:
+                    self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                    self._remember(key, row)
+                    self.disk_hits += 1
+                    self.saved_seconds += row[2]
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, latency=0.0):
+        """Stores value; latency is the call time a later hit saves."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, (value, now, latency))
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                    (key, value, now, now, latency))
+                self._puts += 1
+                if self._puts % 64 == 0:
+                    self._evict_disk(now)
+
+    def get_or_call(self, key, fn):
+        """Cached value for key, else fn()'s result, which is then cached."""
+        value = self.get(key)
+        if value is None:
+            start = time.perf_counter()
+            value = fn()
+            self.put(key, value, time.perf_counter() - start)
+        return value
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, now):
+        self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        (count,) = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()
+        if count > self.disk_entries:
+            # drop the least recently used tenth beyond the cap in one pass
+            excess = count - self.disk_entries + self.disk_entries // 10
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY accessed LIMIT ?)", (excess,))
+
+    def stats(self):
+        """Hit/miss counters, hit rate and total latency saved by hits."""
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "saved_seconds": self.saved_seconds,
+        }
@@ -0,0 +1,368 @@
+import os
+import random
+import threading
+import time
+from contextlib import closing, contextmanager
+
+import requests
+
+import telemetry
+from gemini_client import GeminiError
+
+# Every session's model calls go through one Scheduler per process, which
+# wraps the GeminiClient with the same generate()/stream_generate()
+# interface and:
+#
+# - coalesces identical in-flight prompts (single flight): the second
+#   session asking the same thing waits on the first call instead of making
+#   its own, and a joined stream replays what has arrived so far, then
+#   follows along
+# - caps concurrent upstream calls; callers past the cap queue for a slot
+#   and fail with a 503 after NEXUS_GEMINI_QUEUE_TIMEOUT seconds
+# - spaces call starts with a token bucket (NEXUS_GEMINI_RPS sustained,
+#   NEXUS_GEMINI_BURST at once)
+# - retries 429s, 5xx and connection errors with jittered exponential
+#   backoff, waiting at least as long as Retry-After says; a 429 also holds
+#   back the token bucket so other callers don't pile onto the limit.
+#   Streams are only retried before their first piece.
+#
+# Queue depth, in-flight calls and retries are exported as gauges and the
+# wait for a slot as the "model_queue" stage on /metrics.
+
+RATE = float(os.environ.get("NEXUS_GEMINI_RPS", 5))  # 0 turns rate limiting off
+BURST = int(os.environ.get("NEXUS_GEMINI_BURST", 10))
+CONCURRENCY = int(os.environ.get("NEXUS_GEMINI_CONCURRENCY", 8))
+RETRIES = int(os.environ.get("NEXUS_GEMINI_RETRIES", 4))
+BACKOFF = float(os.environ.get("NEXUS_GEMINI_BACKOFF", 0.5))  # first retry's max delay, seconds
+QUEUE_TIMEOUT = float(os.environ.get("NEXUS_GEMINI_QUEUE_TIMEOUT", 60))
+
+# longest single backoff, seconds, unless Retry-After asks for more
+MAX_BACKOFF = 30.0
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class QueueTimeout(GeminiError):
+    """Raised when a call waited QUEUE_TIMEOUT seconds without getting a slot."""
+    def __init__(self, waited):
+        super().__init__(503, f"model call queue full, gave up after {waited:.1f}s")
+
+class TokenBucket:
+    """rate tokens per second, at most burst saved up; callers reserve a token and sleep until it is theirs."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)  # negative when callers are waiting for tokens
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Takes one token, sleeping until it is available; returns the seconds waited."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def hold(self, seconds):
+        """Gives out no new tokens for the next seconds (e.g. a 429's Retry-After)."""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+class _Flight:
+    """One in-flight generate() call, awaited by the callers that coalesced onto it."""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def finish(self, result=None, error=None):
+        self.result, self.error = result, error
+        self._done.set()
+
+    def wait(self):
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+class _SharedStream:
+    """One upstream stream read by any number of subscribers, each from the first piece.
+
+    Whichever subscriber is furthest along pulls the next piece from the
+    source; the others replay the pieces already read. When every
+    subscriber has left early the source is closed.
+    """
+
+    def __init__(self, source, on_close):
+        self._source = source
+        self._on_close = on_close
+        self._pieces = []
+        self._done = False
+        self._error = None
+        self._read_lock = threading.Lock()  # held while pulling from the source
+        self._lock = threading.Lock()
+        self._subscribers = 0
+        self._closed = False
+
+    def join(self):
+        """A generator over the stream, or None if it has already closed."""
+        with self._lock:
+            if self._closed:
+                return None
+            self._subscribers += 1
+        return self._read()
+
+    def _read(self):
+        i = 0
+        try:
+            while True:
+                if i < len(self._pieces):
+                    i += 1
+                    yield self._pieces[i - 1]
+                    continue
+                with self._read_lock:
+                    if i < len(self._pieces):
+                        continue
+                    if self._error is not None:
+                        raise self._error
+                    if self._done:
+                        return
+                    try:
+                        piece = next(self._source)
+                    except StopIteration:
+                        self._finish()
+                        return
+                    except BaseException as e:
+                        self._finish(e)
+                        raise
+                    self._pieces.append(piece)
+        finally:
+            self._leave()
+
+    def _finish(self, error=None):
+        # the source ended: nobody new may join, since late joiners would
+        # only get a replay of a reply that may be stale or an error
+        self._done = True
+        self._error = error
+        with self._lock:
+            self._closed = True
+        self._on_close(self)
+
+    def _leave(self):
+        with self._lock:
+            self._subscribers -= 1
+            if self._subscribers or self._closed:
+                return
+            self._closed = True
+        with self._read_lock:
+            self._source.close()
+        self._on_close(self)
+
+class Scheduler:
+    """GeminiClient front end adding single flight, a concurrency cap, rate limiting and retries."""
+
+    def __init__(self, client, rate=RATE, burst=BURST, concurrency=CONCURRENCY, retries=RETRIES,
+                 backoff=BACKOFF, queue_timeout=QUEUE_TIMEOUT):
+        self.client = client
+        self.bucket = TokenBucket(rate, burst)
+        self.retries = retries
+        self.backoff = backoff
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self._flights = {}  # ("generate"|"stream", prompt)->_Flight or _SharedStream
+        self.queued = 0
+        self.in_flight = 0
+        self.calls = 0
+        self.upstream_calls = 0
+        self.coalesced = 0
+        self.retried = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.granted = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def register_metrics(self):
+        """Exports queue depth, in-flight calls and retry counts through telemetry."""
+        telemetry.gauge("nexus_model_queue_depth", "Model calls waiting for a slot.", lambda: self.queued)
+        telemetry.gauge("nexus_model_in_flight", "Model calls in progress upstream.", lambda: self.in_flight)
+        telemetry.gauge("nexus_model_coalesced_total", "Calls answered by an identical in-flight call.",
+                        lambda: self.coalesced, "counter")
+        telemetry.gauge("nexus_model_retries_total", "Upstream attempts retried after an error.",
+                        lambda: self.retried, "counter")
+        telemetry.gauge("nexus_model_throttled_total", "Upstream 429 responses.",
+                        lambda: self.throttled, "counter")
+        telemetry.gauge("nexus_model_rejected_total", "Calls that timed out waiting for a slot.",
+                        lambda: self.rejected, "counter")
+
+    @contextmanager
+    def _slot(self):
+        # holds one of the concurrency slots, queueing for it if need be
+        start = time.perf_counter()
+        with self._lock:
+            self.queued += 1
+        acquired = False
+        try:
+            acquired = self._slots.acquire(timeout=self.queue_timeout)
+        finally:
+            waited = time.perf_counter() - start
+            with self._lock:
+                self.queued -= 1
+                if not acquired:
+                    self.rejected += 1
+        if not acquired:
+            raise QueueTimeout(waited)
+        telemetry.record("model_queue", waited)
+        with self._lock:
+            self.in_flight += 1
+            self.granted += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def _start_attempt(self):
+        self.bucket.acquire()
+        with self._lock:
+            self.upstream_calls += 1
+
+    def _retry_delay(self, error, attempt):
+        # seconds to wait before retrying after error, or None to give up
+        if attempt >= self.retries:
+            return None
+        retry_after = None
+        if isinstance(error, GeminiError):
+            if error.status_code not in RETRY_STATUS:
+                return None
+            retry_after = error.retry_after
+            if error.status_code == 429:
+                with self._lock:
+                    self.throttled += 1
+                if retry_after:
+                    self.bucket.hold(retry_after)
+        # full jitter: uniform over [0, backoff * 2^attempt]
+        delay = random.uniform(0, min(MAX_BACKOFF, self.backoff * 2 ** attempt))
+        with self._lock:
+            self.retried += 1
+        return max(delay, retry_after or 0.0)
+
+    def _generate(self, prompt):
+        with self._slot():
+            attempt = 0
+            while True:
+                self._start_attempt()
+                try:
+                    return self.client.generate(prompt)
+                except (GeminiError, requests.ConnectionError, requests.Timeout) as e:
+                    delay = self._retry_delay(e, attempt)
+                    if delay is None:
+                        raise
+                attempt += 1
+                time.sleep(delay)
+
+    def _stream(self, prompt):
+        # the slot is taken on the first next(), and released when the
+        # stream ends or is closed
+        with self._slot():
+            attempt = 0
+            while True:
+                self._start_attempt()
+                started = False
+                try:
+                    with closing(self.client.stream_generate(prompt)) as pieces:
+                        for piece in pieces:
+                            started = True
+                            yield piece
+                    return
+                except (GeminiError, requests.ConnectionError, requests.Timeout) as e:
+                    delay = None if started else self._retry_delay(e, attempt)
+                    if delay is None:
+                        raise
+                attempt += 1
+                time.sleep(delay)
+
+    def generate(self, prompt):
+        """Sends one prompt and returns the model's text, sharing an identical call in flight."""
+        key = ("generate", prompt)
+        with self._lock:
+            self.calls += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return flight.wait()
+        try:
+            result = self._generate(prompt)
+        except BaseException as e:
+            flight.finish(error=e)
+            raise
+        else:
+            flight.finish(result)
+            return result
+        finally:
+            with self._lock:
+                del self._flights[key]
+
+    def stream_generate(self, prompt):
+        """Yields the model's text as it arrives, sharing an identical stream in flight."""
+        key = ("stream", prompt)
+        with self._lock:
+            self.calls += 1
+            shared = self._flights.get(key)
+            pieces = shared.join() if shared is not None else None
+            if pieces is not None:
+                self.coalesced += 1
+            else:
+                shared = self._flights[key] = _SharedStream(self._stream(prompt), self._forget(key))
+                pieces = shared.join()
+        return pieces
+
+    def _forget(self, key):
+        # callback dropping a finished stream from the flights, unless a
+        # newer one has replaced it
+        def forget(shared):
+            with self._lock:
+                if self._flights.get(key) is shared:
+                    del self._flights[key]
+        return forget
+
+    def stats(self):
+        """The client's stats plus queue, coalescing and retry counters."""
+        out = self.client.stats()
+        with self._lock:
+            out.update({
+                "requests": self.calls,
+                "upstream_calls": self.upstream_calls,
+                "coalesced": self.coalesced,
+                "retries": self.retried,
+                "throttled": self.throttled,
+                "rejected": self.rejected,
+                "queued": self.queued,
+                "in_flight": self.in_flight,
+                "mean_queue_wait_ms": 1000 * self.wait_seconds / self.granted if self.granted else 0.0,
+                "max_queue_wait_ms": 1000 * self.max_wait_seconds,
+            })
+        return out
+
+    def close(self):
+        self.client.close()
@@ -0,0 +1,314 @@
+import argparse
+import heapq
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client, Listener
+
+from rag import RAGIndex, _tokenize
+
+# Sharded RAG index: documents are partitioned across N RAGIndex shards by a
+# hash of their id, and queries are scattered to every shard concurrently
+# and the per-shard top-k gathered into one ranking. Each query takes two
+# rounds: the shards first report their live counts and the query terms'
+# document frequencies, and the sums are sent back with the query so every
+# shard scores with the global idf (compact() does the same for chunk
+# norms). Scores match one index holding all the chunks.
+#
+# A shard is either a RAGIndex in this process (LocalShard) or one served
+# by another process over a socket (RemoteShard), e.g. the worker processes
+# spawn_workers() starts, one per shard file, so queries use every core:
+#
+#   index = shards.spawn_workers(["shard0.bin", "shard1.bin"])
+#   index.query("termination clause", top_k=5)
+#
+# Shards on other nodes are served with
+#
+#   python shards.py serve shard0.bin --address 0.0.0.0:7100
+#
+# and listed in NEXUS_RAG_SHARDS as host:port (see rag.get_index). Requests
+# are authenticated with NEXUS_SHARD_AUTHKEY; set the same value on every
+# node. Spawned workers get a random key of their own.
+
+AUTHKEY = os.environ.get("NEXUS_SHARD_AUTHKEY", "").encode("utf-8") or None
+
+# how long a RemoteShard waits for a starting shard server to listen, seconds
+CONNECT_TIMEOUT = 30.0
+
+def parse_address(address):
+    """("host", port) for "host:port", the path for "unix:PATH", else None."""
+    if address.startswith("unix:"):
+        return address[len("unix:"):]
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return (host or "localhost", int(port))
+    return None
+
+class LocalShard:
+    """A RAGIndex in this process, behind the same call() interface as a remote shard."""
+
+    def __init__(self, index, path=None):
+        self.index = index
+        self.path = path
+        self._lock = threading.Lock()
+
+    def call(self, op, *args):
+        with self._lock:
+            return getattr(self, "_op_" + op)(*args)
+
+    def close(self):
+        pass
+
+    def _op_stats(self, tokens):
+        return self.index.term_stats(tokens)
+
+    def _op_query(self, q, top_k, stats):
+        return self.index.query(q, top_k=top_k, stats=stats)
+
+    def _op_query_many(self, queries, top_k, stats):
+        return self.index.query_many(queries, top_k=top_k, stats=stats)
+
+    def _op_add_text(self, pieces, doc_id):
+        return self.index.add_text(pieces, doc_id=doc_id)
+
+    def _op_remove_document(self, doc_id):
+        return self.index.remove_document(doc_id)
+
+    def _op_documents(self):
+        return self.index.documents()
+
+    def _op_compact(self, stats):
+        return self.index.compact(stats)
+
+    def _op_save(self, stats):
+        if not self.path:
+            raise ValueError("shard has no file to save to")
+        self.index.save(self.path, stats)
+
+    def _op_reset(self):
+        self.index._reset()
+
+class RemoteShard:
+    """A shard served by serve() in another process or on another node."""
+
+    def __init__(self, address, authkey=AUTHKEY, timeout=CONNECT_TIMEOUT):
+        self.address = address
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self._conn = Client(address, authkey=authkey)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+        self._lock = threading.Lock()
+
+    def call(self, op, *args):
+        with self._lock:
+            self._conn.send((op, args))
+            status, value = self._conn.recv()
+        if status == "error":
+            raise value
+        return value
+
+    def close(self):
+        self._conn.close()
+
+def serve(path, address, ranking="tfidf", authkey=AUTHKEY):
+    """Serves the index file at path (created on first save if missing) until the process ends."""
+    index = RAGIndex(ranking=ranking)
+    if os.path.exists(path):
+        index.load(path)
+    shard = LocalShard(index, path)
+    with Listener(address, authkey=authkey) as listener:
+        while True:
+            try:
+                conn = listener.accept()
+            except multiprocessing.AuthenticationError:
+                continue
+            threading.Thread(target=_serve_connection, args=(shard, conn), daemon=True).start()
+
+def _serve_connection(shard, conn):
+    with conn:
+        while True:
+            try:
+                op, args = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                reply = ("ok", shard.call(op, *args))
+            except Exception as e:
+                reply = ("error", e)
+            conn.send(reply)
+
+class ShardedIndex:
+    """RAGIndex-like front end scattering each call over its shards."""
+
+    def __init__(self, shards, ranking="tfidf"):
+        if not shards:
+            raise ValueError("a sharded index needs at least one shard")
+        self.shards = list(shards)
+        self.ranking = ranking
+        self._pool = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix="shard")
+        self._lock = threading.Lock()
+        self._next_doc_id = None
+        self._workers = []  # processes started by spawn_workers, stopped by close()
+        self._tmpdir = None
+
+    def _fan_out(self, op, *args):
+        # the same call on every shard, concurrently; results in shard order
+        futures = [self._pool.submit(shard.call, op, *args) for shard in self.shards]
+        return [f.result() for f in futures]
+
+    def shard_of(self, doc_id):
+        """Index of the shard holding doc_id."""
+        return zlib.crc32(json.dumps(doc_id).encode("utf-8")) % len(self.shards)
+
+    def term_stats(self, tokens=None):
+        """Global stats: every shard's term_stats summed."""
+        total = {"n": 0, "total_len": 0, "df": {}}
+        for stats in self._fan_out("stats", tokens):
+            total["n"] += stats["n"]
+            total["total_len"] += stats["total_len"]
+            df = total["df"]
+            for tok, n in stats["df"].items():
+                df[tok] = df.get(tok, 0) + n
+        return total
+
+    def _new_doc_id(self):
+        with self._lock:
+            if self._next_doc_id is None:
+                ids = [d for docs in self._fan_out("documents") for d in docs if isinstance(d, int)]
+                self._next_doc_id = max(ids) + 1 if ids else 0
+            doc_id = self._next_doc_id
+            self._next_doc_id += 1
+            return doc_id
+
+    def build_from_texts(self, texts):
+        """Replaces the contents with texts, each its own document so they spread over the shards."""
+        self._fan_out("reset")
+        self._next_doc_id = None
+        for text in texts:
+            self.add_documents([text])
+        self.compact()
+
+    def add_documents(self, texts, doc_id=None):
+        return self.add_text(["\n".join(texts)], doc_id)
+
+    def add_text(self, pieces, doc_id=None):
+        """Chunks and indexes a document on its shard; returns its id."""
+        if doc_id is None:
+            doc_id = self._new_doc_id()
+        return self.shards[self.shard_of(doc_id)].call("add_text", list(pieces), doc_id)
+
+    def remove_document(self, doc_id):
+        return self.shards[self.shard_of(doc_id)].call("remove_document", doc_id)
+
+    def documents(self):
+        return [d for docs in self._fan_out("documents") for d in docs]
+
+    def compact(self):
+        """Compacts every shard, with chunk norms from the global idf."""
+        return sum(self._fan_out("compact", self.term_stats()))
+
+    def save(self):
+        """Compacts and saves every shard to its own file."""
+        self._fan_out("save", self.term_stats())
+
+    def query(self, q, top_k=3):
+        return self.query_many([q], top_k=top_k)[0]
+
+    def query_many(self, queries, top_k=3):
+        """Top top_k results per query over all shards, best first; ties keep shard order."""
+        queries = list(queries)
+        tokens = sorted(set(tok for q in queries for tok in _tokenize(q)))
+        stats = self.term_stats(tokens)
+        per_shard = self._fan_out("query_many", queries, top_k, stats)
+        return [list(heapq.merge(*(results[i] for results in per_shard), key=lambda r: -r["score"]))[:top_k]
+                for i in range(len(queries))]
+
+    def close(self):
+        """Closes shard connections and stops spawned workers."""
+        for shard in self.shards:
+            shard.close()
+        self._pool.shutdown(wait=False)
+        for proc in self._workers:
+            proc.terminate()
+            proc.join()
+        self._workers = []
+        if self._tmpdir:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = None
+
+def open_local(paths, ranking="tfidf"):
+    """ShardedIndex over the shard files at paths, all memory-mapped in this process."""
+    shards = []
+    for path in paths:
+        index = RAGIndex(ranking=ranking)
+        if os.path.exists(path):
+            index.load(path)
+        shards.append(LocalShard(index, path))
+    return ShardedIndex(shards, ranking)
+
+def open_shards(specs, ranking="tfidf", authkey=AUTHKEY):
+    """ShardedIndex over shard servers ("host:port", "unix:PATH") and shard files, each file
+    served by a worker process spawned here."""
+    shards, workers = [], []
+    tmpdir = None
+    worker_key = os.urandom(32)
+    ctx = multiprocessing.get_context("spawn")
+    try:
+        for spec in specs:
+            address = parse_address(spec)
+            if address is not None:
+                if authkey is None:
+                    raise ValueError("set NEXUS_SHARD_AUTHKEY to connect to shard servers")
+                shards.append(RemoteShard(address, authkey))
+                continue
+            tmpdir = tmpdir or tempfile.mkdtemp(prefix="nexus_shards_")
+            address = os.path.join(tmpdir, "shard%d.sock" % len(workers))
+            proc = ctx.Process(target=serve, args=(os.path.abspath(spec), address, ranking, worker_key), daemon=True)
+            proc.start()
+            workers.append(proc)
+            shards.append(RemoteShard(address, worker_key))
+    except BaseException:
+        for proc in workers:
+            proc.terminate()
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+        raise
+    index = ShardedIndex(shards, ranking)
+    index._workers = workers
+    index._tmpdir = tmpdir
+    return index
+
+def spawn_workers(paths, ranking="tfidf"):
+    """ShardedIndex over the shard files at paths, each served by its own worker process."""
+    return open_shards(paths, ranking)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a RAG index shard over a socket.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    srv = sub.add_parser("serve", help="serve one shard file")
+    srv.add_argument("path", help="shard index file, created on first save if missing")
+    srv.add_argument("--address", required=True, help="host:port or unix:PATH")
+    srv.add_argument("--ranking", default="tfidf", choices=["tfidf", "bm25"])
+    args = parser.parse_args(argv)
+    if AUTHKEY is None:
+        parser.error("set NEXUS_SHARD_AUTHKEY (the same value on every node)")
+    address = parse_address(args.address)
+    if address is None:
+        parser.error("--address must be host:port or unix:PATH")
+    serve(args.path, address, args.ranking)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import argparse
+import io
+import os
+import sys
+import threading
+
+import ingest
+import pipeline
+from rag import RAGIndex
+
+# Index snapshot baked into the Docker image. Documents put in
+# snapshot_docs/ are indexed once at build time:
+#
+#   python snapshot.py build snapshot_docs --out index_snapshot.bin
+#
+# and every session starts with that index instead of an empty one, until
+# it uploads its own files. The file is memory-mapped, so all sessions and
+# processes share one copy and loading it costs no parsing. The parts of
+# the index built lazily on the first query (the dense vectors, the sparse
+# matrix) are built by a background warm-up as soon as it is loaded.
+
+SNAPSHOT_PATH = os.environ.get(
+    "NEXUS_INDEX_SNAPSHOT", os.path.join(os.path.dirname(os.path.abspath(__file__)), "index_snapshot.bin"))
+
+# Only files with these extensions are indexed. A README or other note
+# next to the documents would otherwise be sniffed as text/plain wherever
+# the system has no MIME database for its extension (e.g. python:*-slim).
+SNAPSHOT_EXTENSIONS = ('.pdf', '.docx', '.txt', '.csv')
+
+def collect(paths):
+    """(name, bytes) of every file under paths with one of SNAPSHOT_EXTENSIONS and an extractor, in path
+    order."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+        else:
+            found = [path]
+        for file_path in found:
+            if not file_path.lower().endswith(SNAPSHOT_EXTENSIONS):
+                continue
+            with open(file_path, "rb") as f:
+                data = f.read()
+            file = io.BytesIO(data)
+            file.name = os.path.basename(file_path)
+            if ingest.supported(ingest.detect_file_type(file)):
+                files.append((os.path.relpath(file_path, path) if os.path.isdir(path) else file.name, data))
+    return files
+
+def build(paths, out=SNAPSHOT_PATH):
+    """Indexes the supported files under paths and saves the index to out; returns the Document, or None if
+    there were no files."""
+    files = collect(paths)
+    if not files:
+        return None
+    document = pipeline.build_document(files)
+    document.index.save(out)
+    # loads skip the checksum, so check the file once here
+    RAGIndex().load(out, verify=True)
+    return document
+
+def warm(document):
+    """Builds the index's lazy parts with a throwaway query."""
+    document.index.query("warm up", top_k=1)
+
+def load(path=SNAPSHOT_PATH):
+    """The snapshot at path as a Document, warming up in the background; None if there is no snapshot."""
+    if not os.path.exists(path):
+        return None
+    document = pipeline.load_document(path)
+    threading.Thread(target=warm, args=(document,), daemon=True).start()
+    return document
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the index snapshot bundled into the app image.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bld = sub.add_parser("build", help="index documents into a snapshot file")
+    bld.add_argument("paths", nargs="+", help="files or directories of documents")
+    bld.add_argument("--out", default=SNAPSHOT_PATH)
+    args = parser.parse_args(argv)
+    document = build(args.paths, args.out)
+    if document is None:
+        print("no supported documents; no snapshot built", file=sys.stderr)
+        return 0
+    print(f"indexed {len(document.index.texts)} document(s), ~{document.tokens:,} tokens, into {args.out}",
+          file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
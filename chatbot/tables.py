@@ -0,0 +1,287 @@
+import csv
+import io
+import mimetypes
+import os
+import re
+import threading
+import weakref
+from array import array
+
+# CSV uploads as tables rather than text. iter_csv streams the file through
+# pandas.read_csv(chunksize=...), so extraction holds one read chunk at a
+# time however large the file (the index built from it still grows with
+# the table, by far the most for columns of distinct ids), and packs rows
+# into row groups of about CSV_CHUNK_CHARS that each repeat the header line:
+#
+#   rows 1-12
+#   id,name,country
+#   1,Alice,France
+#   ...
+#
+# build_document indexes each group as one chunk, so a retrieved passage
+# carries its column names. Alongside the RAGIndex, ColumnIndex maps each
+# column's values to the row groups holding them, so filter-style questions
+# ("orders shipped to France") are answered by lookup instead of by
+# similarity. Columns with more than MAX_COLUMN_VALUES distinct values (ids,
+# free text) are not indexed, and a value keeps at most MAX_VALUE_GROUPS
+# row groups, which keeps the lookup small next to the text itself. Rows
+# matching several named values are counted by reading the row groups that
+# can hold them, at most MAX_SCAN_GROUPS per question.
+
+TABLE_TYPES = ('text/csv',)
+
+CSV_CHUNK_CHARS = int(os.environ.get("NEXUS_CSV_CHUNK_CHARS", 800))
+CSV_READ_ROWS = int(os.environ.get("NEXUS_CSV_READ_ROWS", 50_000))
+MAX_COLUMN_VALUES = int(os.environ.get("NEXUS_CSV_MAX_VALUES", 10_000))
+MAX_VALUE_GROUPS = int(os.environ.get("NEXUS_CSV_MAX_VALUE_GROUPS", 1_000))
+MAX_SCAN_GROUPS = int(os.environ.get("NEXUS_CSV_MAX_SCAN_GROUPS", 5_000))
+
+# values longer than this many words are text, not something filtered on
+_MAX_VALUE_WORDS = 4
+# Everyday words that are often cell values too ("open", "new", "yes").
+# A question using one rarely means the cell, so values made only of them
+# count only when their column is named as well.
+_COMMON_WORDS = frozenset("""
+a about after all also am an and any are as at available back bad be been before best big both but by
+can closed could current day did do does done down each early end every false few first for free from
+full good great had has have he her here high him his how i if in is it its just large last late least
+left less like long low made main make many may me more most much must my new next no none normal not
+now of off old on once one only open or other our out over own part past right same see
+she should small so some start still such than that the their them then there these they this those
+to today top true under up us use used very was we well were what when where which while who why will
+with would yes yet you your
+""".split())
+# merging lookup hits with retrieval by reciprocal rank, as dense.rrf does
+_RRF_K = 60
+_GROUP_HEADER = re.compile(r'rows (\d+)-(\d+)\n')
+_WORD = re.compile(r'\w+')
+
+def is_table(doc_id):
+    """Whether doc_id (a file name) is indexed as row groups."""
+    return mimetypes.guess_type(str(doc_id))[0] in TABLE_TYPES
+
+def _csv_line(writer, buf, row):
+    buf.seek(0)
+    buf.truncate()
+    writer.writerow(row)
+    return buf.getvalue()
+
+def _csv_lines(frame, writer, buf):
+    # frame's rows as csv lines; one to_csv call unless some field needed
+    # quoting, in which case lines can't be split apart on newlines
+    text = frame.to_csv(index=False, header=False, lineterminator="\n")
+    if '"' not in text:
+        return [line + "\n" for line in text.split("\n")[:-1]]
+    return [_csv_line(writer, buf, values) for values in frame.itertuples(index=False, name=None)]
+
+def iter_csv(file, on_progress=None):
+    """Yields a CSV file as header-annotated row groups, newline terminated."""
+    import pandas as pd
+    file.seek(0, 2)
+    total = file.tell()
+    file.seek(0)
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    try:
+        reader = pd.read_csv(file, chunksize=CSV_READ_ROWS, dtype=str, keep_default_na=False,
+                             encoding_errors="replace", on_bad_lines="skip")
+    except pd.errors.EmptyDataError:
+        return
+    row = 0
+    with reader:
+        for frame in reader:
+            header = _csv_line(writer, buf, frame.columns)
+            group, size, first = [], 0, row + 1
+            for line in _csv_lines(frame, writer, buf):
+                if group and size + len(line) > CSV_CHUNK_CHARS:
+                    yield f"rows {first}-{row}\n{header}{''.join(group)}"
+                    group, size, first = [], 0, row + 1
+                group.append(line)
+                size += len(line)
+                row += 1
+            if group:
+                yield f"rows {first}-{row}\n{header}{''.join(group)}"
+            _report(on_progress, file.tell(), total)
+
+def _report(on_progress, done, total):
+    if on_progress is not None:
+        on_progress(done, total)
+
+def normalize(value):
+    """value as lowercase words joined by single spaces, the form values are looked up in."""
+    return " ".join(_WORD.findall(value.lower()))
+
+class _Column:
+    __slots__ = ("name", "values", "rows")
+
+    def __init__(self, name):
+        self.name = name
+        self.values = {}  # normalized value->array of chunk idx, ascending; None once over the cap
+        self.rows = {}    # normalized value->matching rows
+
+class ColumnIndex:
+    """Per-column value->row group index over the table documents of a RAGIndex."""
+
+    def __init__(self):
+        self.tables = {}  # doc id->list of _Column
+        self.groups = {}  # doc id->array of its row group chunk idx
+        self._by_value = {}  # normalized value->set of (doc id, column position)
+
+    def add_chunk(self, doc, idx, text):
+        """Indexes row group chunk idx of table doc; chunks that aren't row groups are skipped."""
+        m = _GROUP_HEADER.match(text)
+        if m is None:
+            return
+        rows = csv.reader(io.StringIO(text[m.end():]))
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = self.tables.get(doc)
+        if columns is None:
+            columns = self.tables[doc] = [_Column(name) for name in header]
+            self.groups[doc] = array("I")
+        self.groups[doc].append(idx)
+        for row in rows:
+            for pos, (column, value) in enumerate(zip(columns, row)):
+                if column.values is None:
+                    continue
+                key = normalize(value)
+                if not key or key.count(" ") >= _MAX_VALUE_WORDS:
+                    continue
+                groups = column.values.get(key)
+                if groups is None:
+                    if len(column.values) >= MAX_COLUMN_VALUES:
+                        self._drop(doc, pos, column)
+                        continue
+                    groups = column.values[key] = array("I")
+                    self._by_value.setdefault(key, set()).add((doc, pos))
+                if (not groups or groups[-1] != idx) and len(groups) < MAX_VALUE_GROUPS:
+                    groups.append(idx)
+                column.rows[key] = column.rows.get(key, 0) + 1
+
+    def _drop(self, doc, pos, column):
+        # too many distinct values to be a filter column
+        for key in column.values:
+            owners = self._by_value[key]
+            owners.discard((doc, pos))
+            if not owners:
+                del self._by_value[key]
+        column.values = None
+        column.rows = None
+
+    def matches(self, question):
+        """(doc id, column position, value) for each indexed value named in question.
+
+        Numeric values, and values made only of common words, only count
+        when their column is named too, since a bare number or "open" in a
+        question rarely means a cell.
+        """
+        words = _WORD.findall(question.lower())
+        text = " ".join(words)
+        found = []
+        seen = set()
+        for n in range(_MAX_VALUE_WORDS, 0, -1):
+            for i in range(len(words) - n + 1):
+                key = " ".join(words[i:i+n])
+                for doc, pos in self._by_value.get(key, ()):
+                    column = self.tables[doc][pos]
+                    if (doc, pos, key) in seen:
+                        continue
+                    if key.replace(" ", "").isdigit() or len(key) < 2 or _COMMON_WORDS.issuperset(key.split()):
+                        name = normalize(column.name)
+                        if not name or not re.search(r'\b%s\b' % re.escape(name), text):
+                            continue
+                    seen.add((doc, pos, key))
+                    found.append((doc, pos, key))
+        return found
+
+_columns = weakref.WeakKeyDictionary()  # RAGIndex->(generation, ColumnIndex)
+_columns_lock = threading.Lock()
+
+def column_index(index):
+    """The ColumnIndex of index's table documents, built from its chunks once per index generation."""
+    with _columns_lock:
+        cached = _columns.get(index)
+        if cached is not None and cached[0] == index.generation:
+            return cached[1]
+        generation = index.generation
+        columns = ColumnIndex()
+        tables = {doc for doc in index.texts if is_table(doc)}
+        if tables:
+            for idx, doc in enumerate(index.chunk_docs):
+                if doc in tables and idx not in index.deleted:
+                    columns.add_chunk(doc, idx, index.chunks[idx])
+        _columns[index] = (generation, columns)
+        return columns
+
+def _condition(name, values):
+    if len(values) == 1:
+        return f'{name} = "{next(iter(values))}"'
+    return f'{name} in (%s)' % ", ".join(f'"{v}"' for v in sorted(values))
+
+def _matching_rows(text, conditions):
+    # rows of row group text whose cells meet every column position->values condition
+    rows = csv.reader(io.StringIO(text[_GROUP_HEADER.match(text).end():]))
+    next(rows, None)
+    return sum(all(pos < len(row) and normalize(row[pos]) in values for pos, values in conditions.items())
+               for row in rows)
+
+def lookup(index, question, limit=10):
+    """(facts, passages) for the table cells question names: a line per matched column value with its
+    row count (and per table naming several columns, the rows matching them all), and up to limit row
+    groups holding them, those matching the most values first (score 1.0 for the most)."""
+    columns = column_index(index)
+    matched = columns.matches(question)
+    if not matched:
+        return [], []
+    facts = []
+    hits = {}  # chunk idx->number of matched values it holds
+    conditions = {}  # doc id->column position->values named
+    for doc, pos, value in matched:
+        column = columns.tables[doc][pos]
+        facts.append(f'{doc}: {_condition(column.name, [value])} in {column.rows[value]:,} row(s)')
+        conditions.setdefault(doc, {}).setdefault(pos, set()).add(value)
+        for idx in column.values[value]:
+            hits[idx] = hits.get(idx, 0) + 1
+    # Rows matching every column named (values named in one column are
+    # alternatives) are counted exactly by reading the row groups that hold
+    # a match in each; values whose row groups were capped can't narrow
+    # that down, and if none can, the whole table is read
+    for doc, named in conditions.items():
+        if len(named) < 2:
+            continue
+        candidates = None
+        for pos, values in named.items():
+            groups = [columns.tables[doc][pos].values[value] for value in values]
+            if any(len(g) >= MAX_VALUE_GROUPS for g in groups):
+                continue
+            union = set().union(*groups)
+            candidates = union if candidates is None else candidates & union
+        if candidates is None:
+            candidates = columns.groups[doc]
+        if len(candidates) <= MAX_SCAN_GROUPS:
+            rows = sum(_matching_rows(index.chunks[idx], named) for idx in candidates)
+            every = " and ".join(_condition(columns.tables[doc][pos].name, values) for pos, values in named.items())
+            facts.append(f"{doc}: {every} in {rows:,} row(s)")
+    most = max(hits.values(), default=1)
+    passages = []
+    for idx in sorted(hits, key=lambda i: (-hits[i], i))[:limit]:
+        doc, start, end = index.passage(idx)
+        passages.append({"chunk": index.chunks[idx], "score": hits[idx] / most, "doc": doc,
+                         "start": start, "end": end})
+    return facts, passages
+
+def merge(looked_up, retrieved):
+    """lookup's passages and retrieval results, both best first, merged by reciprocal rank.
+
+    A passage in both rankings is listed once and scores the sum of its two
+    reciprocal ranks; scores are the fused ones.
+    """
+    fused, passages = {}, {}
+    for ranking in (looked_up, retrieved):
+        for rank, r in enumerate(ranking):
+            key = (r['doc'], r['start'])
+            fused[key] = fused.get(key, 0.0) + 1.0 / (_RRF_K + rank + 1)
+            passages.setdefault(key, r)
+    # sorted() is stable, so ties keep lookup hits first
+    return [dict(passages[key], score=fused[key]) for key in sorted(fused, key=lambda key: -fused[key])]
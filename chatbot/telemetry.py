@@ -0,0 +1,253 @@
+import bisect
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Timing spans for the stages of a chat turn (extraction, chunking, index
+# build, retrieval, translation, the model call, rendering). Every span
+# feeds a process-wide histogram per stage; spans inside turn() are also
+# collected for that turn and, with NEXUS_METRICS_SINK=emf, written to
+# stdout as CloudWatch Embedded Metric Format records when the turn ends. The histograms are
+# served as Prometheus text when NEXUS_METRICS_PORT is set, along with any
+# gauges other modules register (e.g. the model-call queue depth).
+#
+# NEXUS_PROFILE_DIR turns on cProfile: each turn's profile is dumped there
+# (open with python -m pstats or snakeviz).
+
+METRICS_SINK = os.environ.get("NEXUS_METRICS_SINK", "")
+METRICS_PORT = int(os.environ.get("NEXUS_METRICS_PORT", 0))
+PROFILE_DIR = os.environ.get("NEXUS_PROFILE_DIR", "")
+EMF_NAMESPACE = os.environ.get("NEXUS_EMF_NAMESPACE", "NexusAI")
+
+# Histogram bucket upper bounds, seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    """Cumulative-bucket latency histogram, Prometheus style."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (inf past the last bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+_lock = threading.Lock()
+_histograms = {}  # stage->Histogram
+_gauges = {}  # metric name->(help, kind, fn returning the current value)
+_local = threading.local()
+
+def record(stage, seconds):
+    """Records a duration measured elsewhere as a span of stage."""
+    with _lock:
+        hist = _histograms.get(stage)
+        if hist is None:
+            hist = _histograms[stage] = Histogram()
+        hist.observe(seconds)
+    spans = getattr(_local, "spans", None)
+    if spans is not None:
+        spans.append((stage, seconds))
+
+@contextmanager
+def span(stage):
+    """Times the enclosed block as one span of stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+def timed(stage, iterable):
+    """Yields from iterable, recording the time each item took to produce as a span."""
+    it = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(it)
+        except StopIteration:
+            return
+        record(stage, time.perf_counter() - start)
+        yield item
+
+class StageTimer:
+    """Splits time between nested stages, e.g. extraction pulled lazily from inside index building: each
+    moment counts toward the innermost stage running. record() adds each stage's total as one span."""
+
+    def __init__(self):
+        self.totals = {}
+        self._stack = []
+        self._mark = 0.0
+
+    def _switch(self, push=None):
+        now = time.perf_counter()
+        if self._stack:
+            stage = self._stack[-1]
+            self.totals[stage] = self.totals.get(stage, 0.0) + now - self._mark
+        if push is None:
+            self._stack.pop()
+        else:
+            self._stack.append(push)
+        self._mark = now
+
+    @contextmanager
+    def span(self, stage):
+        self._switch(stage)
+        try:
+            yield
+        finally:
+            self._switch()
+
+    def timed(self, stage, iterable):
+        """Yields from iterable, counting the time each item takes to produce toward stage."""
+        it = iter(iterable)
+        while True:
+            self._switch(stage)
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                self._switch()
+            yield item
+
+    def record(self):
+        for stage, seconds in self.totals.items():
+            record(stage, seconds)
+        self.totals = {}
+
+def gauge(name, help, fn, kind="gauge"):
+    """Serves fn() as the metric name ("gauge" or "counter") on /metrics, read at scrape time."""
+    with _lock:
+        _gauges[name] = (help, kind, fn)
+
+class Turn:
+    """Spans collected during one turn(), in the order they ended."""
+
+    def __init__(self):
+        self.spans = []
+        self.seconds = 0.0
+
+    def totals(self):
+        """Seconds per stage, summed over the turn's spans."""
+        out = {}
+        for stage, seconds in self.spans:
+            out[stage] = out.get(stage, 0.0) + seconds
+        return out
+
+@contextmanager
+def turn():
+    """Collects the spans of one chat turn, emits them to the sink and profiles the turn if enabled."""
+    current = Turn()
+    outer = getattr(_local, "spans", None)
+    _local.spans = current.spans
+    profiler = None
+    if PROFILE_DIR:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.seconds = time.perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profiler.dump_stats(os.path.join(PROFILE_DIR, f"turn-{time.time():.3f}.prof"))
+        _local.spans = outer
+        record("turn", current.seconds)
+        if METRICS_SINK == "emf":
+            emit_emf(current)
+
+def emit_emf(current, stream=None):
+    """Writes a turn as CloudWatch EMF records: Duration (ms) with a Stage dimension."""
+    stages = current.totals()
+    stages["turn"] = current.seconds
+    base = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": EMF_NAMESPACE,
+                "Dimensions": [["Stage"]],
+                "Metrics": [{"Name": "Duration", "Unit": "Milliseconds"}],
+            }],
+        },
+    }
+    # EMF takes one value per metric and dimension set per record, so each
+    # stage gets its own line
+    stream = stream or sys.stdout
+    for stage, seconds in stages.items():
+        line = dict(base, Stage=stage, Duration=1000 * seconds)
+        stream.write(json.dumps(line) + "\n")
+    stream.flush()
+
+def prometheus_text():
+    """The histograms in the Prometheus text exposition format."""
+    lines = [
+        "# HELP nexus_stage_seconds Time spent per chat-turn stage.",
+        "# TYPE nexus_stage_seconds histogram",
+    ]
+    with _lock:
+        for stage, hist in sorted(_histograms.items()):
+            cumulative = 0
+            for bound, n in zip(hist.buckets + (float("inf"),), hist.counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'nexus_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'nexus_stage_seconds_sum{{stage="{stage}"}} {hist.sum}')
+            lines.append(f'nexus_stage_seconds_count{{stage="{stage}"}} {hist.count}')
+        gauges = sorted(_gauges.items())
+    for name, (help, kind, fn) in gauges:
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name} {fn()}")
+    return "\n".join(lines) + "\n"
+
+def summary():
+    """stage->(count, mean seconds, approximate p99 seconds)."""
+    with _lock:
+        return {stage: (h.count, h.sum / h.count if h.count else 0.0, h.quantile(0.99))
+                for stage, h in _histograms.items()}
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serves /metrics on port from a daemon thread; returns the server, or None if port is 0."""
+    if not port:
+        return None
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,14 @@
+import os
+
+from extract_cache import ExtractCache, make_key
+
+def _on_disk(cache):
+    return sum(os.path.getsize(os.path.join(cache.path, name)) for name in os.listdir(cache.path))
+
+def test_rewriting_an_entry_counts_it_once(tmp_path):
+    cache = ExtractCache(str(tmp_path), max_bytes=10_000)
+    key = make_key(b"data", "text/plain", 1)
+    for n in range(5):
+        cache.put(key, ["page one", "page two %d" % n])
+    assert cache.bytes == _on_disk(cache)
+    assert cache.get(key) == ["page one", "page two 4"]
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from fake_gemini import FakeGemini, serve
+from gemini_client import GeminiClient, GeminiError, iter_sentences
+
+# GeminiClient against fake_gemini's local stand-in for the API.
+
+@pytest.fixture
+def fake():
+    return FakeGemini(latency=0.0)
+
+@pytest.fixture
+def client(fake):
+    server, url = serve(fake)
+    client = GeminiClient("test-key", base_url=url)
+    yield client
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+def test_generate_returns_text(client):
+    assert client.generate("hello") == "Echo: hello"
+
+def test_calls_reuse_one_connection(client):
+    for n in range(5):
+        client.generate(f"call {n}")
+    stats = client.stats()
+    assert stats["calls"] == 5
+    assert stats["connections"] == 1
+    assert stats["reused"] == 4
+
+def test_non_200_raises(client, fake):
+    fake.error_rate = 1.0
+    with pytest.raises(GeminiError) as raised:
+        client.generate("hello")
+    assert raised.value.status_code in (429, 503)
+
+def test_retry_after_is_parsed(client, fake):
+    fake.rps = 1
+    fake.retry_after = 7
+    client.generate("first")
+    with pytest.raises(GeminiError) as raised:
+        client.generate("second")
+    assert raised.value.status_code == 429
+    assert raised.value.retry_after == 7
+
+def test_agenerate_many_overlaps_calls(client, fake):
+    fake.latency = 0.3
+    start = time.perf_counter()
+    texts = asyncio.run(client.agenerate_many([f"prompt {n}" for n in range(4)]))
+    elapsed = time.perf_counter() - start
+    assert texts == [f"Echo: prompt {n}" for n in range(4)]
+    assert fake.stats()["max_concurrent"] == 4
+    # four 0.3s calls one after another would take 1.2s
+    assert elapsed < 0.9
+
+# --- streaming: a stub that writes raw SSE frames, split wherever the test says ---
+
+def _event(text):
+    return ('data: {"candidates": [{"content": {"parts": [{"text": %s}]}}]}\r\n\r\n'
+            % json.dumps(text, ensure_ascii=False)).encode("utf-8")
+
+class _SSEHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    writes = []  # raw byte strings, each sent as one chunk
+    status = 200
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.status != 200:
+            payload = b'{"error": {"code": 500}}'
+            self.send_response(self.status)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for data in self.writes:
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def sse():
+    handler = type("Handler", (_SSEHandler,), {"writes": []})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = GeminiClient("test-key", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1beta")
+    yield handler, client
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+def test_stream_parses_data_frames(sse):
+    handler, client = sse
+    handler.writes = [
+        b": keep-alive\r\n\r\n",
+        _event("Hello, "),
+        b'data: {"usageMetadata": {"promptTokenCount": 3}}\r\n\r\n',
+        _event("world."),
+    ]
+    assert list(client.stream_generate("hi")) == ["Hello, ", "world."]
+    assert client.stats()["calls"] == 1
+
+def test_stream_decodes_utf8_split_across_writes(sse):
+    handler, client = sse
+    frame = _event("नमस्ते दुनिया। 🙂")
+    cut = frame.index("न".encode("utf-8")) + 1  # inside the first character's bytes
+    handler.writes = [frame[:cut], frame[cut:], _event("ça va?")]
+    assert list(client.stream_generate("hi")) == ["नमस्ते दुनिया। 🙂", "ça va?"]
+
+def test_stream_raises_on_error_status(sse):
+    handler, client = sse
+    handler.status = 500
+    with pytest.raises(GeminiError) as raised:
+        list(client.stream_generate("hi"))
+    assert raised.value.status_code == 500
+
+def test_iter_sentences_regroups_pieces():
+    pieces = ["Hel", "lo there. How a", "re you? I am", " fine! Tail"]
+    sentences = list(iter_sentences(pieces))
+    assert sentences == ["Hello there. ", "How are you? ", "I am fine! ", "Tail"]
+    assert "".join(sentences) == "".join(pieces)
+
+def test_iter_sentences_splits_on_danda():
+    pieces = ["मैं ठीक हूँ। आप", " कैसे हैं?"]
+    assert list(iter_sentences(pieces)) == ["मैं ठीक हूँ। ", "आप कैसे हैं?"]
@@ -0,0 +1,51 @@
+import threading
+import time
+
+import pipeline
+import telemetry
+from index_cache import IndexCache
+from rag import RAGIndex
+
+FILES = [("notes.txt", b"The harbour opens at dawn. Boats leave at noon.\n\nNets are mended at dusk."),
+         ("prices.csv", b"item,price\nnet,12\nrope,3\n")]
+
+def test_same_text_is_indexed_once():
+    indexes = IndexCache()
+    first = pipeline.build_document(FILES, retrieval="lexical", indexes=indexes)
+    second = pipeline.build_document(FILES, retrieval="lexical", indexes=indexes)
+    assert second.index is first.index
+    assert second.digest == first.digest
+    assert indexes.stats()["builds"] == 1
+    assert indexes.stats()["hits"] == 1
+
+def test_spooled_build_matches_direct_build():
+    direct = pipeline.build_document(FILES, retrieval="lexical")
+    cached = pipeline.build_document(FILES, retrieval="lexical", indexes=IndexCache())
+    assert cached.digest == direct.digest
+    assert dict(cached.index.texts.items()) == dict(direct.index.texts.items())
+    assert list(cached.index.chunks) == list(direct.index.chunks)
+
+def test_concurrent_misses_build_once():
+    indexes = IndexCache()
+    calls = []
+    def build():
+        calls.append(1)
+        time.sleep(0.2)
+        index = RAGIndex()
+        index.add_text(["some text"], doc_id="a")
+        return index
+    found = []
+    threads = [threading.Thread(target=lambda: found.append(indexes.get_or_build("d", build))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert all(index is found[0] for index in found)
+    assert indexes.stats()["builds"] == 1
+
+def test_chunking_is_its_own_stage():
+    with telemetry.turn() as turn:
+        pipeline.build_document(FILES, retrieval="lexical", indexes=IndexCache())
+    stages = turn.totals()
+    assert {"extract", "chunk", "index_build"} <= set(stages)
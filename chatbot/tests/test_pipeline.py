@@ -0,0 +1,19 @@
+import pytest
+
+import pipeline
+from index_cache import IndexCache
+
+FILES = [("fruit.txt", b"apple banana"), ("more.txt", b"apple cherry"), ("other.txt", b"banana kiwi")]
+
+@pytest.mark.parametrize("indexes", [None, "cache"])
+def test_several_files_rank_like_the_reference(indexes):
+    document = pipeline.build_document(FILES, retrieval="lexical",
+                                       indexes=IndexCache() if indexes else None)
+    index = document.index
+    for q in ("banana", "apple banana", "kiwi cherry"):
+        got = index.query(q, top_k=3)
+        want = index._query_exhaustive(q, top_k=3)
+        assert [r["chunk"] for r in got] == [r["chunk"] for r in want]
+        assert [r["score"] for r in got] == pytest.approx([r["score"] for r in want], abs=1e-9)
+        assert all(r["score"] <= 1.0 + 1e-9 for r in got)
+    assert not index._stale_norms
@@ -0,0 +1,120 @@
+import random
+
+import pytest
+
+import rag
+from rag import RAGIndex
+
+# The inverted-index engines must rank exactly like the brute-force scorer
+# (RAGIndex._query_exhaustive) they replaced, on corpora with plenty of
+# shared terms and tied scores.
+
+WORDS = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta", "iota", "kappa",
+         "lambda", "mu", "nu", "xi", "omicron", "pi", "rho", "sigma", "tau", "upsilon"]
+
+ENGINES = ["python"] + (["sparse"] if rag._numeric() else [])
+
+def make_texts(rng, n):
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 12))) for _ in range(n)]
+
+def make_queries(rng, n):
+    return [" ".join(rng.choice(WORDS + ["unknown"]) for _ in range(rng.randint(1, 6))) for _ in range(n)]
+
+def assert_same_ranking(got, want):
+    assert len(got) == len(want)
+    assert [r["score"] for r in got] == pytest.approx([r["score"] for r in want], abs=1e-9)
+    # a chunk may only trade places with one that scores the same
+    for g, w in zip(got, want):
+        if g["chunk"] != w["chunk"]:
+            assert any(r["chunk"] == g["chunk"] and r["score"] == pytest.approx(g["score"], abs=1e-9)
+                       for r in want) or g["score"] == pytest.approx(want[-1]["score"], abs=1e-9)
+
+def build(texts, **kwargs):
+    index = RAGIndex(cache_size=0, **kwargs)
+    index.build_from_texts(texts)
+    return index
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("ranking", ["tfidf", "bm25"])
+def test_query_matches_exhaustive(seed, ranking):
+    rng = random.Random(seed)
+    index = build(make_texts(rng, 200), engine="python", ranking=ranking)
+    for q in make_queries(rng, 50):
+        for top_k in (1, 3, 10):
+            assert_same_ranking(index.query(q, top_k=top_k), index._query_exhaustive(q, top_k=top_k))
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("ranking", ["tfidf", "bm25"])
+def test_query_many_matches_exhaustive(seed, ranking):
+    rng = random.Random(seed)
+    index = build(make_texts(rng, 200), ranking=ranking)
+    queries = make_queries(rng, 40)
+    for q, got in zip(queries, index.query_many(queries, top_k=5)):
+        assert_same_ranking(got, index._query_exhaustive(q, top_k=5))
+
+@pytest.mark.skipif(not rag._numeric(), reason="the sparse engine needs numpy and scipy")
+@pytest.mark.parametrize("seed", range(3))
+def test_sparse_engine_matches_exhaustive(seed):
+    rng = random.Random(seed)
+    index = build(make_texts(rng, 200), engine="sparse")
+    queries = make_queries(rng, 40)
+    for q in queries:
+        assert_same_ranking(index.query(q, top_k=5), index._query_exhaustive(q, top_k=5))
+    for q, got in zip(queries, index.query_many(queries, top_k=5)):
+        assert_same_ranking(got, index._query_exhaustive(q, top_k=5))
+
+@pytest.mark.parametrize("ranking", ["tfidf", "bm25"])
+def test_ranking_after_incremental_updates(ranking):
+    # document norms are reweighted by compact(), after which the engines
+    # agree with the reference again
+    rng = random.Random(7)
+    index = RAGIndex(cache_size=0, engine="python", ranking=ranking)
+    for n in range(4):
+        index.add_documents(make_texts(rng, 30), doc_id=n)
+    index.remove_document(1)
+    index.compact()
+    for q in make_queries(rng, 30):
+        assert_same_ranking(index.query(q, top_k=5), index._query_exhaustive(q, top_k=5))
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("ranking", ["tfidf", "bm25"])
+def test_ranking_after_adds_without_compact(engine, ranking):
+    # each add_text changes the idf the earlier chunks' norms were computed
+    # with; queries must still score like the reference
+    rng = random.Random(11)
+    index = RAGIndex(cache_size=0, engine=engine, ranking=ranking)
+    queries = make_queries(rng, 20)
+    for n, text in enumerate(make_texts(rng, 40)):
+        index.add_text([text], doc_id=n)
+        if n % 8 == 7:
+            for q in queries:
+                assert_same_ranking(index.query(q, top_k=5), index._query_exhaustive(q, top_k=5))
+    index.remove_document(2)
+    for q, got in zip(queries, index.query_many(queries, top_k=5)):
+        assert_same_ranking(got, index._query_exhaustive(q, top_k=5))
+
+@pytest.mark.parametrize("ranking", ["tfidf", "bm25"])
+def test_top_k_zero(ranking):
+    index = build(["alpha beta", "beta gamma"], engine="python", ranking=ranking)
+    assert index.query("beta", top_k=0) == []
+
+def test_load_checks_checksum_only_when_asked(tmp_path):
+    path = str(tmp_path / "index.bin")
+    build(["alpha beta", "beta gamma"]).save(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(data.replace(b"gamma", b"gammo"))  # in the term and text sections
+    index = RAGIndex()
+    index.load(path)
+    assert index.chunks[1] == "beta gammo"
+    with pytest.raises(ValueError, match="checksum"):
+        RAGIndex().load(path, verify=True)
+
+def test_load_rejects_sections_past_the_end(tmp_path):
+    path = str(tmp_path / "index.bin")
+    build(["alpha beta", "beta gamma"]).save(path)
+    with open(path, "r+b") as f:
+        f.truncate(f.seek(0, 2) - 8)
+    with pytest.raises(ValueError, match="section"):
+        RAGIndex().load(path)
@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+
+from fake_gemini import FakeGemini, serve
+from gemini_client import GeminiClient
+from scheduler import QueueTimeout, Scheduler
+
+# Scheduler in front of a GeminiClient talking to fake_gemini, which adds
+# latency and answers over its rate limit with 429 + Retry-After.
+
+@pytest.fixture
+def fake():
+    return FakeGemini(latency=0.0)
+
+@pytest.fixture
+def client(fake):
+    server, url = serve(fake)
+    client = GeminiClient("test-key", base_url=url)
+    yield client
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+def _concurrently(fn, args):
+    results = [None] * len(args)
+    errors = []
+    def run(i):
+        try:
+            results[i] = fn(args[i])
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(args))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+def test_retry_waits_for_retry_after(client, fake):
+    fake.rps = 1
+    fake.retry_after = 1
+    scheduler = Scheduler(client, rate=0, retries=3, backoff=0.01)
+    scheduler.generate("first")
+    start = time.perf_counter()
+    assert scheduler.generate("second") == "Echo: second"
+    assert time.perf_counter() - start >= 1.0
+    assert fake.stats()["throttled"] >= 1
+    assert scheduler.throttled >= 1
+
+def test_identical_calls_share_one_upstream_call(client, fake):
+    fake.latency = 0.3
+    scheduler = Scheduler(client, rate=0)
+    results, errors = _concurrently(scheduler.generate, ["same prompt"] * 5)
+    assert not errors
+    assert results == ["Echo: same prompt"] * 5
+    assert fake.stats()["requests"] == 1
+    assert scheduler.coalesced == 4
+
+def test_concurrency_stays_under_cap(client, fake):
+    fake.latency = 0.2
+    scheduler = Scheduler(client, rate=0, concurrency=2)
+    results, errors = _concurrently(scheduler.generate, [f"prompt {n}" for n in range(6)])
+    assert not errors
+    assert results == [f"Echo: prompt {n}" for n in range(6)]
+    assert fake.stats()["max_concurrent"] <= 2
+    assert scheduler.in_flight == 0
+
+def test_queue_timeout(client, fake):
+    fake.latency = 0.5
+    scheduler = Scheduler(client, rate=0, concurrency=1, queue_timeout=0.1)
+    results, errors = _concurrently(scheduler.generate, ["slow", "queued"])
+    assert len(errors) == 1
+    assert isinstance(errors[0], QueueTimeout)
+    assert errors[0].status_code == 503
+    assert scheduler.rejected == 1
+    assert scheduler.queued == 0
+
+def test_slot_survives_interrupted_acquire(client):
+    scheduler = Scheduler(client, rate=0)
+    def interrupted(timeout=None):
+        raise KeyboardInterrupt
+    scheduler._slots.acquire = interrupted
+    with pytest.raises(KeyboardInterrupt):
+        scheduler.generate("hello")
+    assert scheduler.queued == 0
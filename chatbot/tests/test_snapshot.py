@@ -0,0 +1,24 @@
+import mimetypes
+import os
+
+import snapshot
+
+DOCS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "snapshot_docs")
+
+def _no_mime_database(monkeypatch):
+    # as on python:*-slim, which has no /etc/mime.types
+    empty = mimetypes.MimeTypes(filenames=())
+    empty.types_map = ({}, {})
+    empty.types_map_inv = ({}, {})
+    monkeypatch.setattr(mimetypes, "guess_type", empty.guess_type)
+
+def test_readme_is_not_collected_without_a_mime_database(monkeypatch):
+    _no_mime_database(monkeypatch)
+    assert [name for name, _ in snapshot.collect([DOCS])] == []
+
+def test_documents_are_collected_without_a_mime_database(monkeypatch, tmp_path):
+    _no_mime_database(monkeypatch)
+    (tmp_path / "notes.txt").write_text("some notes")
+    (tmp_path / "NOTES.md").write_text("# not a document")
+    (tmp_path / "data.csv").write_text("a,b\n1,2\n")
+    assert [name for name, _ in snapshot.collect([str(tmp_path)])] == ["data.csv", "notes.txt"]
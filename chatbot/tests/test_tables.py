@@ -0,0 +1,43 @@
+import pipeline
+import tables
+
+CSV = (b"order,store,country,status\n"
+       b"1,north,France,open\n"
+       b"2,south,Spain,closed\n"
+       b"3,north,France,pending\n"
+       b"4,east,Spain,open\n")
+
+def _document():
+    return pipeline.build_document([("orders.csv", CSV)], retrieval="lexical")
+
+def _values(question):
+    document = _document()
+    columns = tables.column_index(document.index)
+    return {(columns.tables[doc][pos].name, value) for doc, pos, value in columns.matches(question)}
+
+def test_distinctive_values_match_without_their_column():
+    assert _values("How many orders went to France?") == {("country", "france")}
+    assert ("status", "pending") in _values("Which orders are pending?")
+
+def test_common_words_need_their_column_named():
+    assert _values("Is the store open today?") == set()
+    assert ("status", "open") in _values("Which orders have status open?")
+
+def test_numbers_need_their_column_named():
+    assert _values("What are the 3 biggest stores?") == set()
+    assert ("order", "3") in _values("Show order 3")
+
+def test_lookup_counts_rows_matching_every_named_column():
+    facts, passages = tables.lookup(_document().index, "orders in France that are pending")
+    assert 'orders.csv: country = "france" and status = "pending" in 1 row(s)' in facts
+    assert passages
+
+def test_merge_interleaves_by_rank():
+    looked_up = [{"doc": "t.csv", "start": 0, "chunk": "a", "score": 1.0},
+                 {"doc": "t.csv", "start": 10, "chunk": "b", "score": 0.5}]
+    retrieved = [{"doc": "n.txt", "start": 0, "chunk": "c", "score": 9.0},
+                 {"doc": "t.csv", "start": 10, "chunk": "b", "score": 3.0}]
+    merged = tables.merge(looked_up, retrieved)
+    # "b" is in both rankings, so it outranks the single best hits of each
+    assert [r["chunk"] for r in merged] == ["b", "a", "c"]
+    assert merged[0]["score"] > merged[1]["score"]